@@ -0,0 +1,63 @@
+"""Compare JSON decoding backends for JSONMessage.get_json.
+
+Run with::
+
+    python benchmarks/json_decoding.py
+
+"""
+import json
+import timeit
+
+from missive import JSONMessage, json_decoding
+
+SMALL = json.dumps({"event_type": "user_created", "user_id": 1234}).encode("utf-8")
+LARGE = json.dumps(
+    {
+        "event_type": "order_placed",
+        "order_id": "0f8fad5b-d9cb-469f-a165-70867728950e",
+        "items": [
+            {"sku": f"SKU-{i}", "quantity": i, "price": i * 1.25, "tags": ["a", "b"]}
+            for i in range(50)
+        ],
+        "customer": {"name": "Jean Dupré", "email": "jean@example.com"},
+    }
+).encode("utf-8")
+
+NUMBER = 20_000
+
+
+def old_get_json(raw_data: bytes) -> None:
+    # What JSONMessage.get_json did before backends were pluggable
+    message = JSONMessage(raw_data)
+    json.loads(message.raw_data.decode("utf-8"))
+
+
+def report(label: str, seconds: float) -> None:
+    print(f"  {label:<24} {seconds / NUMBER * 1e6:8.2f} µs/message")
+
+
+def main() -> None:
+    for name, body in [("small", SMALL), ("large", LARGE)]:
+        print(f"{name} message ({len(body)} bytes)")
+        report(
+            "decode + json.loads",
+            min(timeit.repeat(lambda: old_get_json(body), number=NUMBER, repeat=5)),
+        )
+        for backend in json_decoding.BACKENDS:
+            try:
+                json_decoding.use_backend(backend)
+            except ImportError:
+                print(f"  {backend:<24} not installed")
+                continue
+            report(
+                f"get_json ({backend})",
+                min(
+                    timeit.repeat(
+                        lambda: JSONMessage(body).get_json(), number=NUMBER, repeat=5
+                    )
+                ),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Compare matching on a field of a large JSON message with and without a full
+parse.
+
+Run with::
+
+    python benchmarks/json_fields.py
+
+"""
+import json
+import timeit
+
+from missive import JSONMessage, JSONField
+
+NUMBER = 2_000
+
+PAYLOAD = {
+    "event_type": "order_placed",
+    "lines": [
+        {"sku": f"SKU-{i}", "description": "x" * 100, "attributes": {"i": i}}
+        for i in range(1_000)
+    ],
+}
+# About 160KB, with the routing field first as producers usually write it
+LARGE = json.dumps(PAYLOAD).encode("utf-8")
+
+extractor = JSONField("event_type")
+
+
+def full_parse() -> None:
+    JSONMessage(LARGE).get_json().get("event_type")
+
+
+def scan() -> None:
+    extractor(JSONMessage(LARGE))
+
+
+def main() -> None:
+    print(f"message of {len(LARGE)} bytes")
+    for label, fn in [("full parse", full_parse), ("JSONField scan", scan)]:
+        seconds = min(timeit.repeat(fn, number=NUMBER, repeat=5))
+        print(f"  {label:<16} {seconds / NUMBER * 1e6:10.2f} µs/message")
+
+
+if __name__ == "__main__":
+    main()
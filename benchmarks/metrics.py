@@ -0,0 +1,44 @@
+"""Measure the per-message overhead of recording metrics.
+
+Run with::
+
+    python benchmarks/metrics.py
+
+"""
+import timeit
+
+import missive
+from missive.metrics import PrometheusSink
+
+NUMBER = 100_000
+
+
+def make_client(with_metrics: bool) -> missive.TestAdapter[missive.RawMessage]:
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    @processor.handle_for(lambda m: True)
+    def handler(
+        message: missive.RawMessage, ctx: missive.HandlingContext[missive.RawMessage]
+    ) -> None:
+        ctx.ack()
+
+    if with_metrics:
+        processor.set_metrics(PrometheusSink())
+    return missive.TestAdapter(processor)
+
+
+def main() -> None:
+    message = missive.RawMessage(b"{}")
+    for label, with_metrics in [("without metrics", False), ("with metrics", True)]:
+        client = make_client(with_metrics)
+
+        def send() -> None:
+            client.send(message)
+            client.acked.clear()
+
+        seconds = min(timeit.repeat(send, number=NUMBER, repeat=5))
+        print(f"{label}: {seconds / NUMBER * 1e6:.2f}us per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Type,
+)
+from contextlib import AsyncExitStack
+import asyncio
+
+from ..missive import M
+from ..aio import AsyncAdapter, AsyncProcessingContext, AsyncProcessor
+from .wsgi import ACK_BODY, NACK_BODY
+
+Scope = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[MutableMapping[str, Any]]]
+Send = Callable[[MutableMapping[str, Any]], Awaitable[None]]
+Headers = List[Tuple[bytes, bytes]]
+
+
+def _headers(body: bytes, content_type: bytes = b"application/json") -> Headers:
+    headers = [(b"content-length", str(len(body)).encode("ascii"))]
+    if len(body) > 0:
+        headers.append((b"content-type", content_type))
+    return headers
+
+
+# Responses are built once rather than per request
+_ACK_START = {
+    "type": "http.response.start",
+    "status": 200,
+    "headers": _headers(ACK_BODY),
+}
+_NACK_START = {
+    "type": "http.response.start",
+    "status": 500,
+    "headers": _headers(NACK_BODY),
+}
+_ACK_BODY = {"type": "http.response.body", "body": ACK_BODY}
+_NACK_BODY = {"type": "http.response.body", "body": NACK_BODY}
+
+
+class ASGIAdapter(AsyncAdapter[M]):
+    """Adapts an :class:`missive.aio.AsyncProcessor` to the Asynchronous Server
+    Gateway Interface.
+
+    The adapter is itself the ASGI application - reference it in your ASGI
+    server config.  As with :class:`missive.adapters.wsgi.WSGIAdapter`, each
+    message is POSTed to ``/`` and the response says whether it was acked.
+
+    The processing context is entered when the server sends the lifespan
+    startup event (or on the first request if the server does not support
+    lifespan events) and exited on lifespan shutdown.
+
+    :param message_cls: The message class to pass to the processor
+    :param processor: The underlying processor
+
+    """
+
+    def __init__(self, message_cls: Type[M], processor: AsyncProcessor[M]) -> None:
+        self.processor = processor
+        self.message_cls = message_cls
+
+        self._results: Dict[bytes, bool] = {}
+        self._stack = AsyncExitStack()
+        self._ctx: Optional[AsyncProcessingContext[M]] = None
+        self._ctx_lock: Optional[asyncio.Lock] = None
+
+    async def ack(self, message: M) -> None:
+        self._results[message.message_id] = True
+
+    async def nack(self, message: M) -> None:
+        self._results[message.message_id] = False
+
+    async def startup(self) -> AsyncProcessingContext[M]:
+        """Enter the processing context, if that hasn't happened already."""
+        if self._ctx_lock is None:
+            self._ctx_lock = asyncio.Lock()
+        async with self._ctx_lock:
+            if self._ctx is None:
+                self._ctx = await self._stack.enter_async_context(
+                    self.processor.context(self.message_cls, self)
+                )
+        return self._ctx
+
+    async def shutdown(self) -> None:
+        """Exit the processing context."""
+        await self._stack.aclose()
+        self._ctx = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            event = await receive()
+            if event["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif event["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["path"] != "/":
+            await self._respond(send, 404, b"")
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, b"")
+            return
+
+        chunks = []
+        more_body = True
+        while more_body:
+            event = await receive()
+            chunks.append(event.get("body", b""))
+            more_body = event.get("more_body", False)
+
+        ctx = await self.startup()
+        message = self.message_cls(b"".join(chunks))
+        await ctx.handle(message)
+        if self._results.pop(message.message_id, False):
+            await send(_ACK_START)
+            await send(_ACK_BODY)
+        else:
+            await send(_NACK_START)
+            await send(_NACK_BODY)
+
+    async def _respond(self, send: Send, status: int, body: bytes) -> None:
+        await send(
+            {"type": "http.response.start", "status": status, "headers": _headers(body)}
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,81 @@
+from typing import Any, Type, Sequence, MutableMapping
+from logging import getLogger
+import asyncio
+
+import aio_pika
+
+import missive
+from missive.aio import AsyncAdapter, AsyncProcessor
+from missive.shutdown_handler import ShutdownHandler
+
+
+logger = getLogger(__name__)
+
+
+class AsyncRabbitMQAdapter(AsyncAdapter[missive.M]):
+    """Adapts an :class:`missive.aio.AsyncProcessor` to consume from RabbitMQ
+    queues using aio-pika.
+
+    The prefetch count is set to the processor's ``max_in_flight``.
+
+    """
+
+    def __init__(
+        self,
+        message_cls: Type[missive.M],
+        processor: AsyncProcessor[missive.M],
+        queues: Sequence[str],
+        url: str = "amqp://",
+        disable_shutdown_handler: bool = False,
+        poll_interval: float = 1,
+    ) -> None:
+        self.message_cls = message_cls
+        self.processor = processor
+        self.shutdown_handler = ShutdownHandler()
+        self.url = url
+        self.queues = queues
+        self.disable_shutdown_handler = disable_shutdown_handler
+        self.poll_interval = poll_interval
+
+        self._amqp_message_map: MutableMapping[bytes, Any] = {}
+
+    async def ack(self, message: missive.M) -> None:
+        amqp_message = self._amqp_message_map.pop(message.message_id)
+        await amqp_message.ack()
+        logger.debug("acked %s", message)
+
+    async def nack(self, message: missive.M) -> None:
+        amqp_message = self._amqp_message_map.pop(message.message_id)
+        await amqp_message.nack(requeue=True)
+        logger.warning("nacked %s", message)
+
+    async def run(self) -> None:
+        if not self.disable_shutdown_handler:
+            self.shutdown_handler.enable()
+
+        connection = await aio_pika.connect_robust(self.url)
+        async with connection:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=self.processor.max_in_flight)
+            logger.info("connected to %s", self.url)
+
+            async with self.processor.context(self.message_cls, self) as ctx:
+
+                async def callback(amqp_message: Any) -> None:
+                    message = self.message_cls(bytes(amqp_message.body))
+                    self._amqp_message_map[message.message_id] = amqp_message
+                    logger.debug("got message from rabbitmq: %s", amqp_message)
+                    await ctx.submit(message)
+
+                consumer_tags = []
+                for queue_name in self.queues:
+                    queue = await channel.declare_queue(queue_name, durable=True)
+                    consumer_tags.append((queue, await queue.consume(callback)))
+                logger.debug("consuming from %s", self.queues)
+
+                while not self.shutdown_handler.should_exit():
+                    await asyncio.sleep(self.poll_interval)
+
+                logger.info("cancelling consumers")
+                for queue, consumer_tag in consumer_tags:
+                    await queue.cancel(consumer_tag)
@@ -0,0 +1,63 @@
+from logging import getLogger
+from typing import Any, Type, Sequence
+
+import redis.asyncio
+
+import missive
+from missive.aio import AsyncAdapter, AsyncProcessor
+from missive.shutdown_handler import ShutdownHandler
+
+logger = getLogger(__name__)
+
+
+class AsyncRedisPubSubAdapter(AsyncAdapter[missive.M]):
+    """Adapts an :class:`missive.aio.AsyncProcessor` to Redis's Pub/Sub.
+
+    As with :class:`missive.adapters.redis.RedisPubSubAdapter`, acks and nacks
+    do nothing as Pub/Sub has no concept of them.
+
+    """
+
+    def __init__(
+        self,
+        message_cls: Type[missive.M],
+        processor: AsyncProcessor[missive.M],
+        channels: Sequence[str],
+        url: str = "redis://",
+        disable_shutdown_handler: bool = False,
+        poll_interval: float = 1,
+    ) -> None:
+        self.processor = processor
+        self.message_cls = message_cls
+        self.redis = redis.asyncio.Redis.from_url(url)
+        self.shutdown_handler = ShutdownHandler()
+        self.disable_shutdown_handler = disable_shutdown_handler
+        self.channels = channels
+        self.poll_interval = poll_interval
+
+    async def ack(self, message: missive.M) -> None:
+        pass
+
+    async def nack(self, message: missive.M) -> None:
+        pass
+
+    async def run(self) -> None:
+        if not self.disable_shutdown_handler:
+            self.shutdown_handler.enable()
+
+        # redis-py's asyncio client is only partly annotated
+        pubsub: Any = self.redis.pubsub(ignore_subscribe_messages=True)
+        async with self.processor.context(self.message_cls, self) as ctx:
+            await pubsub.subscribe(*self.channels)
+            logger.info("subscribed to channels: %s", self.channels)
+
+            while not self.shutdown_handler.should_exit():
+                redis_message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=self.poll_interval
+                )
+                if redis_message is not None:
+                    logger.debug("got redis message: %s", redis_message)
+                    await ctx.submit(self.message_cls(redis_message["data"]))
+
+            logger.info("shutting down")
+            await pubsub.aclose()
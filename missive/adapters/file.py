@@ -0,0 +1,199 @@
+from collections import deque
+from logging import getLogger
+from typing import Deque, Dict, Optional, Sequence, Set, Tuple, Type
+import json
+import mmap
+import os
+
+from missive import Adapter, Processor, ProcessingContext, M
+from missive.framing import DelimitedFraming, Framing, NewlineFraming
+from missive.shutdown_handler import ShutdownHandler
+
+logger = getLogger(__name__)
+
+# How many messages to handle between calls to ProcessingContext.tick
+_TICK_EVERY = 256
+
+
+class _Pending:
+    __slots__ = ("message", "path", "end", "settled", "nacked")
+
+    def __init__(self, message: object, path: str, end: int) -> None:
+        self.message = message
+        self.path = path
+        self.end = end
+        self.settled = False
+        self.nacked = False
+
+
+class FileAdapter(Adapter[M]):
+    """Reads messages from archive files, eg: for backfills.
+
+    Files are memory mapped and each message's ``raw_data`` is sliced
+    straight out of the map, so there is one copy per message and no read
+    buffering.
+
+    Progress can be saved to a checkpoint file, so that a later run resumes
+    after the last message that was acked.  The checkpoint only advances past
+    a message once it and every message before it have been acked.  There is
+    nowhere to return a nacked message to, so a nack instead stops the
+    checkpoint for that file from advancing any further, and a later run
+    starts again from the nacked message.
+
+    Work can be split between several processes (see
+    :class:`missive.supervisor.Supervisor`) with ``shard``.  For delimited
+    framings each file is split into byte ranges and every message belongs to
+    the range it starts in.  Other framings can't be split part way through,
+    so whole files are shared out instead.
+
+    :param paths: The files to read, in order
+    :param framing: How messages are delimited, by default one per line
+    :param checkpoint_path: Where to save progress, if anywhere.  Each shard
+        needs its own.
+    :param checkpoint_every: Save progress after this many messages
+    :param shard: (index, count) - the share of the work to do
+
+    """
+
+    def __init__(
+        self,
+        message_cls: Type[M],
+        processor: Processor[M],
+        paths: Sequence[str],
+        framing: Optional[Framing] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_every: int = 10_000,
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        self.message_cls = message_cls
+        self.processor = processor
+        self.paths = list(paths)
+        self.framing = framing if framing is not None else NewlineFraming()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError(f"invalid shard: {shard}")
+        self.shard = shard
+        self.shutdown_handler = ShutdownHandler()
+
+        #: Mapping of path to the offset of the first message not yet acked
+        self.offsets: Dict[str, int] = self._load_checkpoint()
+        self._pending: Deque[_Pending] = deque()
+        self._by_message: Dict[int, _Pending] = {}
+        # Files with a nacked message, whose offsets are not advanced again
+        self._nacked_paths: Set[str] = set()
+        self._acked_since_checkpoint = 0
+
+    def ack(self, message: M) -> None:
+        pending = self._by_message.pop(id(message))
+        pending.settled = True
+        self._advance()
+        self._acked_since_checkpoint += 1
+        if self._acked_since_checkpoint >= self.checkpoint_every:
+            self.save_checkpoint()
+
+    def nack(self, message: M) -> None:
+        pending = self._by_message.pop(id(message))
+        logger.warning("message nacked, not checkpointing %s past it", pending.path)
+        pending.settled = True
+        pending.nacked = True
+        self._advance()
+
+    def _advance(self) -> None:
+        """Move the offsets past every settled message at the head of the
+        queue, stopping for good at the first nacked message in each file."""
+        while len(self._pending) > 0 and self._pending[0].settled:
+            done = self._pending.popleft()
+            if done.nacked:
+                self._nacked_paths.add(done.path)
+            elif done.path not in self._nacked_paths:
+                self.offsets[done.path] = done.end
+
+    def _load_checkpoint(self) -> Dict[str, int]:
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as checkpoint_file:
+            offsets: Dict[str, int] = json.load(checkpoint_file)["offsets"]
+        logger.info("resuming from checkpoint %s", self.checkpoint_path)
+        return offsets
+
+    def save_checkpoint(self) -> None:
+        """Atomically write the offsets to the checkpoint file."""
+        self._acked_since_checkpoint = 0
+        if self.checkpoint_path is None:
+            return
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as temp_file:
+            json.dump({"version": 1, "offsets": self.offsets}, temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _ranges(self, size: int, file_index: int) -> Optional[Tuple[int, int]]:
+        """Return the byte range of a file this shard is responsible for."""
+        if self.shard is None:
+            return 0, size
+        index, count = self.shard
+        if isinstance(self.framing, DelimitedFraming):
+            return size * index // count, size * (index + 1) // count
+        return (0, size) if file_index % count == index else None
+
+    def run(self) -> None:
+        logger.info("started")
+        with self.processor.context(self.message_cls, self) as ctx:
+            for file_index, path in enumerate(self.paths):
+                if self.shutdown_handler.should_exit():
+                    break
+                self._run_file(ctx, file_index, path)
+        self.save_checkpoint()
+
+    def _run_file(self, ctx: ProcessingContext[M], file_index: int, path: str) -> None:
+        with open(path, "rb") as archive:
+            size = os.fstat(archive.fileno()).st_size
+            file_range = self._ranges(size, file_index)
+            if size == 0 or file_range is None:
+                return
+            mapped = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with mapped:
+            lower, upper = file_range
+            start = lower
+            if lower > 0:
+                # Skip the message that started in the previous range
+                assert isinstance(self.framing, DelimitedFraming)
+                index = mapped.find(self.framing.delimiter, lower - 1)
+                start = size if index == -1 else index + 1
+            start = max(start, self.offsets.get(path, 0))
+            logger.info("reading %s from offset %d to %d", path, start, upper)
+
+            handled = 0
+            next_start = start
+            for frame_start, frame_end, next_start in self.framing.scan(
+                mapped, start, size
+            ):
+                if frame_start >= upper or self.shutdown_handler.should_exit():
+                    return
+                if frame_end > frame_start:
+                    self._handle(ctx, mapped, path, frame_start, frame_end, next_start)
+                    handled += 1
+                    if handled % _TICK_EVERY == 0:
+                        ctx.tick()
+            final = self.framing.finish(mapped, next_start, size)
+            if final is not None and final[0] < upper and final[1] > final[0]:
+                self._handle(ctx, mapped, path, *final)
+
+    def _handle(
+        self,
+        ctx: ProcessingContext[M],
+        mapped: mmap.mmap,
+        path: str,
+        frame_start: int,
+        frame_end: int,
+        next_start: int,
+    ) -> None:
+        message = self.message_cls(mapped[frame_start:frame_end])
+        pending = _Pending(message, path, next_start)
+        self._pending.append(pending)
+        self._by_message[id(message)] = pending
+        ctx.handle(message)
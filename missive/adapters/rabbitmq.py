@@ -1,9 +1,29 @@
-from typing import Any, Type, Sequence, MutableMapping
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Type,
+    Sequence,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+    List,
+)
 from logging import getLogger
 from contextlib import ExitStack
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+import queue
 import socket
+import threading
+import time
+import weakref
 
+from amqp import spec
+from amqp.exceptions import MessageNacked
 import kombu
+import kombu.pools
 
 import missive
 from missive.shutdown_handler import ShutdownHandler
@@ -11,8 +31,129 @@ from missive.shutdown_handler import ShutdownHandler
 
 logger = getLogger(__name__)
 
+# How often the connection thread sends acks/nacks from worker threads
+_SETTLE_INTERVAL = 0.01
+
+
+class _CumulativeAcks:
+    """Batches up acks so that many messages are acked at once.
+
+    A ``basic.ack`` with ``multiple=True`` acks every outstanding delivery
+    tag up to and including the one given, so it can only be sent for the
+    highest tag below which everything has been settled.  Messages that
+    are settled out of order (eg: by worker threads) wait for the ones
+    before them, but for no longer than ``interval``: after that they are
+    acked one by one, so that a single slow message does not hold back the
+    acks for everything delivered after it.  Nacks are sent straight away
+    and so never need to be covered.
+
+    Only used from the connection thread.
+
+    """
+
+    def __init__(self, batch_size: int, interval: float) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        # Delivery tags in the order they were delivered, from the oldest
+        # that is not yet settled
+        self._delivered: Deque[int] = deque()
+        # Delivery tags that have been settled out of order, and whether
+        # they were acked (None once they have been acked one by one)
+        self._settled: Dict[int, Optional[bool]] = {}
+        self._ack_upto: Optional[int] = None
+        self._unsent = 0
+        self._unsent_since = 0.0
+        # How many of the out of order settlements are acks yet to be sent
+        self._held = 0
+        self._held_since = 0.0
+
+    def delivered(self, delivery_tag: int) -> None:
+        self._delivered.append(delivery_tag)
+
+    def settled(self, delivery_tag: int, acked: bool) -> None:
+        self._settled[delivery_tag] = acked
+        while len(self._delivered) > 0 and self._delivered[0] in self._settled:
+            tag = self._delivered.popleft()
+            if self._settled.pop(tag):
+                if tag != delivery_tag:
+                    self._held -= 1
+                if self._unsent == 0:
+                    self._unsent_since = time.monotonic()
+                self._ack_upto = tag
+                self._unsent += 1
+        if acked and delivery_tag in self._settled:
+            if self._held == 0:
+                self._held_since = time.monotonic()
+            self._held += 1
+
+    def time_remaining(self) -> Optional[float]:
+        """How long until the acks waiting to be sent are due."""
+        since = []
+        if self._unsent > 0:
+            since.append(self._unsent_since)
+        if self._held > 0:
+            since.append(self._held_since)
+        if len(since) == 0:
+            return None
+        return max(0.0, min(since) + self.interval - time.monotonic())
+
+    def due(self) -> bool:
+        remaining = self.time_remaining()
+        return remaining is not None and (
+            self._unsent >= self.batch_size or remaining == 0
+        )
+
+    def flush(self, channel: Any, out_of_order: bool = False) -> None:
+        """Send the acks that are waiting, including the out of order ones
+        if they are due (or if ``out_of_order``)."""
+        if self._ack_upto is not None:
+            channel.basic_ack(self._ack_upto, multiple=True)
+            logger.debug(
+                "acked %d messages up to delivery tag %d", self._unsent, self._ack_upto,
+            )
+            self._ack_upto = None
+            self._unsent = 0
+        if self._held > 0 and (
+            out_of_order or time.monotonic() - self._held_since >= self.interval
+        ):
+            for tag, acked in self._settled.items():
+                if acked:
+                    channel.basic_ack(tag, multiple=False)
+                    self._settled[tag] = None
+            logger.debug("acked %d messages out of order", self._held)
+            self._held = 0
+
 
 class RabbitMQAdapter(missive.Adapter[missive.M]):
+    """Adapts a Processor to consume from RabbitMQ queues.
+
+    :param worker_threads: If given, messages are handled concurrently by a
+        pool of this many threads rather than in the connection thread.  This
+        helps when handlers spend most of their time waiting on I/O.  The
+        prefetch count is set to the size of the pool.  Handlers, hooks and
+        the DLQ must be thread-safe when this is used
+        (:class:`missive.dlq.sqlite.SQLiteDLQ` is).
+    :param prefetch_count: How many unacked messages RabbitMQ will send
+        ahead.  By default 5, or the number of ``worker_threads``.
+    :param max_prefetch_count: If given, the prefetch count is adaptive: it
+        starts at ``prefetch_count`` and is doubled (up to this) while
+        handlers take less than ``target_latency`` seconds on average, and
+        halved again if they get slower.
+    :param ack_batch_size: Send a single cumulative ack (``multiple=True``)
+        for up to this many messages rather than one per message.  Acks are
+        also sent after ``ack_interval`` seconds, when no messages are
+        arriving and at shutdown.  If the broker is restarted before acks
+        are sent, those messages are redelivered.  Kept below the prefetch
+        count, as RabbitMQ sends nothing more once that many messages are
+        unacked.
+
+    Messages held back to be retried (see the ``retry`` argument of
+    :meth:`missive.Processor.handle_for`) are unacked too, so no more than
+    one fewer than the prefetch count are held at once.  Beyond that, they
+    are nacked and RabbitMQ redelivers them straight away.
+
+    """
+
     def __init__(
         self,
         message_cls: Type[missive.M],
@@ -21,6 +162,12 @@ class RabbitMQAdapter(missive.Adapter[missive.M]):
         url_or_conn: Any = "amqp://",
         disable_shutdown_handler: bool = False,
         drain_timeout: int = 1,
+        worker_threads: Optional[int] = None,
+        prefetch_count: Optional[int] = None,
+        max_prefetch_count: Optional[int] = None,
+        target_latency: float = 0.05,
+        ack_batch_size: int = 1,
+        ack_interval: float = 0.1,
     ) -> None:
         self.message_cls = message_cls
         self.processor = processor
@@ -29,22 +176,130 @@ class RabbitMQAdapter(missive.Adapter[missive.M]):
         self.queues = queues
         self.disable_shutdown_handler = disable_shutdown_handler
         self.drain_timeout = drain_timeout
+        self.worker_threads = worker_threads
 
-        # Considered a reasonable default
-        self.prefetch_count = 5
+        if prefetch_count is not None:
+            self.prefetch_count = prefetch_count
+        elif worker_threads is None:
+            # Considered a reasonable default
+            self.prefetch_count = 5
+        else:
+            # Enough to keep every worker busy, but no more
+            self.prefetch_count = worker_threads
+        if max_prefetch_count is not None and max_prefetch_count < self.prefetch_count:
+            raise ValueError("max_prefetch_count is less than prefetch_count")
+        self.max_prefetch_count = max_prefetch_count
+        self.target_latency = target_latency
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+
+        # Handler latency since the prefetch count was last adjusted
+        self._latency_lock = threading.Lock()
+        self._latency_total = 0.0
+        self._latency_count = 0
+
+        self._acks: Optional[_CumulativeAcks] = None
+        self._channel: Any = None
 
         self._kombu_message_map: MutableMapping[bytes, Any] = {}
+        self._kombu_message_map_lock = threading.Lock()
+
+        # kombu channels are not thread-safe so acks and nacks from worker
+        # threads are queued up for the connection thread to send
+        self._connection_thread: Optional[threading.Thread] = None
+        self._settlements: "queue.SimpleQueue[Tuple[Any, bool]]" = queue.SimpleQueue()
+        self._worker_exception: Optional[BaseException] = None
 
     def ack(self, message: missive.M) -> None:
-        kombu_message = self._kombu_message_map.pop(message.message_id)
-        kombu_message.ack()
+        self._settle(message, True)
         logger.debug("acked %s", message)
 
     def nack(self, message: missive.M) -> None:
-        kombu_message = self._kombu_message_map.pop(message.message_id)
-        kombu_message.nack()
+        self._settle(message, False)
         logger.warning("nacked %s", message)
 
+    def _settle(self, message: missive.M, ack: bool) -> None:
+        with self._kombu_message_map_lock:
+            kombu_message = self._kombu_message_map.pop(message.message_id)
+        if threading.current_thread() is self._connection_thread:
+            self._send_settlement(kombu_message, ack)
+        else:
+            self._settlements.put((kombu_message, ack))
+
+    def _send_settlement(self, kombu_message: Any, ack: bool) -> None:
+        acks = self._acks
+        if acks is None:
+            if ack:
+                kombu_message.ack()
+            else:
+                kombu_message.requeue()
+            return
+        if not ack:
+            kombu_message.requeue()
+        acks.settled(kombu_message.delivery_tag, ack)
+        if acks.due():
+            acks.flush(self._channel)
+
+    def _flush_acks(self) -> None:
+        if self._acks is not None:
+            self._acks.flush(self._channel, out_of_order=True)
+
+    def _handle_timed(
+        self, ctx: missive.ProcessingContext[missive.M], message: missive.M
+    ) -> None:
+        started = time.perf_counter()
+        try:
+            ctx.handle(message)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._latency_lock:
+                self._latency_total += elapsed
+                self._latency_count += 1
+
+    def _adapt_prefetch(
+        self, consumer: Any, prefetch_count: int, min_prefetch_count: int
+    ) -> int:
+        """Grow the prefetch count while handlers are fast and shrink it when
+        they are slow.  Returns the new prefetch count."""
+        assert self.max_prefetch_count is not None
+        with self._latency_lock:
+            if self._latency_count < prefetch_count:
+                # Wait for a window's worth of messages
+                return prefetch_count
+            average = self._latency_total / self._latency_count
+            self._latency_total = 0.0
+            self._latency_count = 0
+
+        if average < self.target_latency:
+            new_prefetch_count = min(prefetch_count * 2, self.max_prefetch_count)
+        elif average > self.target_latency * 2:
+            new_prefetch_count = max(prefetch_count // 2, min_prefetch_count)
+        else:
+            new_prefetch_count = prefetch_count
+        if new_prefetch_count != prefetch_count:
+            logger.info(
+                "average handler latency %.4fs, changing prefetch count to %d",
+                average,
+                new_prefetch_count,
+            )
+            consumer.qos(prefetch_count=new_prefetch_count)
+        return new_prefetch_count
+
+    def _send_queued_settlements(self) -> None:
+        while True:
+            try:
+                kombu_message, ack = self._settlements.get_nowait()
+            except queue.Empty:
+                return
+            self._send_settlement(kombu_message, ack)
+
+    def _on_worker_done(self, future: "Future[None]") -> None:
+        exception = future.exception()
+        if exception is not None and self._worker_exception is None:
+            logger.critical("worker thread crashed, shutting down")
+            self._worker_exception = exception
+            self.shutdown_handler.set_flag()
+
     def _get_conn(self, url_or_conn: Any, stack: ExitStack) -> Any:
         """Either we were passed a url or a real conn - either way get us a
         working conn."""
@@ -59,42 +314,250 @@ class RabbitMQAdapter(missive.Adapter[missive.M]):
         if not self.disable_shutdown_handler:
             self.shutdown_handler.enable()
 
+        self._connection_thread = threading.current_thread()
         with ExitStack() as stack:
             conn = self._get_conn(self.url_or_conn, stack)
             channel = stack.enter_context(conn.channel())
             logger.info("connected to %s", conn.as_uri())
+            self._channel = channel
+            self._acks = None
+            if self.ack_batch_size > 1:
+                if conn.transport.driver_type == "amqp":
+                    # Send any remaining acks before the channel is closed
+                    stack.callback(self._flush_acks)
+                    self._acks = _CumulativeAcks(
+                        min(self.ack_batch_size, self.prefetch_count),
+                        self.ack_interval,
+                    )
+                else:
+                    logger.warning(
+                        "%s transport does not support cumulative acks",
+                        conn.transport.driver_type,
+                    )
 
             queues = [kombu.Queue(queue, channel=channel) for queue in self.queues]
             consumer = kombu.Consumer(channel, queues)
 
-            # Limit the size of the prefetch queue
-            consumer.qos(prefetch_count=self.prefetch_count)
+            # Limit the size of the prefetch queue, but ensure that there is
+            # room for batch handlers to fill their batches
+            largest_batch = max(
+                (policy.max_size for policy in self.processor.batch_policies.values()),
+                default=0,
+            )
+            min_prefetch_count = max(self.prefetch_count, largest_batch)
+            prefetch_count = min_prefetch_count
+            consumer.qos(prefetch_count=prefetch_count)
+            adaptive = self.max_prefetch_count is not None
 
             ctx = stack.enter_context(self.processor.context(self.message_cls, self))
+            # Messages held back to be retried are unacked, so leave room for
+            # at least one more delivery
+            ctx.max_held_retries = min_prefetch_count - 1
+
+            executor: Optional[ThreadPoolExecutor] = None
+            if self.worker_threads is not None:
+                executor = ThreadPoolExecutor(
+                    max_workers=self.worker_threads, thread_name_prefix="missive-worker"
+                )
+                # Wait for in-flight messages to finish before the processing
+                # context is exited
+                stack.callback(self._send_queued_settlements)
+                stack.callback(executor.shutdown, wait=True)
+
+            def handle(message: missive.M) -> None:
+                if adaptive:
+                    self._handle_timed(ctx, message)
+                else:
+                    ctx.handle(message)
+
+            def dispatch(message: missive.M) -> None:
+                if executor is None:
+                    handle(message)
+                else:
+                    executor.submit(handle, message).add_done_callback(
+                        self._on_worker_done
+                    )
+
+            if executor is not None:
+                # Retries must not hold up the connection thread either
+                ctx.retry_dispatcher = dispatch
 
             def callback(body: Any, kombu_message: Any) -> None:
                 message = self.message_cls(bytes(kombu_message.body))
-                self._kombu_message_map[message.message_id] = kombu_message
+                with self._kombu_message_map_lock:
+                    self._kombu_message_map[message.message_id] = kombu_message
+                if self._acks is not None:
+                    self._acks.delivered(kombu_message.delivery_tag)
                 logger.debug(
                     "got message from rabbitmq: %s ", kombu_message,
                 )
-                ctx.handle(message)
+                dispatch(message)
 
             consumer.register_callback(callback)
 
             # Enter the consumer's context ONLY after registering callbacks
             stack.enter_context(consumer)
 
-            drain_timeout = self.drain_timeout
+            drain_timeout: float = self.drain_timeout
+            if executor is not None:
+                drain_timeout = min(drain_timeout, _SETTLE_INTERVAL)
             logger.debug("consuming from %s", queues)
             consumer.consume()
 
             while not self.shutdown_handler.should_exit():
+                timeout = drain_timeout
+                for deadline in (
+                    ctx.next_deadline(),
+                    None if self._acks is None else self._acks.time_remaining(),
+                ):
+                    if deadline is not None:
+                        timeout = min(deadline, timeout)
                 try:
-                    conn.drain_events(timeout=drain_timeout)
+                    conn.drain_events(timeout=timeout)
                 except socket.timeout:
-                    # when the timeout is hit this exception is raised
-                    pass
+                    # when the timeout is hit this exception is raised.  No
+                    # messages are arriving so don't hold back any acks.
+                    self._send_queued_settlements()
+                    self._flush_acks()
+                else:
+                    self._send_queued_settlements()
+                if self._acks is not None and self._acks.due():
+                    self._acks.flush(channel)
+                if adaptive:
+                    prefetch_count = self._adapt_prefetch(
+                        consumer, prefetch_count, min_prefetch_count
+                    )
+                ctx.tick()
 
             logger.info("cancelling consumer")
             consumer.cancel()
+
+        if self._worker_exception is not None:
+            raise self._worker_exception
+
+
+class _Confirms:
+    """Tracks the publisher confirms outstanding on a channel.
+
+    The broker numbers the messages published on a channel in confirm mode
+    from 1, and confirms them (possibly many at once) in any order.
+
+    """
+
+    def __init__(self) -> None:
+        self.published = 0
+        self.outstanding: Set[int] = set()
+        self.nacked = 0
+
+    def sent(self, count: int) -> None:
+        self.outstanding.update(range(self.published + 1, self.published + count + 1))
+        self.published += count
+
+    def acked(self, delivery_tag: int, multiple: bool) -> None:
+        if multiple:
+            self.outstanding = {tag for tag in self.outstanding if tag > delivery_tag}
+        else:
+            self.outstanding.discard(delivery_tag)
+
+    def nacked_by_broker(self, delivery_tag: int, multiple: bool) -> None:
+        before = len(self.outstanding)
+        self.acked(delivery_tag, multiple)
+        self.nacked += before - len(self.outstanding)
+
+    def wait(self, channel: Any) -> None:
+        """Wait until every message sent so far has been confirmed."""
+        while len(self.outstanding) > 0:
+            channel.wait([spec.Basic.Ack, spec.Basic.Nack])
+        if self.nacked > 0:
+            nacked, self.nacked = self.nacked, 0
+            raise MessageNacked(f"{nacked} messages were nacked by the broker")
+
+
+class RabbitMQPublisher(missive.Publisher):
+    """Publishes messages to RabbitMQ.
+
+    Messages are held back until :meth:`flush` (or until ``max_buffered`` of
+    them are waiting) and then sent together on a connection from kombu's
+    connection pool.  With ``confirm`` the channel is put into confirm mode
+    and :meth:`flush` waits for the broker to confirm the whole batch at
+    once, rather than message by message.  If the connection is lost the
+    batch is sent again, so messages may be duplicated.
+
+    :param exchange: The exchange to publish to, by default the default
+        exchange - so the destination is the name of a queue.
+    :param confirm: Whether to use publisher confirms (only on the ``amqp``
+        transport).
+    :param max_buffered: The most messages to hold back per thread.
+
+    """
+
+    def __init__(
+        self,
+        url_or_conn: Any = "amqp://",
+        exchange: str = "",
+        confirm: bool = True,
+        max_buffered: int = 100,
+    ) -> None:
+        if isinstance(url_or_conn, kombu.Connection):
+            self.connection = url_or_conn
+        else:
+            self.connection = kombu.Connection(url_or_conn)
+        self.exchange = exchange
+        self.confirm = confirm and self.connection.transport.driver_type == "amqp"
+        self.max_buffered = max_buffered
+        # Each thread only flushes (and so waits for) its own messages
+        self._local = threading.local()
+        # Confirm mode is per channel, and pooled channels are reused
+        self._confirms: "weakref.WeakKeyDictionary[Any, _Confirms]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._confirms_lock = threading.Lock()
+
+    def _buffer(self) -> List[Tuple[str, bytes]]:
+        try:
+            buffer: List[Tuple[str, bytes]] = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = []
+        return buffer
+
+    def publish(self, destination: str, body: bytes) -> None:
+        buffer = self._buffer()
+        buffer.append((destination, body))
+        if len(buffer) >= self.max_buffered:
+            self.flush()
+
+    def discard(self) -> None:
+        self._buffer().clear()
+
+    def _confirms_for(self, channel: Any) -> _Confirms:
+        with self._confirms_lock:
+            confirms = self._confirms.get(channel)
+            if confirms is None:
+                confirms = self._confirms[channel] = _Confirms()
+                channel.events["basic_ack"].add(confirms.acked)
+                channel.events["basic_nack"].add(confirms.nacked_by_broker)
+                channel.confirm_select()
+        return confirms
+
+    def _publish_batch(self, producer: Any, buffer: List[Tuple[str, bytes]]) -> None:
+        confirms = self._confirms_for(producer.channel) if self.confirm else None
+        for destination, body in buffer:
+            producer.publish(body, exchange=self.exchange, routing_key=destination)
+        if confirms is not None:
+            confirms.sent(len(buffer))
+            confirms.wait(producer.channel)
+
+    def flush(self) -> None:
+        buffer = self._buffer()
+        if len(buffer) == 0:
+            return
+        with kombu.pools.producers[self.connection].acquire(block=True) as producer:
+            # On a connection error, reconnect and send the whole batch again
+            publish_batch = producer.connection.ensure(producer, self._publish_batch)
+            publish_batch(producer, buffer)
+        logger.debug("published %d messages", len(buffer))
+        buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        kombu.pools.producers[self.connection].force_close_all()
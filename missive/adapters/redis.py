@@ -1,7 +1,9 @@
+import os
+import socket
 import time
 import threading
 from logging import getLogger
-from typing import Type, Sequence, Optional, Dict, Any
+from typing import Type, Sequence, Optional, Dict, Any, List, Tuple
 
 import missive
 from missive.shutdown_handler import ShutdownHandler
@@ -12,20 +14,42 @@ logger = getLogger(__name__)
 
 
 class RedisPubSubAdapter(missive.Adapter[missive.M]):
+    """Adapts a Processor to Redis's Pub/Sub.
+
+    Acks and nacks do nothing as Pub/Sub has no concept of them - see
+    :class:`RedisStreamsAdapter` if that is needed.
+
+    :param channels: Channels to subscribe to
+    :param patterns: Glob-style patterns of channels to subscribe to, eg:
+        ``orders.*``
+    :param poll_interval: The longest to wait for a message before checking
+        for shutdown, in seconds
+
+    """
+
     def __init__(
         self,
         message_cls: Type[missive.M],
         processor: missive.Processor[missive.M],
-        channels: Sequence[str],
+        channels: Sequence[str] = (),
+        patterns: Sequence[str] = (),
+        url_or_conn: Any = "redis://",
+        disable_shutdown_handler: bool = False,
+        poll_interval: float = 1.0,
     ) -> None:
+        if len(channels) == 0 and len(patterns) == 0:
+            raise ValueError("no channels or patterns to subscribe to")
         self.processor = processor
         self.message_cls = message_cls
-        self.redis = redis.Redis()
+        self.redis = _get_redis(url_or_conn)
         self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
         self.shutdown_handler = ShutdownHandler()
+        self.disable_shutdown_handler = disable_shutdown_handler
         self.channels = channels
-        self.thread: Optional[threading.Thread] = None
-        self.thread_sleep = 0.001
+        self.patterns = patterns
+        self.poll_interval = poll_interval
+        #: Set once subscribed
+        self.subscribed = threading.Event()
 
     def ack(self, message: missive.M) -> None:
         pass
@@ -34,18 +58,324 @@ class RedisPubSubAdapter(missive.Adapter[missive.M]):
         pass
 
     def run(self) -> None:
+        if not self.disable_shutdown_handler:
+            self.shutdown_handler.enable()
+
         with self.processor.context(self.message_cls, self) as ctx:
+            if len(self.channels) > 0:
+                self.pubsub.subscribe(*self.channels)
+                logger.info("subscribed to channels: %s", self.channels)
+            if len(self.patterns) > 0:
+                self.pubsub.psubscribe(*self.patterns)
+                logger.info("subscribed to patterns: %s", self.patterns)
+            self.subscribed.set()
+
+            try:
+                while not self.shutdown_handler.should_exit():
+                    deadline = ctx.next_deadline()
+                    # Blocks in select until a message arrives
+                    redis_message = self.pubsub.get_message(
+                        timeout=self.poll_interval
+                        if deadline is None
+                        else min(deadline, self.poll_interval)
+                    )
+                    if redis_message is not None:
+                        logger.debug("got redis message: %s", redis_message)
+                        ctx.handle(self.message_cls(redis_message["data"]))
+                    ctx.tick()
+            finally:
+                logger.info("shutting down")
+                self.pubsub.close()
+
+
+# A stream entry: (entry id, fields)
+_Entry = Tuple[bytes, Optional[Dict[bytes, bytes]]]
+
+
+def _get_redis(url_or_conn: Any) -> Any:
+    if isinstance(url_or_conn, redis.Redis):
+        return url_or_conn
+    return redis.Redis.from_url(url_or_conn)
+
+
+def _stream_entries(response: Any) -> List[Tuple[bytes, List[_Entry]]]:
+    """Normalise an XREADGROUP reply, which is a dict under RESP3 and a list
+    of pairs under RESP2."""
+    if not response:
+        return []
+    pairs = response.items() if isinstance(response, dict) else response
+    result = []
+    for stream, entries in pairs:
+        if len(entries) == 1 and isinstance(entries[0], list):
+            entries = entries[0]
+        result.append((stream, entries))
+    return result
+
+
+class RedisStreamsAdapter(missive.Adapter[missive.M]):
+    """Consumes from Redis Streams as part of a consumer group.
 
-            def handler(message: Dict[Any, Any]) -> None:
-                logger.debug("got redis message: %s", message)
-                ctx.handle(self.message_cls(message["data"]))
+    Unlike Pub/Sub, messages are kept until they are acked so nothing is lost
+    while consumers are down.  Entries are read ``count`` at a time with
+    ``XREADGROUP`` and acks are sent in batches with ``XACK``.
 
-            self.pubsub.subscribe(**{channel: handler for channel in self.channels})
-            logger.info("subscribed to channels: %s", self.channels)
+    Nacked entries are claimed back (``XCLAIM``) and handled again.  Entries
+    left pending for more than ``min_idle_time`` seconds by any consumer in
+    the group (eg: one that crashed) are taken over with ``XAUTOCLAIM``.
+    Requires Redis 6.2 or later.
 
-            self.thread = self.pubsub.run_in_thread(sleep_time=self.thread_sleep)  # type: ignore
-            logger.info("started thread: %s", self.thread)
+    The message id is the stream name and entry id, so it stays the same when
+    a message is redelivered.
+
+    :param streams: The streams to consume from
+    :param group: The consumer group, created (along with the streams) if it
+        doesn't exist.  A new group starts from the beginning of each stream.
+    :param consumer: This consumer's name, by default the hostname and pid
+    :param field: The field of each entry which holds the message body
+    :param count: The most entries to read at a time
+    :param block_timeout: The longest to wait for new entries, in seconds
+    :param ack_batch_size: Send acks once this many are waiting...
+    :param ack_interval: ...or once the oldest has waited this long
+    :param min_idle_time: How long an entry must be pending, in seconds,
+        before another consumer takes it over
+    :param claim_interval: How often to look for entries to take over
+
+    """
+
+    def __init__(
+        self,
+        message_cls: Type[missive.M],
+        processor: missive.Processor[missive.M],
+        streams: Sequence[str],
+        group: str,
+        consumer: Optional[str] = None,
+        url_or_conn: Any = "redis://",
+        field: bytes = b"data",
+        disable_shutdown_handler: bool = False,
+        count: int = 100,
+        block_timeout: float = 1.0,
+        ack_batch_size: int = 100,
+        ack_interval: float = 0.1,
+        min_idle_time: float = 60.0,
+        claim_interval: float = 10.0,
+    ) -> None:
+        self.message_cls = message_cls
+        self.processor = processor
+        self.streams = streams
+        self.group = group
+        if consumer is None:
+            consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.consumer = consumer
+        self.redis = _get_redis(url_or_conn)
+        self.field = field
+        self.shutdown_handler = ShutdownHandler()
+        self.disable_shutdown_handler = disable_shutdown_handler
+        self.count = count
+        self.block_timeout = block_timeout
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+        self.min_idle_time = min_idle_time
+        self.claim_interval = claim_interval
+
+        # Mapping of message id to (stream, entry id) for messages in flight
+        self._entries: Dict[bytes, Tuple[bytes, bytes]] = {}
+        # Entry ids waiting to be acked/claimed back, by stream
+        self._unsent_acks: Dict[bytes, List[bytes]] = {}
+        self._unsent_ack_count = 0
+        self._unsent_acks_since = 0.0
+        self._nacked: Dict[bytes, List[bytes]] = {}
+        # Where each stream's XAUTOCLAIM scan of the pending entries is up to
+        self._claim_cursors: Dict[bytes, bytes] = {}
+        self._last_claim = 0.0
+
+    def ack(self, message: missive.M) -> None:
+        stream, entry_id = self._entries.pop(message.message_id)
+        if self._unsent_ack_count == 0:
+            self._unsent_acks_since = time.monotonic()
+        self._unsent_acks.setdefault(stream, []).append(entry_id)
+        self._unsent_ack_count += 1
+        logger.debug("acked %s", message)
+
+    def nack(self, message: missive.M) -> None:
+        stream, entry_id = self._entries.pop(message.message_id)
+        self._nacked.setdefault(stream, []).append(entry_id)
+        logger.warning("nacked %s", message)
+
+    def flush_acks(self) -> None:
+        """Send any acks that are waiting."""
+        if self._unsent_ack_count == 0:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for stream, entry_ids in self._unsent_acks.items():
+            pipeline.xack(stream, self.group, *entry_ids)
+        pipeline.execute()
+        logger.debug("sent %d acks", self._unsent_ack_count)
+        self._unsent_acks = {}
+        self._unsent_ack_count = 0
+
+    def _acks_due(self) -> bool:
+        return self._unsent_ack_count >= self.ack_batch_size or (
+            self._unsent_ack_count > 0
+            and time.monotonic() - self._unsent_acks_since >= self.ack_interval
+        )
+
+    def _create_group(self, stream: str) -> None:
+        try:
+            self.redis.xgroup_create(stream, self.group, id="0", mkstream=True)
+            logger.info("created consumer group %s on %s", self.group, stream)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self, stream_ids: Dict[str, str], block: Optional[int]) -> Any:
+        return self.redis.xreadgroup(
+            self.group, self.consumer, stream_ids, count=self.count, block=block
+        )
+
+    def _claim_nacked(self) -> List[Tuple[bytes, List[_Entry]]]:
+        claimed = []
+        for stream, entry_ids in self._nacked.items():
+            entries = self.redis.xclaim(stream, self.group, self.consumer, 0, entry_ids)
+            claimed.append((stream, entries))
+        self._nacked = {}
+        return claimed
+
+    def _claim_idle(self) -> List[Tuple[bytes, List[_Entry]]]:
+        self._last_claim = time.monotonic()
+        claimed = []
+        for stream in self.streams:
+            key = stream.encode("utf-8")
+            response = self.redis.xautoclaim(
+                stream,
+                self.group,
+                self.consumer,
+                int(self.min_idle_time * 1000),
+                start_id=self._claim_cursors.get(key, b"0-0"),
+                count=self.count,
+            )
+            self._claim_cursors[key] = response[0]
+            if len(response[1]) > 0:
+                logger.info(
+                    "took over %d idle entries from %s", len(response[1]), stream
+                )
+                claimed.append((key, response[1]))
+        return claimed
+
+    def _handle_entries(
+        self,
+        ctx: missive.ProcessingContext[missive.M],
+        stream_entries: List[Tuple[bytes, List[_Entry]]],
+    ) -> int:
+        handled = 0
+        for stream, entries in stream_entries:
+            for entry_id, fields in entries:
+                body = None if fields is None else fields.get(self.field)
+                if body is None:
+                    # Deleted from the stream, or not one of ours
+                    logger.error(
+                        "no %r field in entry %s of %s, skipping",
+                        self.field,
+                        entry_id,
+                        stream,
+                    )
+                    self.redis.xack(stream, self.group, entry_id)
+                    continue
+                message_id = stream + b":" + entry_id
+                self._entries[message_id] = (stream, entry_id)
+                ctx.handle(self.message_cls(body, message_id=message_id))
+                handled += 1
+        return handled
+
+    def run(self) -> None:
+        if not self.disable_shutdown_handler:
+            self.shutdown_handler.enable()
+
+        for stream in self.streams:
+            self._create_group(stream)
+
+        with self.processor.context(self.message_cls, self) as ctx:
+            # Start with any entries left pending by an earlier run with the
+            # same consumer name.  Handled entries stay pending until their
+            # acks are sent, so read on from the last entry seen rather than
+            # from the start each time.
+            pending_from = {stream: "0" for stream in self.streams}
+            while len(pending_from) > 0 and not self.shutdown_handler.should_exit():
+                if self._acks_due():
+                    self.flush_acks()
+                pending = _stream_entries(self._read(pending_from, None))
+                # Streams with nothing more pending are done with
+                pending_from = {
+                    stream.decode("utf-8"): entries[-1][0].decode("utf-8")
+                    for stream, entries in pending
+                    if len(entries) > 0
+                }
+                self._handle_entries(ctx, pending)
+                ctx.tick()
+
+            logger.info("consuming from %s as %s", self.streams, self.consumer)
+            new_entries = {stream: ">" for stream in self.streams}
+            while not self.shutdown_handler.should_exit():
+                if self._acks_due():
+                    self.flush_acks()
+
+                stream_entries = self._claim_nacked() if self._nacked else []
+                if time.monotonic() - self._last_claim >= self.claim_interval:
+                    stream_entries.extend(self._claim_idle())
+                if len(stream_entries) == 0:
+                    stream_entries = _stream_entries(self._read(new_entries, None))
+                if len(stream_entries) == 0:
+                    # Nothing waiting, so don't hold back acks while blocking
+                    self.flush_acks()
+                    timeout = self.block_timeout
+                    deadline = ctx.next_deadline()
+                    if deadline is not None:
+                        timeout = min(timeout, deadline)
+                    # BLOCK 0 would wait forever
+                    block = max(1, int(timeout * 1000))
+                    stream_entries = _stream_entries(self._read(new_entries, block))
+                self._handle_entries(ctx, stream_entries)
+                ctx.tick()
 
-            self.shutdown_handler.wait_for_flag()
-            self.thread.stop()  # type: ignore
             logger.info("shutting down")
+        self.flush_acks()
+
+
+class RedisPublisher(missive.Publisher):
+    """Publishes messages to Redis Pub/Sub channels.
+
+    Messages are held back until :meth:`flush` (or until ``max_buffered`` of
+    them are waiting) and then sent in a single pipeline, using a connection
+    from the client's pool.
+
+    """
+
+    def __init__(self, url_or_conn: Any = "redis://", max_buffered: int = 100) -> None:
+        self.redis = _get_redis(url_or_conn)
+        self.max_buffered = max_buffered
+        # Pipelines aren't thread-safe, so each thread gets its own
+        self._local = threading.local()
+
+    def _pipeline(self) -> Any:
+        try:
+            return self._local.pipeline
+        except AttributeError:
+            pipeline = self._local.pipeline = self.redis.pipeline(transaction=False)
+            return pipeline
+
+    def publish(self, destination: str, body: bytes) -> None:
+        pipeline = self._pipeline()
+        pipeline.publish(destination, body)
+        if len(pipeline) >= self.max_buffered:
+            self.flush()
+
+    def flush(self) -> None:
+        pipeline = self._pipeline()
+        if len(pipeline) > 0:
+            pipeline.execute()
+
+    def discard(self) -> None:
+        self._pipeline().reset()
+
+    def close(self) -> None:
+        self.flush()
+        self.redis.close()
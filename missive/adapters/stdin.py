@@ -1,24 +1,42 @@
+import io
+import logging
 import os
-from select import select
+import selectors
 import sys
 from typing import Type, BinaryIO, Optional
 from logging import getLogger
-from io import BytesIO
 
 from missive import Adapter, Processor, M
+from missive.framing import Framing, NewlineFraming
 from missive.shutdown_handler import ShutdownHandler
 
 logger = getLogger(__name__)
 
-_CHUNK_SIZE = 4096
+# How often to wake up and check for shutdown, pending batches, etc
+_POLL_TIMEOUT = 1.0
 
 
 class StdinAdapter(Adapter[M]):
+    """Reads messages from stdin (or another file) until the end of the
+    stream.
+
+    Data is read into a reusable buffer and split into messages by
+    ``framing``, by default one message per line.  Blank lines are skipped.
+
+    :param filelike: The file to read from, by default stdin
+    :param framing: How messages are delimited, see :mod:`missive.framing`
+    :param buffer_size: How much to read at a time.  The buffer grows if a
+        message is larger than this.
+
+    """
+
     def __init__(
         self,
         message_cls: Type[M],
         processor: Processor[M],
         filelike: Optional[BinaryIO] = None,
+        framing: Optional[Framing] = None,
+        buffer_size: int = 1024 * 1024,
     ) -> None:
         self.processor = processor
         self.message_cls = message_cls
@@ -26,6 +44,8 @@ class StdinAdapter(Adapter[M]):
             self.filelike = sys.stdin.buffer
         else:
             self.filelike = filelike
+        self.framing = framing if framing is not None else NewlineFraming()
+        self.buffer_size = buffer_size
         self.shutdown_handler = ShutdownHandler()
 
     def ack(self, message: M) -> None:
@@ -34,15 +54,87 @@ class StdinAdapter(Adapter[M]):
     def nack(self, message: M) -> None:
         raise NotImplementedError("No nack for stdin")
 
+    def _fileno(self) -> Optional[int]:
+        try:
+            return self.filelike.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # eg: BytesIO
+            return None
+
     def run(self) -> None:
         logger.info("started")
-        with self.processor.context(self.message_cls, self) as ctx:
-            while not self.shutdown_handler.should_exit():
-                # FIXME: rewrite this to use selectors instead of low level select
-                select([self.filelike], [], [])
-                content: bytes = os.read(self.filelike.fileno(), _CHUNK_SIZE)
-                for line in content.splitlines():
-                    logger.info("got line")
-                    logger.info(line)
-                    data = line.rstrip()
-                    ctx.handle(self.message_cls(raw_data=data))
+        fileno = self._fileno()
+        selector: Optional[selectors.BaseSelector] = None
+        if fileno is not None:
+            selector = selectors.DefaultSelector()
+            try:
+                selector.register(fileno, selectors.EVENT_READ)
+            except PermissionError:
+                # Regular files are always readable and can't be registered
+                # with epoll
+                selector.close()
+                selector = None
+
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        # Unconsumed data is in buffer[start:end]
+        start = end = 0
+        framing = self.framing
+        message_cls = self.message_cls
+        try:
+            with self.processor.context(message_cls, self) as ctx:
+                while not self.shutdown_handler.should_exit():
+                    if selector is not None:
+                        deadline = ctx.next_deadline()
+                        ready = selector.select(
+                            _POLL_TIMEOUT
+                            if deadline is None
+                            else min(deadline, _POLL_TIMEOUT)
+                        )
+                        if len(ready) == 0:
+                            ctx.tick()
+                            continue
+
+                    if end == len(buffer):
+                        if start > 0:
+                            # Move the partial frame to the front
+                            buffer[: end - start] = bytes(view[start:end])
+                            end -= start
+                            start = 0
+                        else:
+                            # A frame bigger than the buffer
+                            view.release()
+                            buffer.extend(bytes(len(buffer)))
+                            view = memoryview(buffer)
+
+                    if fileno is not None:
+                        read = os.readv(fileno, [view[end:]])
+                    else:
+                        read = self.filelike.readinto(view[end:])  # type: ignore
+                    if read == 0:
+                        final = framing.finish(buffer, start, end)
+                        if final is not None and final[1] > final[0]:
+                            ctx.handle(message_cls(bytes(view[final[0] : final[1]])))
+                        logger.info("reached the end of the stream")
+                        break
+                    end += read
+
+                    debug = logger.isEnabledFor(logging.DEBUG)
+                    for frame_start, frame_end, next_start in framing.scan(
+                        buffer, start, end
+                    ):
+                        start = next_start
+                        if frame_end == frame_start:
+                            continue
+                        if debug:
+                            logger.debug(
+                                "got message of %d bytes", frame_end - frame_start
+                            )
+                        ctx.handle(message_cls(bytes(view[frame_start:frame_end])))
+                    if start == end:
+                        start = end = 0
+                    ctx.tick()
+        finally:
+            view.release()
+            if selector is not None:
+                selector.close()
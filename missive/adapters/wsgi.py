@@ -1,48 +1,360 @@
-from typing import Tuple, MutableSequence, Type
+from contextlib import ExitStack
+from logging import getLogger
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+from urllib.parse import parse_qs
+from wsgiref.simple_server import make_server
+import json
+import threading
+import time
 
-import flask
+from ..missive import Adapter, Processor, ProcessingContext, M
+from ..framing import Framing, LengthPrefixedFraming, NewlineFraming, read_frames
+from ..metrics import CONTENT_TYPE, PrometheusSink
 
-from ..missive import Adapter, Processor, M
+logger = getLogger(__name__)
+
+Environ = Dict[str, Any]
+StartResponse = Callable[..., Any]
+Headers = List[Tuple[str, str]]
+
+ACK_BODY = b'{"result": "ack"}'
+NACK_BODY = b'{"result": "nack"}'
+
+
+def _json_headers(body: bytes) -> Headers:
+    return [
+        ("Content-Type", "application/json"),
+        ("Content-Length", str(len(body))),
+    ]
+
+
+_ACK_HEADERS = _json_headers(ACK_BODY)
+_NACK_HEADERS = _json_headers(NACK_BODY)
+_EMPTY_HEADERS = [("Content-Length", "0")]
+
+_STATUSES = {
+    200: "200 OK",
+    400: "400 Bad Request",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    415: "415 Unsupported Media Type",
+    500: "500 Internal Server Error",
+}
+
+
+class _InputReader:
+    """Reads no more than ``CONTENT_LENGTH`` from ``wsgi.input``, which may
+    not signal the end of the body itself."""
+
+    def __init__(self, environ: Environ) -> None:
+        self.input = environ["wsgi.input"]
+        content_length = environ.get("CONTENT_LENGTH")
+        self.remaining: Optional[int]
+        if content_length:
+            self.remaining = int(content_length)
+        elif environ.get("wsgi.input_terminated"):
+            # eg: a chunked request, which the server ends for us
+            self.remaining = None
+        else:
+            self.remaining = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining is None:
+            data: bytes = self.input.read(size)
+            return data
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            return b""
+        data = self.input.read(size)
+        self.remaining -= len(data)
+        return data
 
 
 class WSGIAdapter(Adapter[M]):
     """Adapts a Processor to Python's Web Server Gateway Interface.
 
+    The adapter is itself a WSGI application (also available as ``app``) -
+    reference it in your WSGI server config.  No web framework is needed.
+
+    Each message is POSTed to ``/`` and the response says whether it was
+    acked.  The adapter is safe to use from threaded (eg: gunicorn's gthread)
+    and gevent workers.  Under gevent, handler timeouts only interrupt
+    handlers that are waiting (see :mod:`missive.watchdog`).
+
+    Many messages can be POSTed at once to ``/batch``, either as NDJSON
+    (``Content-Type: application/x-ndjson``) or each preceded by its length
+    as a 4 byte big-endian integer (``Content-Type:
+    application/octet-stream``).  The body is handled as it is read rather
+    than all at once, and a malformed frame ends the batch with a 400.  The
+    response is a summary, eg: ``{"acked": 9, "nacked": 1, "failed": [3]}``
+    with the (zero-based) indices of the messages that were nacked, or with
+    ``?results=full`` a list of results eg: ``{"results": ["ack", "nack"]}``.
+    Blank frames (eg: empty lines) are skipped, but still counted so that
+    indices are positions in the body, and are ``"skip"`` in full results.
+    The status is 200 if every message was acked and 500 otherwise.
+
+    Prometheus metrics are served at ``/metrics`` if the processor records
+    to a :class:`missive.metrics.PrometheusSink`.
+
+    The processing context is entered on the first request and lasts for the
+    life of the worker.  Call :meth:`close` when the worker exits (eg: from
+    gunicorn's ``worker_exit`` hook) to hand over partial batches and run the
+    ``after_processing`` hooks.
+
     :param message_cls: The message class to pass to the processor
     :param processor: The underlying processor
+    :param settle_timeout: How long a request waits, in seconds, for a
+        message that was passed to a batch handler or is waiting to be
+        retried to be acked or nacked
 
     """
 
-    def __init__(self, message_cls: Type[M], processor: Processor[M]) -> None:
+    def __init__(
+        self, message_cls: Type[M], processor: Processor[M], settle_timeout: float = 30
+    ) -> None:
         self.processor = processor
         self.message_cls = message_cls
+        self.settle_timeout = settle_timeout
 
         #: The wsgi application object - reference this in your WSGI server config
-        self.app: flask.Flask = flask.Flask("missive")
-
-        self.acked: MutableSequence[M] = []
-        self.nacked: MutableSequence[M] = []
-
-        @self.app.route("/", methods=["POST"])
-        def web_handler() -> Tuple[str, int]:
-            message = self.message_cls(flask.request.data)
-            with processor.context(self.message_cls, self) as ctx:
-                ctx.handle(message)
-                if message in self.acked:
-                    self.acked.remove(message)
-                    return flask.jsonify({"result": "ack"}), 200
-                else:
-                    self.nacked.remove(message)
-                    return flask.jsonify({"result": "nack"}), 500
+        self.app = self
+
+        # Whether each message was acked, by message id, until the request
+        # that sent it picks up the result
+        self._results: Dict[bytes, bool] = {}
+        # Requests waiting for a message to be settled by a batch handler
+        self._waiters: Dict[bytes, threading.Event] = {}
+        # Messages whose requests gave up waiting for them to be settled
+        self._abandoned: Set[bytes] = set()
+        self._lock = threading.Lock()
+
+        self._stack = ExitStack()
+        self._ctx: Optional[ProcessingContext[M]] = None
+        self._ctx_lock = threading.Lock()
+
+    def __call__(
+        self, environ: Environ, start_response: StartResponse
+    ) -> Iterable[bytes]:
+        path = environ.get("PATH_INFO") or "/"
+        method = environ["REQUEST_METHOD"]
+        if path == "/":
+            if method != "POST":
+                return self._respond(start_response, 405)
+            message = self.message_cls(_InputReader(environ).read())
+            if self.handle(message):
+                start_response("200 OK", _ACK_HEADERS)
+                return [ACK_BODY]
+            start_response("500 Internal Server Error", _NACK_HEADERS)
+            return [NACK_BODY]
+        elif path == "/batch":
+            if method != "POST":
+                return self._respond(start_response, 405)
+            return self._batch(environ, start_response)
+        elif path == "/metrics":
+            if method != "GET":
+                return self._respond(start_response, 405)
+            return self._metrics(start_response)
+        return self._respond(start_response, 404)
+
+    def _respond(
+        self,
+        start_response: StartResponse,
+        status: int,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> List[bytes]:
+        if body is None:
+            start_response(_STATUSES[status], _EMPTY_HEADERS)
+            return []
+        encoded = json.dumps(body).encode("utf-8")
+        start_response(_STATUSES[status], _json_headers(encoded))
+        return [encoded]
+
+    def _batch(self, environ: Environ, start_response: StartResponse) -> List[bytes]:
+        content_type = environ.get("CONTENT_TYPE", "").split(";")[0].strip()
+        framing = self.framing_for(content_type)
+        if framing is None:
+            return self._respond(
+                start_response, 415, {"error": "unsupported content type"}
+            )
+        errors = []
+
+        def frames() -> Iterator[bytes]:
+            try:
+                yield from read_frames(_InputReader(environ).read, framing)
+            except ValueError as e:
+                # eg: a truncated frame - the messages before it have already
+                # been handled
+                errors.append(str(e))
+
+        # Where each message is among the frames, blank ones included
+        positions: List[int] = []
+        frame_count = 0
+
+        def messages() -> Iterator[M]:
+            nonlocal frame_count
+            for frame in frames():
+                if len(frame) > 0:
+                    positions.append(frame_count)
+                    yield self.message_cls(frame)
+                frame_count += 1
+
+        results = self.handle_many(messages())
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        body: Dict[str, Any]
+        if query.get("results") == ["full"]:
+            full = ["skip"] * frame_count
+            for index, acked in zip(positions, results):
+                full[index] = "ack" if acked else "nack"
+            body = {"results": full}
+        else:
+            failed = [index for index, acked in zip(positions, results) if not acked]
+            body = {
+                "acked": len(results) - len(failed),
+                "nacked": len(failed),
+                "failed": failed,
+            }
+        if len(errors) > 0:
+            body["error"] = errors[0]
+            return self._respond(start_response, 400, body)
+        return self._respond(start_response, 200 if all(results) else 500, body)
+
+    def _metrics(self, start_response: StartResponse) -> List[bytes]:
+        metrics = self.processor.metrics
+        if metrics is None or not isinstance(metrics.sink, PrometheusSink):
+            return self._respond(start_response, 404)
+        body = metrics.sink.render().encode("utf-8")
+        start_response(
+            "200 OK",
+            [("Content-Type", CONTENT_TYPE), ("Content-Length", str(len(body)))],
+        )
+        return [body]
 
     def ack(self, message: M) -> None:
-        self.acked.append(message)
+        self._settle(message, True)
 
     def nack(self, message: M) -> None:
-        self.nacked.append(message)
+        self._settle(message, False)
+
+    def _settle(self, message: M, acked: bool) -> None:
+        message_id = message.message_id
+        with self._lock:
+            if message_id in self._abandoned:
+                self._abandoned.discard(message_id)
+                return
+            self._results[message_id] = acked
+            waiter = self._waiters.pop(message_id, None)
+        if waiter is not None:
+            waiter.set()
+
+    def context(self) -> ProcessingContext[M]:
+        """Return the processing context, entering it if this is the first
+        use."""
+        ctx = self._ctx
+        if ctx is None:
+            with self._ctx_lock:
+                if self._ctx is None:
+                    self._ctx = self._stack.enter_context(
+                        self.processor.context(self.message_cls, self)
+                    )
+                ctx = self._ctx
+        return ctx
+
+    def close(self) -> None:
+        """Exit the processing context."""
+        with self._ctx_lock:
+            self._stack.close()
+            self._ctx = None
+
+    def framing_for(self, mimetype: str) -> Optional[Framing]:
+        """Return the framing for a batch request's content type."""
+        if mimetype in ("application/x-ndjson", "application/jsonl"):
+            return NewlineFraming()
+        if mimetype == "application/octet-stream":
+            return LengthPrefixedFraming()
+        return None
+
+    def handle(self, message: M) -> bool:
+        """Handle a message and return whether it was acked."""
+        (acked,) = self.handle_many([message])
+        return acked
+
+    def handle_many(self, messages: Iterable[M]) -> List[bool]:
+        """Handle messages and return whether each was acked.  Messages are
+        handled as they are taken from the iterable."""
+        ctx = self.context()
+        message_ids = []
+        for message in messages:
+            ctx.handle(message)
+            ctx.tick()
+            message_ids.append(message.message_id)
+
+        results: List[Optional[bool]] = []
+        waiters: Dict[int, threading.Event] = {}
+        with self._lock:
+            for index, message_id in enumerate(message_ids):
+                acked = self._results.pop(message_id, None)
+                results.append(acked)
+                if acked is None and self._may_settle_later():
+                    waiters[index] = self._waiters[message_id] = threading.Event()
+        if len(waiters) > 0:
+            self._wait(ctx, waiters)
+        with self._lock:
+            for index in waiters:
+                self._waiters.pop(message_ids[index], None)
+                results[index] = self._results.pop(message_ids[index], None)
+            for message_id, acked in zip(message_ids, results):
+                if acked is None:
+                    # Nobody will pick up the result if it is settled later
+                    self._abandoned.add(message_id)
+
+        unsettled = sum(1 for acked in results if acked is None)
+        if unsettled > 0:
+            logger.warning("%d messages were neither acked nor nacked", unsettled)
+        return [acked is True for acked in results]
+
+    def _may_settle_later(self) -> bool:
+        processor = self.processor
+        return len(processor.batch_policies) > 0 or len(processor.retry_policies) > 0
+
+    def _wait(
+        self, ctx: ProcessingContext[M], waiters: Dict[int, threading.Event]
+    ) -> None:
+        """Wait for messages that are in batches or waiting to be retried to
+        be settled.  Requests drive the timers, as there is nothing else
+        to."""
+        give_up = time.monotonic() + self.settle_timeout
+        for waiter in waiters.values():
+            while True:
+                remaining = give_up - time.monotonic()
+                if remaining <= 0:
+                    return
+                deadline = ctx.next_deadline()
+                if waiter.wait(
+                    remaining if deadline is None else min(deadline, remaining)
+                ):
+                    break
+                ctx.tick()
 
-    def run(self) -> None:
-        """Run the wsgi application directly using Flask's builtin server.
+    def run(self, host: str = "127.0.0.1", port: int = 5000) -> None:
+        """Serve the application with the standard library's wsgiref server,
+        for development.  Use a real WSGI server in production.
 
         """
-        self.app.run()
+        with make_server(host, port, self) as server:
+            logger.info("serving on http://%s:%d/", host, port)
+            try:
+                server.serve_forever()
+            finally:
+                self.close()
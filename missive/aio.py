@@ -0,0 +1,335 @@
+"""Asyncio versions of :class:`missive.Processor` and friends.
+
+Handlers and hooks are ``async def`` functions and many messages can be
+handled concurrently, up to the processor's ``max_in_flight`` limit.  Matchers
+are still ordinary (synchronous) callables.
+
+"""
+import abc
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    List,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from .missive import DLQ, HandlerIndex, InvalidMessage, M, Matcher, logger
+from .state import State
+
+
+class AsyncAdapter(Generic[M], metaclass=abc.ABCMeta):
+    """Abstract base class representing the API between
+    :class:`AsyncProcessor` and asyncio adapters.
+
+    """
+
+    @abc.abstractmethod
+    async def ack(self, message: M) -> None:
+        """Mark a message as acknowledged."""
+
+    @abc.abstractmethod
+    async def nack(self, message: M) -> None:
+        """Mark a message as negatively acknowledged."""
+
+
+class AsyncTestAdapter(AsyncAdapter[M]):
+    # Tell pytest not to try and collect this class
+    __test__ = False
+
+    def __init__(self, processor: "AsyncProcessor[M]"):
+        self.processor = processor
+        self.acked: List[M] = []
+        self.nacked: List[M] = []
+        self.stack = AsyncExitStack()
+        self.ctx: Optional[AsyncProcessingContext[M]] = None
+
+    async def ack(self, message: M) -> None:
+        self.acked.append(message)
+
+    async def nack(self, message: M) -> None:
+        self.nacked.append(message)
+
+    async def send(self, message: M) -> None:
+        if self.ctx is None:
+            self.ctx = await self.stack.enter_async_context(
+                self.processor.context(type(message), self)
+            )
+        await self.ctx.handle(message)
+
+    async def close(self) -> None:
+        await self.stack.aclose()
+
+
+AsyncHandler = Callable[[M, "AsyncHandlingContext[M]"], Awaitable[None]]
+
+
+class AsyncProcessingContext(Generic[M]):
+    def __init__(
+        self,
+        message_cls: Type[M],
+        adapter: AsyncAdapter[M],
+        processor: "AsyncProcessor[M]",
+    ) -> None:
+        self.state = State()
+        self.message_cls = message_cls
+        self.adapter = adapter
+        self.processor = processor
+        self._in_flight = asyncio.Semaphore(processor.max_in_flight)
+        self._tasks: Set["asyncio.Future[None]"] = set()
+        self._crash: Optional[BaseException] = None
+
+    async def ack(self, message: M) -> None:
+        await self.adapter.ack(message)
+
+    async def nack(self, message: M) -> None:
+        await self.adapter.nack(message)
+
+    async def submit(self, message: M) -> None:
+        """Start handling a message in the background.
+
+        Waits first if ``max_in_flight`` messages are already being handled.
+        If an earlier message crashed the processor (ie: a handler raised and
+        there is no DLQ) that exception is raised here.
+
+        """
+        if self._crash is not None:
+            raise self._crash
+        await self._in_flight.acquire()
+        task = asyncio.ensure_future(self._handle_in_background(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_in_background(self, message: M) -> None:
+        try:
+            await self.handle(message)
+        except BaseException as e:
+            if self._crash is None:
+                self._crash = e
+        finally:
+            self._in_flight.release()
+
+    async def drain(self) -> None:
+        """Wait for all messages passed to :meth:`submit` to be handled."""
+        while len(self._tasks) > 0:
+            await asyncio.wait(list(self._tasks))
+        if self._crash is not None:
+            raise self._crash
+
+    async def handle(self, message: M) -> None:
+        try:
+            matching_handlers = self.processor.index.match(message)
+        except InvalidMessage as e:
+            reason = f"invalid message: {e}"
+            if self.processor.dlq is not None:
+                logger.warning(
+                    "%s is invalid (%s) - acking and putting message on dlq",
+                    message,
+                    e,
+                )
+                self.processor.dlq[message.message_id] = (message, reason)
+                await self.ack(message)
+                return
+            logger.critical(
+                "%s is invalid (%s) and no dlq configured - crashing", message, e
+            )
+            raise
+
+        if len(matching_handlers) == 0:
+            reason = "no matching handlers"
+            if self.processor.dlq is not None:
+                logger.warning(
+                    "no matching handlers for %s "
+                    "- acking and putting putting on dlq",
+                    message,
+                )
+                self.processor.dlq[message.message_id] = (message, reason)
+                await self.ack(message)
+                return
+            else:
+                logger.critical(
+                    "no matching handlers and no dlq configured, crashing on %s",
+                    message,
+                )
+                raise RuntimeError("no matching handler")
+
+        if len(matching_handlers) > 1:
+            reason = "multiple matching handlers"
+            if self.processor.dlq is not None:
+                logger.warning(
+                    "multiple matching handlers for %s "
+                    "- acking and putting message on dlq",
+                    message,
+                )
+                self.processor.dlq[message.message_id] = (message, reason)
+                await self.ack(message)
+                return
+            logger.critical(
+                "multiple matching handlers for %s and no dlq configured - crashing",
+                message,
+            )
+            raise RuntimeError("multiple matching handlers")
+
+        (sole_matching_handler,) = matching_handlers
+        logger.debug("calling %s", sole_matching_handler)
+        try:
+            async with self.handling_context(message) as handling_context:
+                await sole_matching_handler(message, handling_context)
+        except Exception as e:
+            if self.processor.dlq is not None:
+                reason = str(e)
+                self.processor.dlq[message.message_id] = (message, reason)
+                logger.warning(
+                    "handler %s raised exception %s on message %s "
+                    "- acking and putting message on dlq",
+                    sole_matching_handler,
+                    e,
+                    message,
+                    exc_info=True,
+                )
+                await self.ack(message)
+            else:
+                logger.critical(
+                    "handler %s raised exception %s on"
+                    " message %s and no dlq configured - crashing",
+                    sole_matching_handler,
+                    e,
+                    message,
+                    exc_info=True,
+                )
+                raise
+
+    @asynccontextmanager
+    async def handling_context(
+        self, message: M
+    ) -> AsyncIterator["AsyncHandlingContext[M]"]:
+        """Enter the handling context, including calling hooks."""
+        handling_context = AsyncHandlingContext(message, self)
+        for hook in self.processor.hooks.before_handling:
+            await hook(self, handling_context)
+        try:
+            yield handling_context
+        finally:
+            for hook in self.processor.hooks.after_handling:
+                await hook(self, handling_context)
+
+
+class AsyncHandlingContext(Generic[M]):
+    __slots__ = ("message", "processing_ctx", "_state")
+
+    def __init__(self, message: M, processing_ctx: AsyncProcessingContext[M]) -> None:
+        self.message = message
+        self.processing_ctx = processing_ctx
+        self._state: Optional[State] = None
+
+    @property
+    def state(self) -> State:
+        if self._state is None:
+            self._state = State()
+        return self._state
+
+    async def ack(self) -> None:
+        await self.processing_ctx.ack(self.message)
+
+    async def nack(self) -> None:
+        await self.processing_ctx.nack(self.message)
+
+
+AsyncProcessingHook = Callable[[AsyncProcessingContext[M]], Awaitable[None]]
+
+AsyncHandlingHook = Callable[
+    [AsyncProcessingContext[M], AsyncHandlingContext[M]], Awaitable[None]
+]
+
+
+@dataclass
+class AsyncProcessorHooks(Generic[M]):
+    before_processing: MutableSequence[AsyncProcessingHook[M]]
+    after_processing: MutableSequence[AsyncProcessingHook[M]]
+    before_handling: MutableSequence[AsyncHandlingHook[M]]
+    after_handling: MutableSequence[AsyncHandlingHook[M]]
+
+
+class AsyncProcessor(Generic[M]):
+    """A processor for asyncio handlers.
+
+    :param max_in_flight: The most messages that adapters will have handled
+        concurrently.
+
+    """
+
+    def __init__(self, max_in_flight: int = 100) -> None:
+        self.max_in_flight = max_in_flight
+        self.matchers: Set[Matcher[M]] = set()
+        self.handlers: MutableMapping[Tuple[Matcher[M], AsyncHandler[M]], None] = {}
+        self.dlq: Optional[DLQ[M]] = None
+        self.hooks: AsyncProcessorHooks[M] = AsyncProcessorHooks([], [], [], [])
+        self.index: HandlerIndex[M, AsyncHandler[M]] = HandlerIndex()
+
+    def handle_for(self, matcher: Matcher[M]) -> Callable[[AsyncHandler[M]], None]:
+        def wrapper(fn: AsyncHandler[M]) -> None:
+            if matcher in self.matchers:
+                (fn1,) = [h for (m, h) in self.handlers if m == matcher]
+                raise RuntimeError(
+                    f"two handlers with the same matcher: {fn} and {fn1} share {matcher}"
+                )
+            else:
+                self.matchers.add(matcher)
+            self.handlers[(matcher, fn)] = None
+            self.index.add(matcher, fn)
+
+        return wrapper
+
+    def before_processing(self, hook: AsyncProcessingHook[M]) -> None:
+        self.hooks.before_processing.append(hook)
+
+    def after_processing(self, hook: AsyncProcessingHook[M]) -> None:
+        self.hooks.after_processing.append(hook)
+
+    def before_handling(self, hook: AsyncHandlingHook[M]) -> None:
+        self.hooks.before_handling.append(hook)
+
+    def after_handling(self, hook: AsyncHandlingHook[M]) -> None:
+        self.hooks.after_handling.append(hook)
+
+    def set_dlq(self, dlq: DLQ[M]) -> None:
+        self.dlq = dlq
+
+    @asynccontextmanager
+    async def context(
+        self, message_cls: Type[M], adapter: AsyncAdapter[M]
+    ) -> AsyncIterator[AsyncProcessingContext[M]]:
+        """Enter the processing context, including calling hooks.
+
+        Messages that have been submitted are waited for before the context
+        is exited.
+
+        """
+        processing_ctx = AsyncProcessingContext(message_cls, adapter, self)
+        for hook in self.hooks.before_processing:
+            await hook(processing_ctx)
+        try:
+            yield processing_ctx
+            await processing_ctx.drain()
+        finally:
+            # Ensure that after hooks are still called in the case of an
+            # uncaught exception
+            for hook in self.hooks.after_processing:
+                await hook(processing_ctx)
+
+    @asynccontextmanager
+    async def test_client(self) -> AsyncIterator[AsyncTestAdapter[M]]:
+        adapter = AsyncTestAdapter(self)
+        try:
+            yield adapter
+        finally:
+            await adapter.close()
@@ -0,0 +1,297 @@
+"""Re-drive messages from a DLQ through a processor.
+
+Once the bug that caused messages to be dead-lettered has been fixed, they can
+be replayed through the (fixed) processor.  Messages that are acked are
+deleted from the DLQ.  Messages that fail again stay in the DLQ, with their
+reason updated if the processor's DLQ is the one being replayed.
+
+This is also available on the command line::
+
+    python -m missive.dlq.replay /var/dlq.db myapp.processors:processor --rate 100
+
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from importlib import import_module
+from itertools import chain
+from logging import getLogger
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import logging
+import queue
+import threading
+import time
+
+from ..missive import DLQ, Adapter, M, ProcessingContext, Processor
+
+logger = getLogger(__name__)
+
+
+@dataclass
+class ReplayResult:
+    #: Messages passed to the processor
+    replayed: int = 0
+    #: Messages acked (and so removed from the DLQ)
+    succeeded: int = 0
+    #: Messages that were put back on a DLQ
+    dead_lettered: int = 0
+    #: Messages that were nacked
+    nacked: int = 0
+
+
+class ReplayAdapter(Adapter[M]):
+    """Records the outcome of each replayed message.
+
+    During a replay the processor's DLQ is swapped for :attr:`dead_lettered`,
+    so that messages acked after being dead-lettered can be told apart from
+    successes.
+
+    """
+
+    def __init__(self, processor: Processor[M]) -> None:
+        self.processor = processor
+        self.dead_lettered: Dict[bytes, Tuple[M, str]] = {}
+        #: (message, succeeded, new reason) for each settled message
+        self.outcomes: "queue.SimpleQueue[Tuple[M, bool, Optional[str]]]" = (
+            queue.SimpleQueue()
+        )
+
+    def ack(self, message: M) -> None:
+        pair = self.dead_lettered.pop(message.message_id, None)
+        if pair is None:
+            self.outcomes.put((message, True, None))
+        else:
+            self.outcomes.put((message, False, pair[1]))
+
+    def nack(self, message: M) -> None:
+        self.outcomes.put((message, False, None))
+
+
+class RateLimiter:
+    """Spaces out calls to :meth:`wait` to at most ``rate`` per second."""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.interval = 0.0 if rate is None else 1.0 / rate
+        self.next_time = time.monotonic()
+
+    def wait(self) -> None:
+        if self.interval == 0.0:
+            return
+        now = time.monotonic()
+        if self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time, now) + self.interval
+
+
+def _source(
+    dlq: DLQ[M],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    reason: Optional[str],
+) -> Iterator[M]:
+    entries = getattr(dlq, "entries", None)
+    if entries is not None:
+        # Re-dead-lettered messages get a new insertion time, so stop at the
+        # current time to avoid seeing them again
+        if until is None:
+            until = datetime.utcnow().replace(tzinfo=timezone.utc)
+        for message, _, _ in entries(since=since, until=until, reason=reason):
+            yield message
+    else:
+        if since is not None or until is not None:
+            raise ValueError(f"{dlq!r} does not record insertion times")
+        for message_id in list(dlq):
+            message, message_reason = dlq[message_id]
+            if reason is None or reason == message_reason:
+                yield message
+
+
+def replay(
+    dlq: DLQ[M],
+    processor: Processor[M],
+    rate: Optional[float] = None,
+    parallelism: int = 1,
+    reason: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    delete_batch_size: int = 100,
+) -> ReplayResult:
+    """Replay messages from a DLQ through a processor.
+
+    :param dlq: The DLQ to replay from.  Time filters require a DLQ with an
+        ``entries`` method, such as :class:`missive.dlq.sqlite.SQLiteDLQ`.
+    :param processor: The processor to handle the messages.
+    :param rate: The most messages per second to replay.
+    :param parallelism: How many messages to handle at once, in threads.
+    :param reason: Only replay messages dead-lettered for this reason.
+    :param since: Only replay messages dead-lettered at or after this time.
+    :param until: Only replay messages dead-lettered before this time.
+    :param delete_batch_size: How many successfully replayed messages to
+        delete from the DLQ at a time.
+
+    """
+    messages = _source(dlq, since, until, reason)
+    first = next(messages, None)
+    result = ReplayResult()
+    if first is None:
+        return result
+
+    original_dlq = processor.dlq
+    adapter = ReplayAdapter(processor)
+    in_flight = threading.Semaphore(parallelism)
+    errors: List[BaseException] = []
+    to_delete: List[bytes] = []
+
+    def handle(ctx: ProcessingContext[M], message: M) -> None:
+        try:
+            ctx.handle(message)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            in_flight.release()
+
+    def settle(flush: bool) -> None:
+        # Only this thread touches the DLQs, as eg: SQLite connections can't
+        # be shared between threads
+        while True:
+            try:
+                message, succeeded, new_reason = adapter.outcomes.get_nowait()
+            except queue.Empty:
+                break
+            if succeeded:
+                result.succeeded += 1
+                to_delete.append(message.message_id)
+            elif new_reason is None:
+                result.nacked += 1
+            else:
+                result.dead_lettered += 1
+                if original_dlq is not None:
+                    original_dlq[message.message_id] = (message, new_reason)
+                    if original_dlq is not dlq:
+                        to_delete.append(message.message_id)
+        if len(to_delete) >= delete_batch_size or (flush and len(to_delete) > 0):
+            _delete(dlq, to_delete)
+            to_delete.clear()
+
+    # Handler exceptions are recorded rather than crashing, even if the
+    # processor has no DLQ, because the message is still safe in this one
+    processor.dlq = adapter.dead_lettered
+    limiter = RateLimiter(rate)
+    try:
+        with processor.context(type(first), adapter) as ctx:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+
+                def dispatch(message: M) -> None:
+                    in_flight.acquire()
+                    if len(errors) > 0:
+                        raise errors[0]
+                    if parallelism == 1:
+                        handle(ctx, message)
+                    else:
+                        executor.submit(handle, ctx, message)
+
+                # Retries go through the same pool and limit on messages in
+                # flight as everything else
+                ctx.retry_dispatcher = dispatch
+                for message in chain([first], messages):
+                    limiter.wait()
+                    result.replayed += 1
+                    dispatch(message)
+                    ctx.tick()
+                    settle(flush=False)
+                _drain(ctx, in_flight, parallelism, lambda: settle(flush=False))
+            if len(errors) > 0:
+                raise errors[0]
+    finally:
+        processor.dlq = original_dlq
+        settle(flush=True)
+
+    logger.info("replay finished: %s", result)
+    return result
+
+
+def _drain(
+    ctx: ProcessingContext[M],
+    in_flight: threading.Semaphore,
+    parallelism: int,
+    settle: Callable[[], None],
+) -> None:
+    """Wait for the messages in flight and any retries they schedule to be
+    settled."""
+    while True:
+        # Once nothing is in flight no more retries can be scheduled
+        for _ in range(parallelism):
+            in_flight.acquire()
+        for _ in range(parallelism):
+            in_flight.release()
+        # Nothing else is coming to fill the batches
+        ctx.flush_batches()
+        settle()
+        deadline = ctx.next_deadline()
+        if deadline is None:
+            return
+        time.sleep(deadline)
+        ctx.tick()
+
+
+def _delete(dlq: DLQ[M], message_ids: Sequence[bytes]) -> None:
+    delete_many = getattr(dlq, "delete_many", None)
+    if delete_many is not None:
+        delete_many(message_ids)
+    else:
+        for message_id in message_ids:
+            del dlq[message_id]
+    logger.info("deleted %d replayed messages from %r", len(message_ids), dlq)
+
+
+def _load_object(path: str) -> Any:
+    module_name, _, attribute = path.partition(":")
+    return getattr(import_module(module_name), attribute)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    from .sqlite import SQLiteDLQ
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dlq", help="path to an SQLite DLQ")
+    parser.add_argument("processor", help="the processor, as module:attribute")
+    parser.add_argument("--rate", type=float, help="max messages per second")
+    parser.add_argument("--parallelism", type=int, default=1)
+    parser.add_argument("--reason", help="only replay messages with this reason")
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, help="ISO 8601 timestamp"
+    )
+    parser.add_argument(
+        "--until", type=datetime.fromisoformat, help="ISO 8601 timestamp"
+    )
+    parser.add_argument("--delete-batch-size", type=int, default=100)
+    args = parser.parse_args(None if argv is None else list(argv))
+
+    logging.basicConfig(level=logging.INFO)
+    result = replay(
+        SQLiteDLQ(args.dlq),
+        _load_object(args.processor),
+        rate=args.rate,
+        parallelism=args.parallelism,
+        reason=args.reason,
+        since=args.since,
+        until=args.until,
+        delete_batch_size=args.delete_batch_size,
+    )
+    print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
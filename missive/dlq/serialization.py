@@ -0,0 +1,217 @@
+"""Serialization of messages for storage in a DLQ.
+
+Only what is needed to rebuild a message is stored: its class, its message
+id, its raw data and a small amount of metadata (such as the decoder of a
+:class:`missive.messages.DictMessage`).  Cached, decoded forms of the message
+are not stored.
+
+The binary format is::
+
+    magic (b"MSV") | version (1 byte) | flags (1 byte) | body
+
+where the body, which may be compressed, is::
+
+    class name length (2 bytes) | message id length (1 byte) |
+    metadata length (4 bytes) | class name | message id | metadata (JSON) |
+    raw data
+
+"""
+from importlib import import_module
+from typing import Any, Callable, Dict, Mapping, Optional
+import abc
+import json
+import pickle
+import struct
+import zlib
+
+from ..missive import Message
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MAGIC = b"MSV"
+VERSION = 1
+
+#: Flag values for the codec used on the body
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_MASK = 0b11
+
+CODECS = {None: CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+BODY_HEADER = struct.Struct("!HBI")
+
+# Every pickle protocol from 2 onwards starts with the PROTO opcode
+PICKLE_PROTO = b"\x80"
+
+#: Called with the raw data and metadata of a stored message to rebuild it
+MessageFactory = Callable[[bytes, Dict[str, Any]], Message]
+
+
+class Serializer(metaclass=abc.ABCMeta):
+    """Abstract base class for DLQ serializers."""
+
+    @abc.abstractmethod
+    def dumps(self, message: Message) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def loads(self, data: bytes) -> Message:
+        ...
+
+
+class PickleSerializer(Serializer):
+    """Pickles whole message objects, as DLQs did previously."""
+
+    def dumps(self, message: Message) -> bytes:
+        return pickle.dumps(message)
+
+    def loads(self, data: bytes) -> Message:
+        message: Message = pickle.loads(data)
+        return message
+
+
+class BinarySerializer(Serializer):
+    """The default serializer, using the binary format described above.
+
+    Data written by :class:`PickleSerializer` can still be loaded.
+
+    :param compression: ``None``, ``"zlib"`` or ``"zstd"`` (which requires
+        the zstandard package)
+    :param level: The compression level
+    :param min_compress_size: Messages with less raw data than this are
+        stored uncompressed
+    :param factories: Mapping of class name (``"module:qualname"``) to a
+        function which rebuilds messages of that class.  This can be used for
+        message classes which take other arguments or which have been moved
+        since they were stored.
+
+    """
+
+    def __init__(
+        self,
+        compression: Optional[str] = None,
+        level: int = 3,
+        min_compress_size: int = 256,
+        factories: Optional[Mapping[str, MessageFactory]] = None,
+    ) -> None:
+        if compression not in CODECS:
+            raise ValueError(f"unknown compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.codec = CODECS[compression]
+        self.level = level
+        self.min_compress_size = min_compress_size
+        self.factories: Dict[str, MessageFactory] = dict(factories or {})
+
+    def dumps(self, message: Message) -> bytes:
+        class_name = _qualified_name(type(message)).encode("utf-8")
+        metadata = _metadata(message)
+        metadata_bytes = (
+            b"" if len(metadata) == 0 else json.dumps(metadata).encode("utf-8")
+        )
+        message_id = message.message_id
+        body = b"".join(
+            [
+                BODY_HEADER.pack(len(class_name), len(message_id), len(metadata_bytes)),
+                class_name,
+                message_id,
+                metadata_bytes,
+                message.raw_data,
+            ]
+        )
+        codec = self.codec
+        if len(message.raw_data) < self.min_compress_size:
+            codec = CODEC_NONE
+        return MAGIC + bytes([VERSION, codec]) + _compress(codec, body, self.level)
+
+    def loads(self, data: bytes) -> Message:
+        if data[:1] == PICKLE_PROTO:
+            return PickleSerializer().loads(data)
+        if data[:3] != MAGIC:
+            raise ValueError("not a serialized message")
+        version, flags = data[3], data[4]
+        if version != VERSION:
+            raise ValueError(f"unsupported serialization version: {version}")
+        body = _decompress(flags & CODEC_MASK, memoryview(data)[5:])
+
+        class_length, id_length, metadata_length = BODY_HEADER.unpack_from(body)
+        offset = BODY_HEADER.size
+        class_name = bytes(body[offset : offset + class_length]).decode("utf-8")
+        offset += class_length
+        message_id = bytes(body[offset : offset + id_length])
+        offset += id_length
+        metadata: Dict[str, Any] = (
+            {}
+            if metadata_length == 0
+            else json.loads(bytes(body[offset : offset + metadata_length]))
+        )
+        offset += metadata_length
+        raw_data = bytes(body[offset:])
+
+        factory = self.factories.get(class_name)
+        if factory is not None:
+            message = factory(raw_data, metadata)
+        else:
+            message = _default_factory(class_name, raw_data, metadata)
+        message.message_id = message_id
+        return message
+
+
+def _qualified_name(obj: Any) -> str:
+    return f"{obj.__module__}:{obj.__qualname__}"
+
+
+def _load_object(qualified_name: str) -> Any:
+    module_name, _, qualname = qualified_name.partition(":")
+    obj = import_module(module_name)
+    for attribute in qualname.split("."):
+        obj = getattr(obj, attribute)
+    return obj
+
+
+def _metadata(message: Message) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {}
+    decoder = getattr(message, "decoder", None)
+    if decoder is not None:
+        # Only functions that can be imported again by name can be stored
+        name = _qualified_name(decoder)
+        if "<" in name:
+            raise ValueError(f"cannot serialize decoder {decoder!r}")
+        metadata["decoder"] = name
+    return metadata
+
+
+def _default_factory(
+    class_name: str, raw_data: bytes, metadata: Dict[str, Any]
+) -> Message:
+    message_cls = _load_object(class_name)
+    kwargs = {}
+    if "decoder" in metadata:
+        kwargs["decoder"] = _load_object(metadata["decoder"])
+    message: Message = message_cls(raw_data, **kwargs)
+    return message
+
+
+def _compress(codec: int, body: bytes, level: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.compress(body, level)
+    elif codec == CODEC_ZSTD:
+        rv: bytes = zstandard.ZstdCompressor(level=level).compress(body)
+        return rv
+    return body
+
+
+def _decompress(codec: int, body: memoryview) -> memoryview:
+    if codec == CODEC_NONE:
+        return body
+    elif codec == CODEC_ZLIB:
+        return memoryview(zlib.decompress(body))
+    elif codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compressed message but zstandard is not installed")
+        return memoryview(zstandard.ZstdDecompressor().decompress(body))
+    raise ValueError(f"unknown codec: {codec}")
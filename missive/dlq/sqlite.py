@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
-from typing import Tuple, Iterator
+from typing import Tuple, Iterator, Iterable, List, Optional, Any, cast
 import sqlite3
-import pickle
+import threading
+import time
 
-from ..missive import DLQ, Message, M
+from ..missive import DLQ, Message, M, Processor, ProcessingContext
+from .serialization import BinarySerializer, Serializer
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS messages (
@@ -13,8 +15,13 @@ CREATE TABLE IF NOT EXISTS messages (
     inserted TEXT
 );"""
 
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS messages_inserted ON messages (inserted);",
+    "CREATE INDEX IF NOT EXISTS messages_reason ON messages (reason, inserted);",
+]
+
 INSERT = """
-INSERT INTO messages
+INSERT OR REPLACE INTO messages
 (message_id, message_bytes, reason, inserted)
 VALUES (?, ?, ?, ?);
 """
@@ -26,53 +33,294 @@ DELETE FROM messages WHERE message_id = ?;
 OLDEST = """
 SELECT message_bytes, reason, inserted
 FROM messages
-ORDER BY inserted DESC
+ORDER BY inserted ASC
 LIMIT 1;
 """
 
+GET = """
+SELECT message_bytes, reason
+FROM messages
+WHERE message_id = ?;
+"""
+
+CONTAINS = """
+SELECT 1 FROM messages WHERE message_id = ?;
+"""
+
+# Keyset pagination, so that no cursor is held open between pages
+IDS_PAGE = """
+SELECT rowid, message_id
+FROM messages
+WHERE rowid > ?
+ORDER BY rowid
+LIMIT ?;
+"""
+
+ENTRIES_PAGE = """
+SELECT rowid, message_bytes, reason, inserted
+FROM messages
+WHERE (inserted, rowid) > (?, ?)
+AND inserted < ?
+{reason_clause}
+ORDER BY inserted, rowid
+LIMIT ?;
+"""
+
+# Sorts before and after any stored timestamp
+MIN_INSERTED = ""
+MAX_INSERTED = "9999"
+
 LENGTH = """
 SELECT count(*) from messages
 """
 
 
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+
+SYNCHRONOUS_SETTINGS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
 class SQLiteDLQ(DLQ[M]):
-    def __init__(self, connection_str: str):
-        # FIXME: Should have an option to emit whatever pragma is required for
-        # WAL mode
+    """A DLQ kept in an SQLite database.
+
+    By default each message is committed as soon as it is added.  When many
+    messages are being dead-lettered at once the per-commit fsync becomes
+    expensive, so messages can instead be buffered and written in batches of
+    ``batch_size``.  Buffered messages are also written when the oldest of
+    them has waited for ``flush_interval`` seconds (by a timer thread, so
+    even if no more messages arrive), whenever the DLQ is read from and when
+    processing stops (see :meth:`attach`).
+
+    Messages are acked as soon as they are added, so buffering trades
+    durability for throughput: if the process dies, the messages still in the
+    buffer are lost.  That is at most ``batch_size - 1`` messages, and with
+    ``flush_interval`` no more than that many seconds' worth.
+
+    The DLQ can be used from several threads at once (eg: by
+    ``RabbitMQAdapter``'s worker threads or a threaded WSGI server): the
+    connection and the buffer are shared behind a lock.
+
+    :param connection_str: Passed to :func:`sqlite3.connect`
+    :param batch_size: How many messages to write per transaction
+    :param flush_interval: The longest a buffered message will wait to be
+        written
+    :param journal_mode: eg: "WAL" - emitted as ``PRAGMA journal_mode``
+    :param synchronous: eg: "NORMAL" - emitted as ``PRAGMA synchronous``
+    :param serializer: How messages are stored, by default a
+        :class:`missive.dlq.serialization.BinarySerializer`.  Messages stored
+        as pickles by earlier versions can still be read.
+
+    """
+
+    def __init__(
+        self,
+        connection_str: str,
+        batch_size: int = 1,
+        flush_interval: Optional[float] = None,
+        journal_mode: Optional[str] = None,
+        synchronous: Optional[str] = None,
+        serializer: Optional[Serializer] = None,
+    ):
         self.connection_str = connection_str
-        self.db_handle = sqlite3.connect(connection_str)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.serializer = serializer if serializer is not None else BinarySerializer()
+        # Every use of the connection (and the buffer) is under the lock
+        self._lock = threading.RLock()
+        self.db_handle = sqlite3.connect(connection_str, check_same_thread=False)
+        if journal_mode is not None:
+            if journal_mode.upper() not in JOURNAL_MODES:
+                raise ValueError(f"unknown journal mode: {journal_mode}")
+            self.db_handle.execute(f"PRAGMA journal_mode = {journal_mode}")
+        if synchronous is not None:
+            if synchronous.upper() not in SYNCHRONOUS_SETTINGS:
+                raise ValueError(f"unknown synchronous setting: {synchronous}")
+            self.db_handle.execute(f"PRAGMA synchronous = {synchronous}")
         self.db_handle.execute(SCHEMA)
+        for index in INDEXES:
+            self.db_handle.execute(index)
+
+        #: How many rows to fetch at a time when iterating
+        self.page_size = 1000
+
+        self._buffer: List[Tuple[bytes, bytes, str, str]] = []
+        self._buffer_started = 0.0
+        self._timer: Optional[threading.Timer] = None
+
+    def attach(self, processor: Processor[M]) -> None:
+        """Set this as the processor's DLQ and write any buffered messages
+        when processing stops."""
+        processor.set_dlq(self)
+        processor.after_processing(self._flush_after_processing)
+
+    def _flush_after_processing(self, processing_ctx: ProcessingContext[M]) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered messages in a single transaction."""
+        with self._lock:
+            if len(self._buffer) == 0:
+                return
+            with self.db_handle:
+                self.db_handle.executemany(INSERT, self._buffer)
+            self._buffer.clear()
+
+    def _start_timer(self, delay: float) -> None:
+        self._timer = threading.Timer(delay, self._flush_if_due)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_if_due(self) -> None:
+        assert self.flush_interval is not None
+        with self._lock:
+            self._timer = None
+            if len(self._buffer) == 0:
+                return
+            # The buffer may have been flushed and refilled since the timer
+            # was started
+            remaining = self._buffer_started + self.flush_interval - time.monotonic()
+            if remaining > 0:
+                self._start_timer(remaining)
+            else:
+                self.flush()
 
     def __setitem__(self, message_id: bytes, pair: Tuple[Message, str]) -> None:
         message, reason = pair
         now = datetime.utcnow().replace(tzinfo=timezone.utc)
-        self.db_handle.execute(
-            INSERT, (message.message_id, pickle.dumps(message), reason, now)
-        )
-        self.db_handle.commit()
+        row = (message.message_id, self.serializer.dumps(message), reason, _to_db(now))
+        with self._lock:
+            if len(self._buffer) == 0:
+                self._buffer_started = time.monotonic()
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size or (
+                self.flush_interval is not None
+                and time.monotonic() - self._buffer_started >= self.flush_interval
+            ):
+                self.flush()
+            elif self.flush_interval is not None and self._timer is None:
+                self._start_timer(self.flush_interval)
 
     def __delitem__(self, message_id: bytes) -> None:
-        self.db_handle.execute(DELETE, (message_id,))
-        self.db_handle.commit()
+        with self._lock:
+            self.flush()
+            self.db_handle.execute(DELETE, (message_id,))
+            self.db_handle.commit()
+
+    def delete_many(self, message_ids: Iterable[bytes]) -> None:
+        """Delete several messages in a single transaction."""
+        with self._lock:
+            self.flush()
+            with self.db_handle:
+                self.db_handle.executemany(
+                    DELETE, ((message_id,) for message_id in message_ids)
+                )
 
     def __len__(self) -> int:
-        rv: int = self.db_handle.execute(LENGTH).fetchall()[0][0]
-        self.db_handle.commit()
+        with self._lock:
+            self.flush()
+            rv: int = self.db_handle.execute(LENGTH).fetchall()[0][0]
+            self.db_handle.commit()
         return rv
 
     def __getitem__(self, message_id: bytes) -> Tuple[M, str]:
-        ...
+        with self._lock:
+            self.flush()
+            row = self.db_handle.execute(GET, (message_id,)).fetchone()
+        if row is None:
+            raise KeyError(message_id)
+        message_bytes, reason = row
+        return self._loads(message_bytes), reason
+
+    def __contains__(self, message_id: object) -> bool:
+        with self._lock:
+            self.flush()
+            row = self.db_handle.execute(CONTAINS, (message_id,)).fetchone()
+        return row is not None
 
     def __iter__(self) -> Iterator[bytes]:
-        ...
+        """Iterate over message ids, a page at a time.
+
+        It is safe to delete messages while iterating.
+
+        """
+        self.flush()
+        last_rowid = 0
+        while True:
+            with self._lock:
+                page = self.db_handle.execute(
+                    IDS_PAGE, (last_rowid, self.page_size)
+                ).fetchall()
+            for last_rowid, message_id in page:
+                yield message_id
+            if len(page) < self.page_size:
+                return
+
+    def entries(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        reason: Optional[str] = None,
+    ) -> Iterator[Tuple[M, str, datetime]]:
+        """Iterate over (message, reason, inserted) in order of insertion, a
+        page at a time.
+
+        :param since: Only include messages inserted at or after this time
+        :param until: Only include messages inserted before this time
+        :param reason: Only include messages put on the DLQ for this reason
+
+        Both filters are served from indexes.  It is safe to delete messages
+        while iterating.
+
+        """
+        self.flush()
+        query = ENTRIES_PAGE.format(
+            reason_clause="" if reason is None else "AND reason = ?"
+        )
+        # Start just before `since`, so that it is included
+        last: Tuple[str, int] = (
+            MIN_INSERTED if since is None else _to_db(since),
+            -1,
+        )
+        upper = MAX_INSERTED if until is None else _to_db(until)
+        while True:
+            params: List[Any] = [last[0], last[1], upper]
+            if reason is not None:
+                params.append(reason)
+            params.append(self.page_size)
+            with self._lock:
+                page = self.db_handle.execute(query, params).fetchall()
+            for rowid, message_bytes, row_reason, inserted_str in page:
+                last = (inserted_str, rowid)
+                yield (
+                    self._loads(message_bytes),
+                    row_reason,
+                    datetime.fromisoformat(inserted_str),
+                )
+            if len(page) < self.page_size:
+                return
 
     def oldest(self) -> Tuple[Message, str, datetime]:
-        ((message_pickle, reason, inserted_str),) = self.db_handle.execute(OLDEST)
+        with self._lock:
+            self.flush()
+            ((message_bytes, reason, inserted_str),) = self.db_handle.execute(
+                OLDEST
+            ).fetchall()
         return (
-            pickle.loads(message_pickle),
+            self._loads(message_bytes),
             reason,
             datetime.fromisoformat(inserted_str),
         )
 
+    def _loads(self, message_bytes: bytes) -> M:
+        return cast(M, self.serializer.loads(message_bytes))
+
     def __repr__(self) -> str:
         return "<SqliteDLQ '%s'>" % self.connection_str
+
+
+def _to_db(dt: datetime) -> str:
+    """Format a datetime as it is stored in the inserted column (naive
+    datetimes are taken to be UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(" ")
@@ -0,0 +1,154 @@
+"""Splitting streams of bytes into messages.
+
+A framing finds the messages in a buffer which may end part way through one.
+Adapters read into a buffer, :meth:`Framing.scan` it for complete frames and
+keep the remainder for the next read.
+
+"""
+from mmap import mmap
+from typing import Callable, Iterator, Optional, Tuple, Union
+import abc
+
+Buffer = Union[bytes, bytearray, mmap]
+
+#: (start of frame, end of frame, start of whatever follows the frame)
+Frame = Tuple[int, int, int]
+
+
+class Framing(metaclass=abc.ABCMeta):
+    """Abstract base class for the ways that messages are delimited in a
+    stream."""
+
+    @abc.abstractmethod
+    def scan(self, buffer: Buffer, start: int, end: int) -> Iterator[Frame]:
+        """Yield the complete frames in ``buffer[start:end]``, in order."""
+
+    @abc.abstractmethod
+    def finish(self, buffer: Buffer, start: int, end: int) -> Optional[Frame]:
+        """Return the final frame from what is left at the end of the stream,
+        if there is one."""
+
+    @abc.abstractmethod
+    def frame(self, body: bytes) -> bytes:
+        """Return ``body`` framed for writing to a stream."""
+
+
+class DelimitedFraming(Framing):
+    """Frames separated by a delimiter byte.  The last frame does not need to
+    be followed by one."""
+
+    def __init__(self, delimiter: bytes) -> None:
+        if len(delimiter) != 1:
+            raise ValueError("delimiter must be a single byte")
+        self.delimiter = delimiter
+
+    def scan(self, buffer: Buffer, start: int, end: int) -> Iterator[Frame]:
+        find = buffer.find
+        delimiter = self.delimiter
+        while True:
+            index = find(delimiter, start, end)
+            if index == -1:
+                return
+            yield start, index, index + 1
+            start = index + 1
+
+    def finish(self, buffer: Buffer, start: int, end: int) -> Optional[Frame]:
+        if start == end:
+            return None
+        return start, end, end
+
+    def frame(self, body: bytes) -> bytes:
+        return body + self.delimiter
+
+
+class NewlineFraming(DelimitedFraming):
+    """Newline delimited frames, eg: NDJSON.  Windows line endings are
+    accepted."""
+
+    def __init__(self) -> None:
+        super().__init__(b"\n")
+
+    def scan(self, buffer: Buffer, start: int, end: int) -> Iterator[Frame]:
+        for frame_start, frame_end, next_start in super().scan(buffer, start, end):
+            if frame_end > frame_start and buffer[frame_end - 1] == 13:  # "\r"
+                frame_end -= 1
+            yield frame_start, frame_end, next_start
+
+    def finish(self, buffer: Buffer, start: int, end: int) -> Optional[Frame]:
+        final = super().finish(buffer, start, end)
+        if final is not None and buffer[end - 1] == 13:  # "\r"
+            return start, end - 1, end
+        return final
+
+
+class NulFraming(DelimitedFraming):
+    """NUL delimited frames, for messages which may contain newlines."""
+
+    def __init__(self) -> None:
+        super().__init__(b"\0")
+
+
+class LengthPrefixedFraming(Framing):
+    """Frames preceded by their length as a big-endian unsigned integer.
+
+    :param header_size: The size of the length, in bytes
+    :param max_size: The largest frame to accept, as a corrupted length
+        could otherwise cause a huge allocation
+
+    """
+
+    def __init__(self, header_size: int = 4, max_size: int = 64 * 1024 * 1024):
+        self.header_size = header_size
+        self.max_size = max_size
+
+    def scan(self, buffer: Buffer, start: int, end: int) -> Iterator[Frame]:
+        header_size = self.header_size
+        while end - start >= header_size:
+            length = int.from_bytes(buffer[start : start + header_size], "big")
+            if length > self.max_size:
+                raise ValueError(
+                    f"frame of {length} bytes is larger than {self.max_size}"
+                )
+            frame_start = start + header_size
+            frame_end = frame_start + length
+            if frame_end > end:
+                return
+            yield frame_start, frame_end, frame_end
+            start = frame_end
+
+    def finish(self, buffer: Buffer, start: int, end: int) -> Optional[Frame]:
+        if start != end:
+            raise ValueError("stream ended part way through a frame")
+        return None
+
+    def frame(self, body: bytes) -> bytes:
+        return len(body).to_bytes(self.header_size, "big") + body
+
+
+def read_frames(
+    read: Callable[[int], bytes], framing: Framing, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """Yield the frames from a stream until it ends, holding no more than a
+    chunk and a frame in memory at once.
+
+    :param read: The stream's read method, eg: ``file.read``
+
+    """
+    buffer = bytearray()
+    start = 0
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        if start > 0:
+            del buffer[:start]
+            start = 0
+        buffer += chunk
+        for frame_start, frame_end, next_start in framing.scan(
+            buffer, start, len(buffer)
+        ):
+            start = next_start
+            yield bytes(buffer[frame_start:frame_end])
+    final = framing.finish(buffer, start, len(buffer))
+    if final is not None:
+        yield bytes(buffer[final[0] : final[1]])
@@ -0,0 +1,80 @@
+"""The JSON decoder used by :class:`missive.JSONMessage`.
+
+The standard library's json module is used unless a faster backend is asked
+for, either by setting the ``MISSIVE_JSON_BACKEND`` environment variable to
+one of :data:`BACKENDS` or by calling :func:`use_backend`.  ``auto`` picks the
+fastest one installed: orjson, then msgspec, then json.
+
+orjson and msgspec parse bytes directly, without first decoding them to a
+str, but they accept less than the json module: ``NaN`` and ``Infinity`` are
+rejected, and orjson rejects integers that don't fit in 64 bits.  Messages
+like these which parsed before will fail, and go to the DLQ, once switched.
+
+"""
+from typing import Any, Callable, Optional, Union
+import json
+import os
+
+#: Supported backends, in order of preference
+BACKENDS = ("orjson", "msgspec", "json")
+
+Loads = Callable[[Union[bytes, memoryview]], Any]
+
+
+def _stdlib_loads(data: Union[bytes, memoryview]) -> Any:
+    # json.loads detects the encoding of bytes itself but does not take
+    # memoryviews
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def _load_backend(name: str) -> Loads:
+    """Return the loads function of the named backend, raising ImportError if
+    it is not installed."""
+    if name == "orjson":
+        import orjson
+
+        rv: Loads = orjson.loads
+        return rv
+    elif name == "msgspec":
+        import msgspec
+
+        decoder = msgspec.json.Decoder()
+        return decoder.decode  # type: ignore
+    elif name == "json":
+        return _stdlib_loads
+    raise ValueError(f"unknown JSON backend: {name}")
+
+
+def _pick_backend(requested: Optional[str]) -> str:
+    if requested is None:
+        return "json"
+    elif requested != "auto":
+        return requested
+    for name in BACKENDS:
+        try:
+            _load_backend(name)
+        except ImportError:
+            continue
+        return name
+    raise AssertionError("the json module is always available")
+
+
+#: The name of the backend in use
+backend = _pick_backend(os.environ.get("MISSIVE_JSON_BACKEND") or None)
+
+#: Parse a JSON document from bytes
+loads = _load_backend(backend)
+
+
+def use_backend(name: str) -> None:
+    """Switch to the named backend, or the fastest installed if ``auto``.
+
+    Messages which have already been parsed are not affected.
+
+    """
+    global backend, loads
+    name = _pick_backend(name)
+    loads = _load_backend(name)
+    backend = name
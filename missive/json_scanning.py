@@ -0,0 +1,270 @@
+"""Pulling individual fields out of a JSON document without parsing all of it.
+
+Routing usually depends on one small field (eg: ``event_type``) of what can be
+a large document.  :func:`extract` walks the structure of the raw bytes,
+skipping over the values it does not need using regular expressions (which
+run in C), and then parses only the value that was asked for.
+
+Skipping is not free: for each nested container skipped the scanner has to
+visit its brackets and strings.  When a lookup needs more than
+:data:`SCAN_BUDGET` steps the caller is told to give up, as a full parse
+would be cheaper.  Small documents, under :data:`SCAN_THRESHOLD` bytes, are
+also quicker to parse in full.
+
+Lookups agree with a full parse on duplicated keys, which take their last
+value: after finding a key, the rest of the document is searched (in C) for
+anything that could be the key again, and only if there is something is the
+object walked to its end.  Everything that is walked is checked - strings,
+scalars, brackets and punctuation, though only brackets and strings inside
+skipped containers - as is the last byte of the document, which catches
+truncation.  Malformed documents raise :class:`ValueError` so that the caller
+can fall back to a full parse, and so fail in the same way.  Malformations in
+the parts that are never walked are only reported by a full parse.
+
+"""
+from functools import lru_cache
+from typing import Any, Optional, Pattern, Sequence, Tuple, Union
+import re
+
+from . import json_decoding
+
+#: The most tokens (brackets and strings) to visit before giving up
+SCAN_BUDGET = 512
+
+#: Documents smaller than this (in bytes) are quicker to parse in full
+SCAN_THRESHOLD = 2048
+
+
+class Missing:
+    """The type of :data:`MISSING`."""
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+#: Returned when a path does not exist in the document
+MISSING = Missing()
+
+
+class TooExpensive(Exception):
+    """Raised when a lookup would exceed :data:`SCAN_BUDGET`."""
+
+
+WHITESPACE = re.compile(rb"[ \t\n\r]*")
+STRING = re.compile(rb'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"')
+SCALAR = re.compile(
+    rb"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null"
+)
+# Characters which matter when skipping over a container
+STRUCTURAL = re.compile(rb'["\[\]{}]')
+
+Buffer = Union[bytes, memoryview]
+PathElement = Union[str, int]
+
+
+class _Scanner:
+    def __init__(self, data: Buffer) -> None:
+        self.data = data
+        self.steps = 0
+
+    def step(self) -> None:
+        self.steps += 1
+        if self.steps > SCAN_BUDGET:
+            raise TooExpensive()
+
+    def skip_whitespace(self, pos: int) -> int:
+        match = WHITESPACE.match(self.data, pos)
+        assert match is not None
+        return match.end()
+
+    def expect(self, pos: int, char: bytes) -> int:
+        if self.data[pos : pos + 1] != char:
+            raise ValueError(f"expected {char!r} at offset {pos}")
+        return pos + 1
+
+    def skip_string(self, pos: int) -> int:
+        match = STRING.match(self.data, pos)
+        if match is None:
+            raise ValueError(f"unterminated string at offset {pos}")
+        return match.end()
+
+    def skip_value(self, pos: int) -> int:
+        """Return the offset just past the value starting at ``pos``."""
+        self.step()
+        first = self.data[pos : pos + 1]
+        if first == b'"':
+            return self.skip_string(pos)
+        elif first in (b"{", b"["):
+            # The closing bracket expected for each open container
+            closers = []
+            while True:
+                match = STRUCTURAL.search(self.data, pos)
+                if match is None:
+                    raise ValueError("unterminated container")
+                self.step()
+                char = match.group()
+                if char == b'"':
+                    pos = self.skip_string(match.start())
+                    continue
+                pos = match.end()
+                if char == b"{":
+                    closers.append(b"}")
+                elif char == b"[":
+                    closers.append(b"]")
+                elif len(closers) == 0 or closers.pop() != char:
+                    raise ValueError(f"unexpected {char!r} at offset {pos - 1}")
+                elif len(closers) == 0:
+                    return pos
+        else:
+            match = SCALAR.match(self.data, pos)
+            if match is None:
+                raise ValueError(f"expected a value at offset {pos}")
+            return match.end()
+
+    def find_member(
+        self, pos: int, key: str, last: bool = False
+    ) -> Tuple[Optional[Tuple[int, int]], Optional[int]]:
+        """Return the (start, end) of ``key``'s value in the object starting at
+        ``pos`` (or None if it is not there) and the offset just past the
+        object, if it was reached.
+
+        If the key is duplicated, the first value is returned or, with
+        ``last``, the last one.
+
+        """
+        encoded_key = b'"' + key.encode("utf-8") + b'"'
+        span = None
+        pos = self.skip_whitespace(self.expect(pos, b"{"))
+        if self.data[pos : pos + 1] == b"}":
+            return None, pos + 1
+        while True:
+            self.step()
+            key_start = pos
+            pos = self.skip_string(pos)
+            raw_key = bytes(self.data[key_start:pos])
+            if b"\\" in raw_key:
+                matches = json_decoding.loads(raw_key) == key
+            else:
+                matches = raw_key == encoded_key
+            pos = self.skip_whitespace(self.expect(self.skip_whitespace(pos), b":"))
+            value_end = self.skip_value(pos)
+            if matches:
+                span = (pos, value_end)
+                if not last:
+                    return span, None
+            pos = self.skip_whitespace(value_end)
+            if self.data[pos : pos + 1] == b"}":
+                return span, pos + 1
+            pos = self.skip_whitespace(self.expect(pos, b","))
+
+    def find_element(self, pos: int, index: int) -> Optional[Tuple[int, int]]:
+        """Return the (start, end) of the ``index``th element of the array
+        starting at ``pos``, or None if it is not there."""
+        pos = self.skip_whitespace(self.expect(pos, b"["))
+        if self.data[pos : pos + 1] == b"]":
+            return None
+        current = 0
+        while True:
+            value_end = self.skip_value(pos)
+            if current == index:
+                return pos, value_end
+            pos = self.skip_whitespace(value_end)
+            if self.data[pos : pos + 1] == b"]":
+                return None
+            pos = self.skip_whitespace(self.expect(pos, b","))
+            current += 1
+
+
+@lru_cache(maxsize=256)
+def _spellings(key: str) -> Optional[Pattern[bytes]]:
+    """Return a pattern matching the ways that ``key`` could be written
+    using escapes, or None if it is written with escapes even in full."""
+    if any(char in key for char in '"\\') or any(ord(char) < 0x20 for char in key):
+        return None
+    codes = []
+    for char in sorted(set(key)):
+        for code in (ord(char),) if ord(char) < 0x10000 else _surrogates(char):
+            codes.append(
+                "".join(
+                    f"[{c.lower()}{c.upper()}]" if c.isalpha() else c
+                    for c in f"{code:04x}"
+                )
+            )
+    pattern = r"\\u(?:" + "|".join(codes) + ")"
+    if "/" in key:
+        pattern += r"|\\/"
+    return re.compile(pattern.encode("ascii"))
+
+
+def _surrogates(char: str) -> Tuple[int, int]:
+    code = ord(char) - 0x10000
+    return 0xD800 + (code >> 10), 0xDC00 + (code & 0x3FF)
+
+
+def _may_recur(haystack: bytes, pos: int, key: str) -> bool:
+    """Whether ``key`` could occur as a key again after ``pos``.  This is a
+    search in C, which may find the key inside a string or in a nested
+    object, so True only means that it has to be checked."""
+    spellings = _spellings(key)
+    if spellings is None:
+        return True
+    encoded_key = b'"' + key.encode("utf-8") + b'"'
+    if haystack.find(encoded_key, pos) != -1:
+        return True
+    # Most documents have no escapes at all, and a single byte is the
+    # quickest thing to search for
+    if haystack.find(b"\\", pos) == -1:
+        return False
+    return spellings.search(haystack, pos) is not None
+
+
+def _check_ends(data: Buffer, start: int) -> None:
+    """Check that a document starting with a container at ``start`` at least
+    ends with its closing bracket, which catches truncated documents without
+    reading them in full."""
+    end = len(data) - 1
+    while end > start and data[end : end + 1] in (b" ", b"\t", b"\n", b"\r"):
+        end -= 1
+    closer = b"}" if data[start : start + 1] == b"{" else b"]"
+    if end <= start or data[end : end + 1] != closer:
+        raise ValueError(f"expected {closer!r} at the end of the document")
+
+
+def extract(data: Buffer, path: Sequence[PathElement]) -> Any:
+    """Return the value at ``path`` (a sequence of object keys and array
+    indices) or :data:`MISSING`.
+
+    As with a full parse, the last occurrence of a duplicated key is used.
+    Raises :class:`TooExpensive` if the lookup would be slower than parsing
+    the whole document and :class:`ValueError` if the document is found to be
+    malformed.
+
+    """
+    scanner = _Scanner(data)
+    start = scanner.skip_whitespace(0)
+    end = len(data)
+    if data[start : start + 1] in (b"{", b"["):
+        _check_ends(data, start)
+    haystack: Optional[bytes] = None
+    for depth, element in enumerate(path):
+        first = data[start : start + 1]
+        if isinstance(element, str) and first == b"{":
+            span, object_end = scanner.find_member(start, element)
+            if span is not None:
+                if haystack is None:
+                    haystack = data if isinstance(data, bytes) else bytes(data)
+                if _may_recur(haystack, span[1], element):
+                    span, object_end = scanner.find_member(start, element, last=True)
+            if depth == 0 and object_end is not None:
+                # The whole document has been walked, so check for extra data
+                trailing = scanner.skip_whitespace(object_end)
+                if trailing != len(data):
+                    raise ValueError(f"extra data at offset {trailing}")
+        elif isinstance(element, int) and element >= 0 and first == b"[":
+            span = scanner.find_element(start, element)
+        else:
+            return MISSING
+        if span is None:
+            return MISSING
+        start, end = span
+    return json_decoding.loads(data[start:end])
@@ -1,15 +1,115 @@
-from typing import Callable, Dict, Optional, Any
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Type,
+    TypeVar,
+    cast,
+)
 
-from .missive import Message, logger
+from . import structs
+from .missive import IndexedMatcher, Message, logger
 
 
 class DictMessage(Message):
-    def __init__(self, raw_data: bytes, decoder: Callable[[bytes], Dict[Any, Any]]):
+    __slots__ = ("decoder", "_decoded")
+
+    def __init__(
+        self,
+        raw_data: bytes,
+        decoder: Callable[[bytes], Dict[Any, Any]],
+        message_id: Optional[bytes] = None,
+    ):
         self.decoder = decoder
         self._decoded: Optional[Dict[Any, Any]] = None
-        super().__init__(raw_data=raw_data)
+        super().__init__(raw_data=raw_data, message_id=message_id)
 
     def contents(self) -> Dict[Any, Any]:
         if self._decoded is None:
             self._decoded = self.decoder(self.raw_data)
         return self._decoded
+
+
+S = TypeVar("S")
+
+
+class StructMessage(Message, Generic[S]):
+    """A JSON message which is decoded and validated against a schema.
+
+    Subclasses set ``schema`` to a dataclass or a ``msgspec.Struct``:
+
+    .. code:: python
+
+        @dataclass
+        class UserCreated:
+            event_type: str
+            user_id: int
+
+        class UserCreatedMessage(StructMessage[UserCreated]):
+            schema = UserCreated
+
+    Invalid messages raise :class:`missive.InvalidMessage` from
+    :meth:`get_struct`.
+
+    """
+
+    __slots__ = ("_struct",)
+
+    schema: ClassVar[Type[Any]]
+
+    def __init__(self, raw_data: bytes, message_id: Optional[bytes] = None) -> None:
+        super().__init__(raw_data, message_id)
+        self._struct: Optional[S] = None
+
+    def get_struct(self) -> S:
+        if self._struct is None:
+            self._struct = cast(S, structs.decode(self.schema, self.raw_data))
+        return self._struct
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        # Decoded again when needed, the schema may not be picklable
+        state["_struct"] = None
+        return state
+
+
+class StructField:
+    """Extracts a field, or a dotted path of fields, from a
+    :class:`StructMessage`.
+
+    Messages which lack the field extract as ``None``.  Messages which are
+    invalid raise :class:`missive.InvalidMessage`, so are put on the DLQ.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.attributes = path.split(".")
+
+    def __call__(self, message: StructMessage[Any]) -> Hashable:
+        value: Any = message.get_struct()
+        for attribute in self.attributes:
+            value = getattr(value, attribute, None)
+        rv: Hashable = value
+        return rv
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, StructField) and self.path == other.path
+
+    def __hash__(self) -> int:
+        return hash((StructField, self.path))
+
+    def __repr__(self) -> str:
+        return "<StructField %r>" % self.path
+
+
+def struct_field_equals(
+    path: str, value: Hashable
+) -> IndexedMatcher[StructMessage[Any]]:
+    """Return an indexed matcher for struct messages whose field at ``path``
+    equals ``value``."""
+    return IndexedMatcher(StructField(path), value)
@@ -0,0 +1,351 @@
+"""Instrumentation for processors.
+
+A :class:`Sink` creates the counters and histograms that a processor records
+to.  Instruments are created once, up front - including one set per handler -
+so recording a message is a handful of method calls on already bound objects
+with no lookups or label handling:
+
+.. code-block:: python
+
+    from missive.metrics import PrometheusSink, start_http_server
+
+    sink = PrometheusSink()
+    processor.set_metrics(sink)
+    start_http_server(sink, 9100)
+
+Other metrics systems can be plugged in by implementing :class:`Sink`,
+:class:`Counter` and :class:`Histogram`.
+
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Sequence, Tuple
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+import abc
+import math
+import threading
+
+#: Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = Mapping[str, str]
+
+
+class Counter(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    def inc(self, amount: int = 1) -> None:
+        """Increment the counter."""
+
+
+class Histogram(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    def observe(self, value: float) -> None:
+        """Record a value, eg: a duration in seconds."""
+
+
+class Sink(metaclass=abc.ABCMeta):
+    """Creates the instruments that a processor records to.
+
+    Each method is called once per distinct name and labels, when the metrics
+    are set up, and the result is kept.
+
+    """
+
+    @abc.abstractmethod
+    def counter(self, name: str, documentation: str, labels: Labels) -> Counter:
+        pass
+
+    @abc.abstractmethod
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Labels,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        pass
+
+
+class _PrometheusCounter(Counter):
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        # Cheaper than a with statement, and nothing in between can raise
+        lock = self._lock
+        lock.acquire()
+        self.value += amount
+        lock.release()
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        yield f"{name}{labels} {self.value}"
+
+
+class _PrometheusHistogram(Histogram):
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = list(buckets)
+        # One more than the buckets, for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        lock = self._lock
+        lock.acquire()
+        self.counts[index] += 1
+        self.sum += value
+        lock.release()
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        # Buckets are cumulative in the exposition format
+        cumulative = 0
+        prefix = labels[:-1] + "," if labels else "{"
+        for upper, count in zip(self.buckets + [math.inf], counts):
+            cumulative += count
+            bound = "+Inf" if upper == math.inf else repr(float(upper))
+            yield f'{name}_bucket{prefix}le="{bound}"}} {cumulative}'
+        yield f"{name}_count{labels} {cumulative}"
+        yield f"{name}_sum{labels} {total!r}"
+
+
+def _format_labels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in sorted(labels.items())
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class PrometheusSink(Sink):
+    """Keeps metrics in memory and renders them in Prometheus's text format.
+
+    Each process has its own metrics, so with
+    :class:`missive.supervisor.Supervisor` every worker needs its own port
+    (eg: the base port plus the worker index).
+
+    """
+
+    def __init__(self) -> None:
+        # name -> (type, documentation, {labels: instrument})
+        self._families: Dict[str, Tuple[str, str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(
+        self,
+        kind: str,
+        name: str,
+        documentation: str,
+        labels: Labels,
+        new: Callable[[], Any],
+    ) -> Any:
+        formatted = _format_labels(labels)
+        with self._lock:
+            family = self._families.setdefault(name, (kind, documentation, {}))
+            if family[0] != kind:
+                raise ValueError(f"{name} is already a {family[0]}")
+            instruments = family[2]
+            if formatted not in instruments:
+                instruments[formatted] = new()
+            return instruments[formatted]
+
+    def counter(self, name: str, documentation: str, labels: Labels) -> Counter:
+        counter: Counter = self._get(
+            "counter", name, documentation, labels, _PrometheusCounter
+        )
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Labels,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram: Histogram = self._get(
+            "histogram",
+            name,
+            documentation,
+            labels,
+            lambda: _PrometheusHistogram(buckets),
+        )
+        return histogram
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            families = [
+                (name, kind, documentation, list(instruments.items()))
+                for name, (kind, documentation, instruments) in self._families.items()
+            ]
+        lines: List[str] = []
+        for name, kind, documentation, instruments in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, instrument in instruments:
+                lines.extend(instrument.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+#: The content type of :meth:`PrometheusSink.render`'s output
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def make_wsgi_app(sink: PrometheusSink) -> Callable[..., Iterable[bytes]]:
+    """Return a WSGI application that serves the metrics on any path."""
+
+    def app(
+        environ: Dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        body = sink.render().encode("utf-8")
+        start_response(
+            "200 OK",
+            [("Content-Type", CONTENT_TYPE), ("Content-Length", str(len(body)))],
+        )
+        return [body]
+
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_http_server(sink: PrometheusSink, port: int, addr: str = "") -> Any:
+    """Serve the metrics over HTTP from a daemon thread, for adapters that
+    aren't themselves HTTP servers.  Returns the server, which can be
+    stopped with ``server.shutdown()``."""
+    server = make_server(addr, port, make_wsgi_app(sink), handler_class=_QuietHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, name="missive-metrics", daemon=True
+    )
+    thread.start()
+    return server
+
+
+def handler_name(handler: Callable[..., Any]) -> str:
+    """The name a handler is labelled with."""
+    module = getattr(handler, "__module__", None)
+    qualname = getattr(handler, "__qualname__", None) or repr(handler)
+    return qualname if module is None else f"{module}.{qualname}"
+
+
+class HandlerMetrics:
+    """The instruments for a single handler."""
+
+    __slots__ = (
+        "matched",
+        "handler_seconds",
+        "latency_seconds",
+        "timeouts",
+        "retries",
+    )
+
+    def __init__(self, sink: Sink, handler: Callable[..., Any]) -> None:
+        labels = {"handler": handler_name(handler)}
+        self.matched = sink.counter(
+            "missive_messages_matched_total", "Messages matched to a handler", labels,
+        )
+        self.handler_seconds = sink.histogram(
+            "missive_handler_seconds",
+            "Time spent in the handler (per batch, for batch handlers)",
+            labels,
+        )
+        self.latency_seconds = sink.histogram(
+            "missive_latency_seconds",
+            "Time from the processor receiving a message to its handler finishing",
+            labels,
+        )
+        self.timeouts = sink.counter(
+            "missive_handler_timeouts_total",
+            "Handler calls that ran for longer than their timeout",
+            labels,
+        )
+        self.retries = sink.counter(
+            "missive_handler_retries_total",
+            "Handler calls that failed and will be retried",
+            labels,
+        )
+
+
+class ProcessorMetrics:
+    """The instruments for a processor, bound to a sink."""
+
+    def __init__(self, sink: Sink) -> None:
+        self.sink = sink
+        no_labels: Labels = {}
+        self.no_match = sink.counter(
+            "missive_messages_unmatched_total",
+            "Messages with no matching handler",
+            no_labels,
+        )
+        self.multiple_matches = sink.counter(
+            "missive_messages_multiple_matches_total",
+            "Messages with more than one matching handler",
+            no_labels,
+        )
+        self.invalid = sink.counter(
+            "missive_messages_invalid_total",
+            "Messages found to be invalid while matching",
+            no_labels,
+        )
+        self.dead_lettered = sink.counter(
+            "missive_messages_dead_lettered_total",
+            "Messages put on the dead letter queue",
+            no_labels,
+        )
+        self.acked = sink.counter(
+            "missive_messages_acked_total", "Messages acked", no_labels
+        )
+        self.nacked = sink.counter(
+            "missive_messages_nacked_total", "Messages nacked", no_labels
+        )
+        self.matcher_seconds = sink.histogram(
+            "missive_matcher_seconds",
+            "Time spent finding a message's handler",
+            no_labels,
+        )
+        self._handlers: Dict[Callable[..., Any], HandlerMetrics] = {}
+        self._handlers_lock = threading.Lock()
+
+    def handler(self, handler: Callable[..., Any]) -> HandlerMetrics:
+        """Return the instruments for a handler."""
+        try:
+            return self._handlers[handler]
+        except KeyError:
+            with self._handlers_lock:
+                if handler not in self._handlers:
+                    self._handlers[handler] = HandlerMetrics(self.sink, handler)
+                return self._handlers[handler]
+
+    def bind_handlers(self, handlers: Iterable[Callable[..., Any]]) -> None:
+        """Create the instruments for handlers ahead of time."""
+        for handler in handlers:
+            self.handler(handler)
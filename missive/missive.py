@@ -1,7 +1,11 @@
 import abc
-import json
-import uuid
-from dataclasses import dataclass
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
 from contextlib import contextmanager, ExitStack, closing
 from logging import getLogger
 from typing import (
@@ -17,17 +21,97 @@ from typing import (
     Iterator,
     Type,
     Set,
+    Hashable,
+    Dict,
+    Union,
+    Sequence,
+    cast,
 )
 
 logger = getLogger("missive")
 
 from .state import State
+from . import json_decoding, json_scanning
+from .metrics import ProcessorMetrics, Sink
+from .watchdog import HandlerTimeout, Watchdog
+from .json_scanning import PathElement
+
+
+# Message ids are a random per-process prefix followed by a counter, which is
+# much cheaper than a uuid4 per message.  The prefix is re-randomised in forked
+# children so that they do not repeat the parent's ids.
+_id_prefix = os.urandom(8)
+_id_counter = itertools.count()
+
+
+def _reset_message_ids() -> None:
+    global _id_prefix, _id_counter
+    _id_prefix = os.urandom(8)
+    _id_counter = itertools.count()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_message_ids)
+
+
+def new_message_id() -> bytes:
+    """Return a new, unique, 16 byte message id."""
+    return _id_prefix + next(_id_counter).to_bytes(8, "big")
+
+
+class InvalidMessage(Exception):
+    """Raised when a message cannot be decoded or fails validation.
+
+    If this is raised while matching, the message is put on the DLQ with the
+    exception's message as the reason.
+
+    """
 
 
 class Message(metaclass=abc.ABCMeta):
-    def __init__(self, raw_data: bytes) -> None:
+    """Base class for messages.
+
+    :param raw_data: The bytes of the message
+    :param message_id: The message id, if the transport supplies one that is
+        unique.  Otherwise an id is generated the first time it is needed.
+
+    """
+
+    __slots__ = ("raw_data", "_message_id", "__weakref__")
+
+    def __init__(self, raw_data: bytes, message_id: Optional[bytes] = None) -> None:
         self.raw_data = raw_data
-        self.message_id = uuid.uuid4().bytes
+        self._message_id = message_id
+
+    @property
+    def message_id(self) -> bytes:
+        if self._message_id is None:
+            self._message_id = new_message_id()
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, value: bytes) -> None:
+        self._message_id = value
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(getattr(self, "__dict__", {}))
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if slot != "__weakref__" and hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        # Generate the id now, otherwise it would change when unpickled
+        state["_message_id"] = self.message_id
+        return state
+
+    def __setstate__(self, state: Any) -> None:
+        if isinstance(state, tuple):
+            dict_state, slot_state = state
+            state = {**(dict_state or {}), **(slot_state or {})}
+        for key, value in state.items():
+            if key == "message_id":
+                # Pickled before message ids were lazy
+                key = "_message_id"
+            object.__setattr__(self, key, value)
 
     def __repr__(self) -> str:
         return "<%s (%r, %r)>" % (
@@ -49,20 +133,89 @@ class Message(metaclass=abc.ABCMeta):
 class RawMessage(Message):
     """A raw message of just bytes with no interpretation"""
 
-    ...
+    __slots__ = ()
+
+
+# Distinguishes "not parsed yet" from a body of null
+_UNSET: Any = object()
 
 
 class JSONMessage(Message):
-    def __init__(self, raw_data: bytes) -> None:
-        super().__init__(raw_data)
-        self._json: Optional[Any] = None
+    __slots__ = ("_json", "_fields")
+
+    def __init__(self, raw_data: bytes, message_id: Optional[bytes] = None) -> None:
+        super().__init__(raw_data, message_id)
+        self._json: Any = _UNSET
+        self._fields: Optional[Dict[Tuple[PathElement, ...], Any]] = None
+
+    def get_field(self, field: str, default: Any = None) -> Any:
+        """Return a top-level field, or ``default`` if the message is not an
+        object or lacks it.
+
+        Unless the message has already been parsed, only as much of it as is
+        needed to find the field is looked at (see
+        :mod:`missive.json_scanning`).
+
+        """
+        return self.get_path(field, default=default)
+
+    def get_path(self, *path: PathElement, default: Any = None) -> Any:
+        """Return the value at a path of object keys and array indices, eg:
+        ``message.get_path("items", 0, "sku")``, or ``default`` if there is
+        nothing there."""
+        if (
+            self._json is not _UNSET
+            or len(self.raw_data) < json_scanning.SCAN_THRESHOLD
+        ):
+            return _walk(self.get_json(), path, default)
+        if self._fields is None:
+            self._fields = {}
+        try:
+            value = self._fields[path]
+        except KeyError:
+            try:
+                value = json_scanning.extract(self.raw_data, path)
+            except (json_scanning.TooExpensive, ValueError):
+                # A malformed document fails here just as a small one would
+                return _walk(self.get_json(), path, default)
+            self._fields[path] = value
+        return default if value is json_scanning.MISSING else value
 
     def get_json(self) -> Any:
+        """Return the parsed JSON body, using the backend chosen by
+        :mod:`missive.json_decoding`."""
+        if self._json is _UNSET:
+            self._json = json_decoding.loads(self.raw_data)
+        return self._json
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        if state.get("_json") is _UNSET:
+            state["_json"] = None
+        return state
+
+    def __setstate__(self, state: Any) -> None:
+        super().__setstate__(state)
+        # None is pickled for "not parsed yet", as earlier versions used it
         if self._json is None:
-            self._json = json.loads(self.raw_data.decode("utf-8"))
-            return self._json
+            self._json = _UNSET
+        if not hasattr(self, "_fields"):
+            self._fields = None
+
+
+def _walk(value: Any, path: Sequence[PathElement], default: Any) -> Any:
+    for element in path:
+        if isinstance(element, str) and isinstance(value, dict):
+            if element not in value:
+                return default
+            value = value[element]
+        elif isinstance(element, int) and isinstance(value, list):
+            if not 0 <= element < len(value):
+                return default
+            value = value[element]
         else:
-            return self._json
+            return default
+    return value
 
 
 M = TypeVar("M", bound=Message)
@@ -99,6 +252,59 @@ class Adapter(Generic[M], metaclass=abc.ABCMeta):
         """
 
 
+class Publisher(metaclass=abc.ABCMeta):
+    """Abstract base class for sending messages, eg: from handlers.
+
+    Publishers may hold messages back so that they can be sent together.
+    :meth:`flush` sends everything the calling thread has published and waits
+    until it has been accepted by the message bus.  Publishers are shared by
+    every handler (and worker thread) of a processor, so must be thread-safe.
+
+    """
+
+    @abc.abstractmethod
+    def publish(self, destination: str, body: bytes) -> None:
+        """Publish a message.
+
+        :param destination: Where to send the message - its meaning depends
+            on the message bus, eg: a routing key or a channel.
+        :param body: The message itself.
+
+        """
+
+    @abc.abstractmethod
+    def flush(self) -> None:
+        """Send everything published so far by this thread."""
+
+    @abc.abstractmethod
+    def discard(self) -> None:
+        """Drop everything published by this thread that has not been sent,
+        eg: by a handler that then raised."""
+
+    def close(self) -> None:
+        """Flush and release any connections."""
+        self.flush()
+
+
+class TestPublisher(Publisher):
+    # Tell pytest not to try and collect this class
+    __test__ = False
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[str, bytes]] = []
+        self.published: List[Tuple[str, bytes]] = []
+
+    def publish(self, destination: str, body: bytes) -> None:
+        self.pending.append((destination, body))
+
+    def flush(self) -> None:
+        self.published.extend(self.pending)
+        self.pending.clear()
+
+    def discard(self) -> None:
+        self.pending.clear()
+
+
 class TestAdapter(Adapter[M]):
     # Tell pytest not to try and collect this class
     __test__ = False
@@ -122,6 +328,12 @@ class TestAdapter(Adapter[M]):
                 self.processor.context(type(message), self)
             )
         self.ctx.handle(message)
+        self.ctx.tick()
+
+    def flush(self) -> None:
+        """Hand any partial batches to their handlers now."""
+        if self.ctx is not None:
+            self.ctx.flush_batches()
 
     def close(self) -> None:
         self.stack.close()
@@ -133,6 +345,167 @@ Matcher = Callable[[M], bool]
 
 Handler = Callable[[M, "HandlingContext[M]"], None]
 
+BatchHandler = Callable[[List[M], "BatchHandlingContext[M]"], None]
+
+AnyHandler = Union[Handler[M], BatchHandler[M]]
+
+Extractor = Callable[[M], Hashable]
+
+
+class IndexedMatcher(Generic[M]):
+    """A declarative matcher that matches when some property of the message
+    equals a given value.
+
+    Unlike opaque callables, indexed matchers are compiled by the
+    :class:`Processor` into a hash index.  Dispatch then costs one call to each
+    distinct extractor plus a dict lookup rather than one call per handler.
+
+    :param extractor: A hashable callable which pulls the property out of the
+        message.  Matchers sharing an (equal) extractor share an index.
+    :param value: The value that the extracted property must equal.
+
+    """
+
+    def __init__(self, extractor: Extractor[M], value: Hashable) -> None:
+        self.extractor = extractor
+        self.value = value
+
+    def __call__(self, message: M) -> bool:
+        return bool(self.extractor(message) == self.value)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IndexedMatcher):
+            return False
+        return (self.extractor, self.value) == (other.extractor, other.value)
+
+    def __hash__(self) -> int:
+        return hash((self.extractor, self.value))
+
+    def __repr__(self) -> str:
+        return "<%s (%r == %r)>" % (self.__class__.__name__, self.extractor, self.value)
+
+
+class JSONField:
+    """Extracts a top-level field from a :class:`JSONMessage`.
+
+    Messages which are not JSON objects or which lack the field extract as
+    ``None``.
+
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+
+    def __call__(self, message: JSONMessage) -> Hashable:
+        value: Hashable = message.get_field(self.field)
+        return value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, JSONField) and self.field == other.field
+
+    def __hash__(self) -> int:
+        return hash((JSONField, self.field))
+
+    def __repr__(self) -> str:
+        return "<JSONField %r>" % self.field
+
+
+def json_field_equals(field: str, value: Hashable) -> IndexedMatcher[JSONMessage]:
+    """Return an indexed matcher for JSON messages whose top-level ``field``
+    equals ``value``."""
+    return IndexedMatcher(JSONField(field), value)
+
+
+H = TypeVar("H")
+
+
+class HandlerIndex(Generic[M, H]):
+    """Dispatch table built from a processor's matchers.
+
+    :class:`IndexedMatcher` instances are grouped by extractor into dicts keyed
+    on the expected value, everything else is kept in a list of "opaque"
+    matchers that must be called one by one.
+
+    """
+
+    def __init__(self) -> None:
+        self.indexes: Dict[Extractor[M], Dict[Hashable, H]] = {}
+        self.opaque: List[Tuple[Matcher[M], H]] = []
+
+    def add(self, matcher: Matcher[M], handler: H) -> None:
+        if isinstance(matcher, IndexedMatcher):
+            index = self.indexes.setdefault(matcher.extractor, {})
+            index[matcher.value] = handler
+        else:
+            self.opaque.append((matcher, handler))
+
+    def match(self, message: M) -> List[H]:
+        """Return all handlers whose matcher matches the message."""
+        matching_handlers = []
+        for extractor, index in self.indexes.items():
+            value = extractor(message)
+            try:
+                handler = index.get(value)
+            except TypeError:
+                # unhashable values (eg: lists) can't equal any indexed value
+                handler = None
+            if handler is not None:
+                logger.debug("matched %s via %s for %s", handler, extractor, message)
+                matching_handlers.append(handler)
+        for (matcher, handler) in self.opaque:
+            if matcher(message):
+                logger.debug("matched %s for %s", handler, message)
+                matching_handlers.append(handler)
+            else:
+                logger.debug("did not match %s for %s", handler, message)
+        return matching_handlers
+
+
+@dataclass
+class BatchPolicy:
+    """When to hand a batch of messages to a batch handler."""
+
+    #: The most messages that will be passed to the handler at once
+    max_size: int
+    #: The longest (in seconds) the first message in a batch will wait
+    max_wait: float
+
+
+@dataclass
+class RetryPolicy:
+    """How to retry a handler that raises an exception.
+
+    Delays grow exponentially from ``base_delay`` up to ``max_delay``, and
+    ``jitter`` spreads them out so that messages which failed together are
+    not all retried together.
+
+    """
+
+    #: The exceptions that are retried - others follow the normal DLQ policy
+    exceptions: Tuple[Type[Exception], ...] = (Exception,)
+    #: The most times the handler is called with a message, including the first
+    max_attempts: int = 3
+    #: The delay (in seconds) before the first retry
+    base_delay: float = 1.0
+    #: The longest delay (in seconds) before a retry
+    max_delay: float = 60.0
+    #: How many times longer each delay is than the one before
+    multiplier: float = 2.0
+    #: The fraction of each delay that is random: 0 for none, 1 for anywhere
+    #: between no delay and the full delay
+    jitter: float = 1.0
+
+    def delay(self, retry: int) -> float:
+        """Return the delay before retry number ``retry``, counting from 1."""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (retry - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+@dataclass
+class PendingBatch(Generic[M]):
+    started: float
+    messages: List[M]
+
 
 class ProcessingContext(Generic[M]):
     def __init__(
@@ -142,23 +515,122 @@ class ProcessingContext(Generic[M]):
         self.message_cls = message_cls
         self.adapter = adapter
         self.processor = processor
+        self._batches: Dict[BatchHandler[M], PendingBatch[M]] = {}
+        self._batch_lock = threading.Lock()
+        # Messages to publish once the message (by id) that caused them has
+        # been acked
+        self._outbox: Dict[bytes, List[Tuple[str, bytes]]] = {}
+        self._outbox_lock = threading.Lock()
+        # Messages waiting to be retried, as (when, sequence, message), and
+        # how many times each (by id) has failed so far
+        self._retries: List[Tuple[float, int, M]] = []
+        self._retry_counter = itertools.count()
+        self._retry_lock = threading.Lock()
+        self._attempts: Dict[bytes, int] = {}
+        #: The most messages to hold back for retrying at once, or None for no
+        #: limit.  Set by adapters whose transport stops delivering when too
+        #: many messages are unsettled (eg: RabbitMQ's prefetch count).
+        self.max_held_retries: Optional[int] = None
+        #: Called with each message that is due to be retried, by default
+        #: :meth:`handle` on the thread calling :meth:`tick`.  Adapters which
+        #: handle messages on a pool of threads set this to use the pool.
+        self.retry_dispatcher: Optional[Callable[[M], None]] = None
+        # Created when first needed, as most processors have no timeouts
+        self.watchdog: Optional[Watchdog] = None
+        self._watchdog_lock = threading.Lock()
 
     def ack(self, message: M) -> None:
+        metrics = self.processor.metrics
+        if metrics is not None:
+            metrics.acked.inc()
+        publisher = self.processor.publisher
+        if publisher is not None:
+            # Don't ack until everything published while handling it is sent
+            publisher.flush()
         self.adapter.ack(message)
+        if len(self._outbox) > 0:
+            with self._outbox_lock:
+                outbox = self._outbox.pop(message.message_id, None)
+            if outbox is not None:
+                for destination, body in outbox:
+                    self.publish(destination, body)
+                self.publisher.flush()
 
     def nack(self, message: M) -> None:
+        metrics = self.processor.metrics
+        if metrics is not None:
+            metrics.nacked.inc()
+        self._discard_outbox(message)
         self.adapter.nack(message)
 
+    @property
+    def publisher(self) -> Publisher:
+        if self.processor.publisher is None:
+            raise RuntimeError("no publisher configured")
+        return self.processor.publisher
+
+    def publish(self, destination: str, body: bytes) -> None:
+        """Publish a message with the processor's publisher."""
+        self.publisher.publish(destination, body)
+
+    def publish_after_ack(self, message: M, destination: str, body: bytes) -> None:
+        """Publish a message once ``message`` has been acked.  If it is nacked
+        (or put on the DLQ) instead then nothing is published."""
+        if self.processor.publisher is None:
+            # Fail now, rather than after the ack
+            raise RuntimeError("no publisher configured")
+        with self._outbox_lock:
+            self._outbox.setdefault(message.message_id, []).append((destination, body))
+
+    def _discard_published(self) -> None:
+        """Drop what the current thread's handler published but has not sent,
+        as the handler failed."""
+        publisher = self.processor.publisher
+        if publisher is not None:
+            publisher.discard()
+
+    def _discard_outbox(self, message: M) -> None:
+        if len(self._outbox) > 0:
+            with self._outbox_lock:
+                self._outbox.pop(message.message_id, None)
+
+    def _dead_letter(self, message: M, reason: str) -> None:
+        assert self.processor.dlq is not None
+        metrics = self.processor.metrics
+        if metrics is not None:
+            metrics.dead_lettered.inc()
+        self.processor.dlq[message.message_id] = (message, reason)
+
     def handle(self, message: M) -> None:
-        matching_handlers = []
-        for (matcher, handler) in self.processor.handlers.keys():
-            if matcher(message):
-                logger.debug("matched %s for %s", handler, message)
-                matching_handlers.append(handler)
-            else:
-                logger.debug("did not match %s for %s", handler, message)
+        metrics = self.processor.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        try:
+            matching_handlers = self.processor.index.match(message)
+        except InvalidMessage as e:
+            if metrics is not None:
+                metrics.invalid.inc()
+            reason = f"invalid message: {e}"
+            if self.processor.dlq is not None:
+                logger.warning(
+                    "%s is invalid (%s) - acking and putting message on dlq",
+                    message,
+                    e,
+                )
+                self._dead_letter(message, reason)
+                self.ack(message)
+                return
+            logger.critical(
+                "%s is invalid (%s) and no dlq configured - crashing", message, e
+            )
+            raise
+        if metrics is not None:
+            matched = time.perf_counter()
+            metrics.matcher_seconds.observe(matched - started)
 
         if len(matching_handlers) == 0:
+            if metrics is not None:
+                metrics.no_match.inc()
             reason = "no matching handlers"
             if self.processor.dlq is not None:
                 logger.warning(
@@ -166,7 +638,7 @@ class ProcessingContext(Generic[M]):
                     "- acking and putting putting on dlq",
                     message,
                 )
-                self.processor.dlq[message.message_id] = (message, reason)
+                self._dead_letter(message, reason)
                 self.ack(message)
                 return
             else:
@@ -177,6 +649,8 @@ class ProcessingContext(Generic[M]):
                 raise RuntimeError("no matching handler")
 
         if len(matching_handlers) > 1:
+            if metrics is not None:
+                metrics.multiple_matches.inc()
             reason = "multiple matching handlers"
             if self.processor.dlq is not None:
                 logger.warning(
@@ -184,7 +658,7 @@ class ProcessingContext(Generic[M]):
                     "- acking and putting message on dlq",
                     message,
                 )
-                self.processor.dlq[message.message_id] = (message, reason)
+                self._dead_letter(message, reason)
                 self.ack(message)
                 return
             logger.critical(
@@ -194,14 +668,48 @@ class ProcessingContext(Generic[M]):
             raise RuntimeError("multiple matching handlers")
 
         (sole_matching_handler,) = matching_handlers
+        if metrics is not None:
+            handler_metrics = metrics.handler(sole_matching_handler)
+            handler_metrics.matched.inc()
+        if sole_matching_handler in self.processor.batch_policies:
+            self._add_to_batch(sole_matching_handler, message)
+            return
+
+        sole_matching_handler = cast(Handler[M], sole_matching_handler)
         logger.debug("calling %s", sole_matching_handler)
+        timeout = self.processor.timeouts.get(sole_matching_handler)
+        retry = self.processor.retry_policies.get(sole_matching_handler)
+        if retry is not None:
+            failures = self._attempts.pop(message.message_id, 0)
+        handling_context: Optional[HandlingContext[M]] = None
         try:
             with self.handling_context(message) as handling_context:
-                sole_matching_handler(message, handling_context)
+                if timeout is None:
+                    sole_matching_handler(message, handling_context)
+                else:
+                    self._call_with_timeout(
+                        sole_matching_handler, handling_context, timeout
+                    )
+        except HandlerTimeout:
+            self._discard_published()
+            if metrics is not None:
+                handler_metrics.timeouts.inc()
+            self._timed_out(sole_matching_handler, message, handling_context, timeout)
         except Exception as e:
-            if self.processor.dlq is not None:
+            self._discard_published()
+            self._discard_outbox(message)
+            if (
+                retry is not None
+                and isinstance(e, retry.exceptions)
+                and failures + 1 < retry.max_attempts
+                and not (handling_context is not None and handling_context.settled)
+            ):
+                if metrics is not None:
+                    handler_metrics.retries.inc()
+                self._retry_later(sole_matching_handler, message, e, retry, failures)
+            elif self.processor.dlq is not None:
                 reason = str(e)
-                self.processor.dlq[message.message_id] = (message, reason)
+                self._dead_letter(message, reason)
                 logger.warning(
                     "handler %s raised exception %s on message %s "
                     "- acking and putting message on dlq",
@@ -221,6 +729,126 @@ class ProcessingContext(Generic[M]):
                     exc_info=True,
                 )
                 raise
+        finally:
+            if metrics is not None:
+                finished = time.perf_counter()
+                handler_metrics.handler_seconds.observe(finished - matched)
+                handler_metrics.latency_seconds.observe(finished - started)
+
+    def _call_with_timeout(
+        self,
+        handler: Handler[M],
+        handling_context: "HandlingContext[M]",
+        timeout: float,
+    ) -> None:
+        watchdog = self.watchdog
+        if watchdog is None:
+            with self._watchdog_lock:
+                if self.watchdog is None:
+                    self.watchdog = Watchdog()
+                watchdog = self.watchdog
+        message = handling_context.message
+        watch = watchdog.watch(
+            timeout, f"handler {handler} on message {message.message_id.hex()}"
+        )
+        try:
+            handler(message, handling_context)
+        finally:
+            watch.cancel()
+
+    def _timed_out(
+        self,
+        handler: Handler[M],
+        message: M,
+        handling_context: Optional["HandlingContext[M]"],
+        timeout: Optional[float],
+    ) -> None:
+        if handling_context is not None and handling_context.settled:
+            logger.warning(
+                "handler %s timed out after %ss on %s, which it had already "
+                "acked or nacked",
+                handler,
+                timeout,
+                message,
+            )
+            return
+        self._discard_outbox(message)
+        if self.processor.dlq is not None:
+            logger.warning(
+                "handler %s timed out after %ss on %s "
+                "- acking and putting message on dlq",
+                handler,
+                timeout,
+                message,
+            )
+            self._dead_letter(message, "timeout")
+            self.ack(message)
+        else:
+            logger.warning(
+                "handler %s timed out after %ss on %s and no dlq configured "
+                "- nacking",
+                handler,
+                timeout,
+                message,
+            )
+            self.nack(message)
+
+    def _retry_later(
+        self,
+        handler: Handler[M],
+        message: M,
+        exc: Exception,
+        policy: RetryPolicy,
+        failures: int,
+    ) -> None:
+        failures += 1
+        delay = policy.delay(failures)
+        # Set before the message can be retried (by another thread)
+        self._attempts[message.message_id] = failures
+        with self._retry_lock:
+            held = (
+                self.max_held_retries is None
+                or len(self._retries) < self.max_held_retries
+            )
+            if held:
+                heapq.heappush(
+                    self._retries,
+                    (time.monotonic() + delay, next(self._retry_counter), message),
+                )
+        if not held:
+            del self._attempts[message.message_id]
+            logger.warning(
+                "handler %s raised exception %s on message %s "
+                "- too many messages waiting to be retried, nacking",
+                handler,
+                exc,
+                message,
+                exc_info=True,
+            )
+            self.nack(message)
+            return
+        logger.warning(
+            "handler %s raised exception %s on message %s "
+            "- retrying in %.3fs (attempt %d of %d)",
+            handler,
+            exc,
+            message,
+            delay,
+            failures + 1,
+            policy.max_attempts,
+            exc_info=True,
+        )
+
+    def nack_retries(self) -> None:
+        """Nack the messages that are waiting to be retried, so that the
+        transport can redeliver them."""
+        with self._retry_lock:
+            pending = [message for _, _, message in self._retries]
+            self._retries.clear()
+        for message in pending:
+            logger.warning("giving up waiting to retry %s - nacking", message)
+            self._attempts.pop(message.message_id, None)
+            self.nack(message)
 
     @contextmanager
     def handling_context(self, message: M) -> Iterator["HandlingContext[M]"]:
@@ -234,24 +862,222 @@ class ProcessingContext(Generic[M]):
             for hook in self.processor.hooks.after_handling:
                 hook(self, handling_context)
 
+    @contextmanager
+    def batch_handling_context(
+        self, batch_ctx: "BatchHandlingContext[M]"
+    ) -> Iterator["BatchHandlingContext[M]"]:
+        """Enter the batch handling context, including calling hooks."""
+        for hook in self.processor.hooks.before_batch_handling:
+            hook(self, batch_ctx)
+        try:
+            yield batch_ctx
+        finally:
+            for hook in self.processor.hooks.after_batch_handling:
+                hook(self, batch_ctx)
+
+    def _add_to_batch(self, handler: BatchHandler[M], message: M) -> None:
+        policy = self.processor.batch_policies[handler]
+        with self._batch_lock:
+            batch = self._batches.get(handler)
+            if batch is None:
+                batch = PendingBatch(time.monotonic(), [])
+                self._batches[handler] = batch
+            batch.messages.append(message)
+            if len(batch.messages) >= policy.max_size:
+                del self._batches[handler]
+            else:
+                return
+        self._handle_batch(handler, batch)
+
+    def tick(self) -> None:
+        """Do any time-based work that has fallen due, eg: handing batches
+        that have waited long enough to their handler or retrying messages.
+
+        Adapters should call this periodically, see :meth:`next_deadline`.
+
+        """
+        now = time.monotonic()
+        if len(self._retries) > 0:
+            with self._retry_lock:
+                retries = []
+                while len(self._retries) > 0 and self._retries[0][0] <= now:
+                    retries.append(heapq.heappop(self._retries)[2])
+            dispatch = self.retry_dispatcher or self.handle
+            for message in retries:
+                dispatch(message)
+        with self._batch_lock:
+            due = [
+                (handler, batch)
+                for handler, batch in self._batches.items()
+                if now - batch.started
+                >= self.processor.batch_policies[handler].max_wait
+            ]
+            for handler, _ in due:
+                del self._batches[handler]
+        for handler, batch in due:
+            self._handle_batch(handler, batch)
+
+    def next_deadline(self) -> Optional[float]:
+        """Return the number of seconds until :meth:`tick` next has work to
+        do, or None if there is no pending time-based work."""
+        deadline: Optional[float] = None
+        with self._batch_lock:
+            if len(self._batches) > 0:
+                deadline = min(
+                    batch.started + self.processor.batch_policies[handler].max_wait
+                    for handler, batch in self._batches.items()
+                )
+        if len(self._retries) > 0:
+            with self._retry_lock:
+                if len(self._retries) > 0:
+                    retry_at = self._retries[0][0]
+                    if deadline is None or retry_at < deadline:
+                        deadline = retry_at
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def flush_batches(self) -> None:
+        """Hand all pending batches to their handlers, regardless of size or
+        age."""
+        with self._batch_lock:
+            pending = list(self._batches.items())
+            self._batches.clear()
+        for handler, batch in pending:
+            self._handle_batch(handler, batch)
+
+    def _handle_batch(self, handler: BatchHandler[M], batch: PendingBatch[M]) -> None:
+        messages = batch.messages
+        logger.debug("calling %s with a batch of %d", handler, len(messages))
+        metrics = self.processor.metrics
+        if metrics is not None:
+            handler_started = time.perf_counter()
+        batch_ctx = BatchHandlingContext(messages, self)
+        try:
+            with self.batch_handling_context(batch_ctx):
+                handler(messages, batch_ctx)
+        except Exception as e:
+            self._discard_published()
+            unsettled = batch_ctx.unsettled()
+            for message in unsettled:
+                self._discard_outbox(message)
+            if self.processor.dlq is not None:
+                reason = str(e)
+                for message in unsettled:
+                    self._dead_letter(message, reason)
+                logger.warning(
+                    "batch handler %s raised exception %s on a batch of %d "
+                    "- acking and putting %d unsettled messages on dlq",
+                    handler,
+                    e,
+                    len(messages),
+                    len(unsettled),
+                    exc_info=True,
+                )
+                for message in unsettled:
+                    self.ack(message)
+            else:
+                logger.critical(
+                    "batch handler %s raised exception %s on a batch of %d"
+                    " and no dlq configured - crashing",
+                    handler,
+                    e,
+                    len(messages),
+                    exc_info=True,
+                )
+                raise
+        finally:
+            if metrics is not None:
+                handler_metrics = metrics.handler(handler)
+                handler_metrics.handler_seconds.observe(
+                    time.perf_counter() - handler_started
+                )
+                # Measured from the arrival of the first message in the batch
+                latency = time.monotonic() - batch.started
+                for _ in messages:
+                    handler_metrics.latency_seconds.observe(latency)
+
 
 class HandlingContext(Generic[M]):
+    __slots__ = ("message", "processing_ctx", "settled", "_state")
+
     def __init__(self, message: M, processing_ctx: ProcessingContext[M]) -> None:
-        self.state = State()
         self.message = message
         self.processing_ctx = processing_ctx
+        #: Whether the message has been acked or nacked
+        self.settled = False
+        self._state: Optional[State] = None
+
+    @property
+    def state(self) -> State:
+        # Created on first use as most handlers never touch it
+        if self._state is None:
+            self._state = State()
+        return self._state
 
     def ack(self) -> None:
+        self.settled = True
         self.processing_ctx.ack(self.message)
 
     def nack(self) -> None:
+        self.settled = True
         self.processing_ctx.nack(self.message)
 
+    def publish(self, destination: str, body: bytes, after_ack: bool = False) -> None:
+        """Publish a message with the processor's publisher.
+
+        By default the message is sent before this message is acked.  With
+        ``after_ack`` it is held back until this message is acked and dropped
+        if it is not.
+
+        """
+        if after_ack:
+            self.processing_ctx.publish_after_ack(self.message, destination, body)
+        else:
+            self.processing_ctx.publish(destination, body)
+
+
+class BatchHandlingContext(Generic[M]):
+    """The context passed to batch handlers.
+
+    Messages can be acked or nacked individually by passing them to
+    :meth:`ack`/:meth:`nack`, or all at once by passing nothing, in which case
+    only the messages not already acked or nacked are affected.
+
+    """
+
+    def __init__(self, messages: List[M], processing_ctx: ProcessingContext[M]) -> None:
+        self.state = State()
+        self.messages = messages
+        self.processing_ctx = processing_ctx
+        self._settled: Set[bytes] = set()
+
+    def unsettled(self) -> List[M]:
+        """Return the messages that have been neither acked nor nacked."""
+        return [m for m in self.messages if m.message_id not in self._settled]
+
+    def ack(self, message: Optional[M] = None) -> None:
+        for m in self.unsettled() if message is None else [message]:
+            self._settled.add(m.message_id)
+            self.processing_ctx.ack(m)
+
+    def nack(self, message: Optional[M] = None) -> None:
+        for m in self.unsettled() if message is None else [message]:
+            self._settled.add(m.message_id)
+            self.processing_ctx.nack(m)
+
+    def publish(self, destination: str, body: bytes) -> None:
+        """Publish a message with the processor's publisher, before the batch
+        is acked."""
+        self.processing_ctx.publish(destination, body)
+
 
 ProcessingHook = Callable[[ProcessingContext[M]], None]
 
 HandlingHook = Callable[[ProcessingContext[M], HandlingContext[M]], None]
 
+BatchHandlingHook = Callable[[ProcessingContext[M], BatchHandlingContext[M]], None]
+
 
 @dataclass
 class ProcessorHooks(Generic[M]):
@@ -259,25 +1085,95 @@ class ProcessorHooks(Generic[M]):
     after_processing: MutableSequence[ProcessingHook[M]]
     before_handling: MutableSequence[HandlingHook[M]]
     after_handling: MutableSequence[HandlingHook[M]]
+    before_batch_handling: MutableSequence[BatchHandlingHook[M]] = field(
+        default_factory=list
+    )
+    after_batch_handling: MutableSequence[BatchHandlingHook[M]] = field(
+        default_factory=list
+    )
 
 
 class Processor(Generic[M]):
     def __init__(self) -> None:
         self.matchers: Set[Matcher[M]] = set()
-        self.handlers: MutableMapping[Tuple[Matcher[M], Handler[M]], None] = {}
+        self.handlers: MutableMapping[Tuple[Matcher[M], AnyHandler[M]], None] = {}
+        self.batch_policies: Dict[BatchHandler[M], BatchPolicy] = {}
+        self.timeouts: Dict[Handler[M], float] = {}
+        self.retry_policies: Dict[Handler[M], RetryPolicy] = {}
         self.dlq: Optional[DLQ[M]] = None
         self.hooks: ProcessorHooks[M] = ProcessorHooks([], [], [], [])
+        self.index: HandlerIndex[M, AnyHandler[M]] = HandlerIndex()
+        self.publisher: Optional[Publisher] = None
+        self.metrics: Optional[ProcessorMetrics] = None
+
+    def _register(self, matcher: Matcher[M], fn: AnyHandler[M]) -> None:
+        if matcher in self.matchers:
+            (fn1,) = [h for (m, h) in self.handlers if m == matcher]
+            raise RuntimeError(
+                f"two handlers with the same matcher: {fn} and {fn1} share {matcher}"
+            )
+        else:
+            self.matchers.add(matcher)
+        self.handlers[(matcher, fn)] = None
+        self.index.add(matcher, fn)
+        if self.metrics is not None:
+            self.metrics.handler(fn)
+
+    def handle_for(
+        self,
+        matcher: Matcher[M],
+        timeout: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> Callable[[Handler[M]], None]:
+        """Register a handler for matching messages.
+
+        If ``timeout`` is given and the handler runs for longer than that
+        many seconds, its stack is logged and
+        :class:`missive.watchdog.HandlerTimeout` is raised inside it.  The
+        message is then put on the DLQ with the reason ``"timeout"`` or, if
+        there is no DLQ, nacked.  See :mod:`missive.watchdog` for the limits
+        of interrupting a handler.
+
+        If ``retry`` is given, messages for which the handler raises one of
+        the policy's exceptions are held back (neither acked nor nacked) and
+        handled again after a delay, while other messages carry on being
+        processed.  Once ``max_attempts`` have failed the message follows the
+        normal DLQ policy.  Messages still waiting when processing stops are
+        nacked.  Held messages are unsettled, so they count against limits
+        like RabbitMQ's prefetch count: beyond
+        :attr:`ProcessingContext.max_held_retries` they are nacked for the
+        transport to redeliver instead.
+
+        """
 
-    def handle_for(self, matcher: Matcher[M]) -> Callable[[Handler[M]], None]:
         def wrapper(fn: Handler[M]) -> None:
-            if matcher in self.matchers:
-                (fn1,) = [h for (m, h) in self.handlers if m == matcher]
-                raise RuntimeError(
-                    f"two handlers with the same matcher: {fn} and {fn1} share {matcher}"
-                )
-            else:
-                self.matchers.add(matcher)
-            self.handlers[(matcher, fn)] = None
+            self._register(matcher, fn)
+            if timeout is not None:
+                self.timeouts[fn] = timeout
+            if retry is not None:
+                self.retry_policies[fn] = retry
+
+        return wrapper
+
+    def handle_batch_for(
+        self, matcher: Matcher[M], max_size: int, max_wait: float
+    ) -> Callable[[BatchHandler[M]], None]:
+        """Register a handler that is passed lists of matching messages.
+
+        Matching messages are accumulated until either ``max_size`` are
+        pending or the first of them has waited for ``max_wait`` seconds, at
+        which point the handler is called with the list and a
+        :class:`BatchHandlingContext`.  Any partial batch is handed over when
+        processing stops.
+
+        If the handler raises an exception, the messages it has not already
+        acked or nacked follow the normal DLQ policy.
+
+        """
+
+        def wrapper(fn: BatchHandler[M]) -> None:
+            self._register(matcher, fn)
+            self.batch_policies[fn] = BatchPolicy(max_size, max_wait)
 
         return wrapper
 
@@ -293,9 +1189,24 @@ class Processor(Generic[M]):
     def after_handling(self, hook: HandlingHook[M]) -> None:
         self.hooks.after_handling.append(hook)
 
+    def before_batch_handling(self, hook: BatchHandlingHook[M]) -> None:
+        self.hooks.before_batch_handling.append(hook)
+
+    def after_batch_handling(self, hook: BatchHandlingHook[M]) -> None:
+        self.hooks.after_batch_handling.append(hook)
+
     def set_dlq(self, dlq: DLQ[M]) -> None:
         self.dlq = dlq
 
+    def set_publisher(self, publisher: Publisher) -> None:
+        self.publisher = publisher
+
+    def set_metrics(self, sink: Sink) -> None:
+        """Record metrics about message handling to ``sink``, see
+        :mod:`missive.metrics`."""
+        self.metrics = ProcessorMetrics(sink)
+        self.metrics.bind_handlers(fn for (_, fn) in self.handlers)
+
     @contextmanager
     def context(
         self, message_cls: Type[M], adapter: Adapter[M]
@@ -306,11 +1217,17 @@ class Processor(Generic[M]):
             hook(processing_ctx)
         try:
             yield processing_ctx
+            processing_ctx.flush_batches()
+            processing_ctx.nack_retries()
+            if self.publisher is not None:
+                self.publisher.flush()
         finally:
             # Ensure that after hooks are still called in the case of an
             # uncaught exception
             for hook in self.hooks.after_processing:
                 hook(processing_ctx)
+            if processing_ctx.watchdog is not None:
+                processing_ctx.watchdog.stop()
 
     @contextmanager
     def test_client(self) -> Iterator[TestAdapter[M]]:
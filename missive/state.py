@@ -4,6 +4,8 @@ from typing import MutableMapping, Any
 class State:
     """General purpose dumping ground for processor/handler state"""
 
+    __slots__ = ("_state",)
+
     def __init__(self) -> None:
         super(State, self).__setattr__("_state", {})
 
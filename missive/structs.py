@@ -0,0 +1,176 @@
+"""Decoding JSON into typed schemas, for :class:`missive.messages.StructMessage`.
+
+Schemas are dataclasses or (if msgspec is installed) ``msgspec.Struct``
+subclasses.  When msgspec is installed it decodes and validates in a single
+pass.  Otherwise the JSON is parsed (see :mod:`missive.json_decoding`) and
+then checked against the dataclass's type annotations.  In both cases
+validation failures raise :class:`missive.InvalidMessage` with a reason that
+includes the path to the bad value, eg::
+
+    Expected `int`, got `str` - at `$.items[0].quantity`
+
+"""
+from typing import Any, Callable, Dict, List, Tuple, Union
+import dataclasses
+import typing
+
+from . import json_decoding
+from .missive import InvalidMessage
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+_decoders: Dict[Any, Callable[[bytes], Any]] = {}
+
+_TYPE_NAMES = {
+    int: "int",
+    float: "float",
+    str: "str",
+    bool: "bool",
+    type(None): "null",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+}
+
+
+def decode(schema: Any, raw_data: bytes) -> Any:
+    """Decode and validate ``raw_data`` as an instance of ``schema``."""
+    try:
+        decoder = _decoders[schema]
+    except KeyError:
+        decoder = _decoders[schema] = _make_decoder(schema)
+    return decoder(raw_data)
+
+
+def _make_decoder(schema: Any) -> Callable[[bytes], Any]:
+    if msgspec is not None:
+        msgspec_decoder = msgspec.json.Decoder(schema)
+
+        def decode_with_msgspec(raw_data: bytes) -> Any:
+            try:
+                return msgspec_decoder.decode(raw_data)
+            except msgspec.DecodeError as e:
+                raise InvalidMessage(str(e)) from e
+
+        return decode_with_msgspec
+
+    if not dataclasses.is_dataclass(schema):
+        raise TypeError(f"schema must be a dataclass, not {schema!r}")
+
+    def decode_with_dataclasses(raw_data: bytes) -> Any:
+        try:
+            value = json_decoding.loads(raw_data)
+        except ValueError as e:
+            raise InvalidMessage(f"invalid JSON: {e}") from e
+        return _convert(value, schema, "$")
+
+    return decode_with_dataclasses
+
+
+def _mismatch(expected: str, value: Any, path: str) -> InvalidMessage:
+    got = _TYPE_NAMES.get(type(value), type(value).__name__)
+    return InvalidMessage(f"Expected `{expected}`, got `{got}` - at `{path}`")
+
+
+def _type_name(tp: Any) -> str:
+    if dataclasses.is_dataclass(tp):
+        return "object"
+    return _TYPE_NAMES.get(tp, getattr(tp, "__name__", repr(tp)))
+
+
+def _convert(value: Any, tp: Any, path: str) -> Any:
+    if tp is Any:
+        return value
+    if dataclasses.is_dataclass(tp):
+        return _convert_dataclass(value, tp, path)
+
+    # __origin__ rather than typing.get_origin, which needs Python 3.8
+    origin = getattr(tp, "__origin__", None)
+    args: Tuple[Any, ...] = getattr(tp, "__args__", ())
+    if origin is Union:
+        for arg in args:
+            try:
+                return _convert(value, arg, path)
+            except InvalidMessage:
+                continue
+        expected = " | ".join(_type_name(arg) for arg in args)
+        raise _mismatch(expected, value, path)
+    if origin is getattr(typing, "Literal", object()):
+        if value not in args:
+            raise InvalidMessage(f"Invalid enum value {value!r} - at `{path}`")
+        return value
+    if origin in (list, tuple, set, frozenset):
+        if not isinstance(value, list):
+            raise _mismatch("array", value, path)
+        if origin is tuple and not (len(args) == 2 and args[1] is Ellipsis):
+            if len(args) != len(value):
+                raise InvalidMessage(
+                    f"Expected `array` of length {len(args)} - at `{path}`"
+                )
+            return tuple(
+                _convert(item, arg, f"{path}[{i}]")
+                for i, (item, arg) in enumerate(zip(value, args))
+            )
+        item_type = args[0] if len(args) > 0 else Any
+        items = [
+            _convert(item, item_type, f"{path}[{i}]") for i, item in enumerate(value)
+        ]
+        return items if origin is list else origin(items)
+    if origin is dict:
+        if not isinstance(value, dict):
+            raise _mismatch("object", value, path)
+        value_type = args[1] if len(args) == 2 else Any
+        return {k: _convert(v, value_type, f"{path}[{k!r}]") for k, v in value.items()}
+
+    if tp is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        raise _mismatch("float", value, path)
+    if tp is int and isinstance(value, bool):
+        raise _mismatch("int", value, path)
+    if tp is tuple:
+        if not isinstance(value, list):
+            raise _mismatch("array", value, path)
+        return tuple(value)
+    if isinstance(tp, type) and not isinstance(value, tp):
+        raise _mismatch(_type_name(tp), value, path)
+    return value
+
+
+_fields: Dict[Any, List[Tuple[str, Any, bool]]] = {}
+
+
+def _dataclass_fields(schema: Any) -> List[Tuple[str, Any, bool]]:
+    """Return (name, type, required) for the init fields of a dataclass."""
+    try:
+        return _fields[schema]
+    except KeyError:
+        pass
+    hints = typing.get_type_hints(schema)
+    rv = _fields[schema] = [
+        (
+            field.name,
+            hints[field.name],
+            field.default is dataclasses.MISSING
+            and field.default_factory is dataclasses.MISSING,
+        )
+        for field in dataclasses.fields(schema)
+        if field.init
+    ]
+    return rv
+
+
+def _convert_dataclass(value: Any, schema: Any, path: str) -> Any:
+    if not isinstance(value, dict):
+        raise _mismatch("object", value, path)
+    kwargs = {}
+    for name, tp, required in _dataclass_fields(schema):
+        if name in value:
+            kwargs[name] = _convert(value[name], tp, f"{path}.{name}")
+        elif required:
+            suffix = "" if path == "$" else f" - at `{path}`"
+            raise InvalidMessage(f"Object missing required field `{name}`{suffix}")
+    return schema(**kwargs)
@@ -0,0 +1,121 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+import logging
+import os
+import signal
+import sys
+
+from missive.shutdown_handler import ShutdownHandler
+
+logger = logging.getLogger(__name__)
+
+_SHUTDOWN_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+
+class Supervisor:
+    """Runs copies of an adapter in a number of forked worker processes.
+
+    Each worker calls ``adapter_factory`` with its index (from zero up to
+    ``workers - 1``) and runs the adapter that is returned.  The index can be
+    used to pick a shard - for example a different input file for each
+    :class:`missive.adapters.stdin.StdinAdapter`.  Adapters are created after
+    the fork so that no connections are shared between processes.
+
+    Workers which exit with a failure are restarted after ``restart_delay``
+    seconds, workers which exit successfully are not.  SIGINT and SIGTERM
+    received by the supervisor are passed on to every worker and the
+    supervisor then waits for them to drain and exit.
+
+    :param adapter_factory: Called in each worker process to create the
+        adapter to run.
+    :param workers: The number of worker processes.
+    :param restart_delay: How long to wait before restarting a failed worker.
+
+    """
+
+    def __init__(
+        self,
+        adapter_factory: Callable[[int], Any],
+        workers: int,
+        restart_delay: float = 1.0,
+    ) -> None:
+        self.adapter_factory = adapter_factory
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.shutdown_handler = ShutdownHandler(callback=self._forward_signal)
+
+        #: Mapping of pid to worker index for the running workers
+        self.children: Dict[int, int] = {}
+
+    def _forward_signal(self, signum: int) -> None:
+        for pid in list(self.children):
+            logger.info("sending signal %d to worker %d", signum, pid)
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self, index: int) -> None:
+        # Signals are held back over the fork so that the child can't run the
+        # supervisor's handler before resetting it, and the parent doesn't
+        # forward them until the child is recorded
+        old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, _SHUTDOWN_SIGNALS)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker(index, old_mask)
+            self.children[pid] = index
+            logger.info("started worker %d as pid %d", index, pid)
+            # A signal may have arrived before they were blocked
+            if self.shutdown_handler.should_exit():
+                os.kill(pid, signal.SIGTERM)
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+    def _run_worker(self, index: int, mask: Iterable[int]) -> None:
+        exit_code = 1
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            adapter = self.adapter_factory(index)
+            shutdown_handler = getattr(adapter, "shutdown_handler", None)
+            if shutdown_handler is not None:
+                shutdown_handler.enable()
+            adapter.run()
+            exit_code = 0
+        except BaseException:
+            logger.exception("worker %d crashed", index)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def run(self) -> None:
+        """Start the workers and supervise them until they have all exited."""
+        self.shutdown_handler.enable()
+        for worker in range(self.workers):
+            self._spawn(worker)
+
+        while len(self.children) > 0:
+            pid, status = os.waitpid(-1, 0)
+            index: Optional[int] = self.children.pop(pid, None)
+            if index is None:
+                logger.debug("reaped pid %d, which is not a worker", pid)
+                continue
+            failed = not (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0)
+            if self.shutdown_handler.should_exit():
+                logger.info("worker %d (pid %d) has exited", index, pid)
+            elif not failed:
+                logger.info("worker %d (pid %d) has finished", index, pid)
+            else:
+                logger.error(
+                    "worker %d (pid %d) failed with status %d, restarting in %ss",
+                    index,
+                    pid,
+                    status,
+                    self.restart_delay,
+                )
+                self.shutdown_handler.flag.wait(self.restart_delay)
+                if not self.shutdown_handler.should_exit():
+                    self._spawn(index)
+        logger.info("all workers have exited")
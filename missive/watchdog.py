@@ -0,0 +1,205 @@
+"""Enforces time limits on handlers.
+
+A :class:`Watchdog` runs a single background thread that sleeps until the
+earliest deadline of the handlers it is watching.  When a handler overruns,
+its stack is logged and :class:`HandlerTimeout` is raised inside the
+handler's thread.
+
+The exception is raised asynchronously, so it takes effect at the handler's
+next Python bytecode.  A handler that is blocked in C code (eg: reading from
+a socket with no timeout) is only interrupted once that call returns - but
+the logged stack shows where it is stuck.
+
+Under gevent (when :mod:`threading` has been monkey-patched, eg: in gunicorn's
+gevent workers) handlers run in greenlets, which cannot be interrupted from
+another thread.  Instead a :class:`gevent.Timeout` raises
+:class:`HandlerTimeout`, which only happens when the handler yields to the
+hub (eg: waits on I/O or sleeps) - a handler that is busy in Python code is
+not interrupted.  No stack is logged, as the handler is interrupted where it
+was waiting.
+
+"""
+from logging import getLogger
+from typing import Any, List, Optional, Tuple, Type
+import ctypes
+import heapq
+import itertools
+import sys
+import threading
+import time
+import traceback
+
+logger = getLogger(__name__)
+
+# Cancelled watches are left in the heap until they reach the top, unless
+# they come to outnumber the live ones by this much
+_COMPACT_AFTER = 1024
+
+
+class HandlerTimeout(BaseException):
+    """Raised inside a handler that has run for longer than its timeout.
+
+    This is a BaseException so that handlers which catch Exception do not
+    swallow it.
+
+    """
+
+
+def _set_async_exc(thread_id: int, exc: Optional[Type[BaseException]]) -> None:
+    # Passing NULL (None) clears any exception that has not been raised yet
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), None if exc is None else ctypes.py_object(exc)
+    )
+
+
+def _gevent_patched() -> bool:
+    """Whether gevent has monkey-patched threading, in which case thread ids
+    are those of greenlets."""
+    # gevent is only checked for if it has been imported
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and bool(monkey.is_module_patched("threading"))
+
+
+class Watch:
+    """A handler call that is being watched, see :meth:`Watchdog.watch`."""
+
+    __slots__ = (
+        "watchdog",
+        "thread_id",
+        "deadline",
+        "description",
+        "done",
+        "fired",
+        "gevent_timeout",
+    )
+
+    def __init__(
+        self,
+        watchdog: "Watchdog",
+        thread_id: int,
+        deadline: float,
+        description: str,
+        gevent_timeout: Any = None,
+    ) -> None:
+        self.watchdog = watchdog
+        self.thread_id = thread_id
+        self.deadline = deadline
+        self.description = description
+        self.done = False
+        self.fired = False
+        self.gevent_timeout = gevent_timeout
+
+    def cancel(self) -> None:
+        """Stop watching, as the handler has returned.  This must be called
+        from the handler's thread."""
+        if self.gevent_timeout is not None:
+            self.gevent_timeout.close()
+            self.done = True
+        else:
+            self.watchdog._cancel(self)
+
+
+class Watchdog:
+    """Raises :class:`HandlerTimeout` in handlers that overrun.
+
+    The thread is started on the first call to :meth:`watch`.
+
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, Watch]] = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def watch(self, timeout: float, description: str) -> Watch:
+        """Start watching the current thread, which must call
+        :meth:`Watch.cancel` within ``timeout`` seconds."""
+        if _gevent_patched():
+            import gevent
+
+            gevent_timeout = gevent.Timeout(timeout, HandlerTimeout)
+            gevent_timeout.start()
+            return Watch(
+                self,
+                threading.get_ident(),
+                time.monotonic() + timeout,
+                description,
+                gevent_timeout,
+            )
+        watch = Watch(
+            self, threading.get_ident(), time.monotonic() + timeout, description
+        )
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="missive-watchdog", daemon=True
+                )
+                self._thread.start()
+            heapq.heappush(self._heap, (watch.deadline, next(self._counter), watch))
+            if self._heap[0][2] is watch:
+                # The watchdog is sleeping until a later deadline
+                self._cond.notify()
+        return watch
+
+    def stop(self) -> None:
+        """Stop the thread.  Handlers still being watched are left alone."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _cancel(self, watch: Watch) -> None:
+        # The lock makes this atomic with respect to firing: either the watch
+        # never fires or the exception is raised before this returns
+        with self._cond:
+            watch.done = True
+            if watch.fired:
+                # The exception may still be pending - it must not be raised
+                # once the handler has returned
+                _set_async_exc(watch.thread_id, None)
+                return
+            self._cancelled += 1
+            if self._cancelled > _COMPACT_AFTER and self._cancelled * 2 > len(
+                self._heap
+            ):
+                self._heap = [entry for entry in self._heap if not entry[2].done]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                timeout: Optional[float] = None
+                fired: List[Tuple[Watch, str]] = []
+                while len(self._heap) > 0:
+                    deadline, _, watch = self._heap[0]
+                    if watch.done:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    elif deadline <= now:
+                        heapq.heappop(self._heap)
+                        fired.append((watch, self._fire(watch)))
+                    else:
+                        timeout = deadline - now
+                        break
+                if len(fired) == 0:
+                    self._cond.wait(timeout)
+            for watch, stack in fired:
+                logger.error("%s timed out, it was at:\n%s", watch.description, stack)
+
+    def _fire(self, watch: Watch) -> str:
+        """Raise the exception in the handler's thread and return its stack.
+        Must be called with the lock held."""
+        watch.fired = True
+        frame = sys._current_frames().get(watch.thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        _set_async_exc(watch.thread_id, HandlerTimeout)
+        return stack
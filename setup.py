@@ -9,9 +9,21 @@ setup(
     package_data={"missive": ["py.typed"]},
     include_package_data=True,
     zip_safe=True,
-    install_requires=["flask", "redis", "kombu",],
+    install_requires=["redis", "kombu",],
+    entry_points={"console_scripts": ["missive-replay=missive.dlq.replay:main"]},
     extras_require={
-        "tests": ["pytest~=5.3.1", "pytest-cov~=2.8.1", "freezegun==0.3.15"],
+        "asyncio": ["aio-pika"],
+        "zstd": ["zstandard"],
+        "json": ["orjson"],
+        "msgspec": ["msgspec"],
+        "tests": [
+            "pytest~=5.3.1",
+            "pytest-cov~=2.8.1",
+            "freezegun==0.3.15",
+            "fakeredis",
+            "gevent",
+            "aio-pika",
+        ],
         "dev": [
             "sphinx~=2.4.3",
             "wheel~=0.33.6",
@@ -0,0 +1,90 @@
+from typing import cast
+import asyncio
+
+import missive as m
+from missive.aio import AsyncProcessor
+from missive.adapters.asgi import ASGIAdapter
+
+from ..matchers import always
+
+
+async def post(app, body):
+    events = [
+        {"type": "http.request", "body": body[:2], "more_body": True},
+        {"type": "http.request", "body": body[2:], "more_body": False},
+    ]
+    sent = []
+
+    async def receive():
+        return events.pop(0)
+
+    async def send(event):
+        sent.append(event)
+
+    scope = {"type": "http", "method": "POST", "path": "/"}
+    await app(scope, receive, send)
+    assert dict(sent[0]["headers"])[b"content-length"] == str(
+        len(sent[1]["body"])
+    ).encode("ascii")
+    return sent[0]["status"], sent[1]["body"]
+
+
+def test_acking():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+
+    message_received = None
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        nonlocal message_received
+        message_received = message
+        await ctx.ack()
+
+    app = ASGIAdapter(m.RawMessage, processor)
+    status, body = asyncio.run(post(app, b"hello"))
+
+    assert status == 200
+    assert body == b'{"result": "ack"}'
+    assert cast(m.Message, message_received).raw_data == b"hello"
+
+
+def test_nacking():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        await ctx.nack()
+
+    app = ASGIAdapter(m.RawMessage, processor)
+    status, body = asyncio.run(post(app, b"hello"))
+
+    assert status == 500
+    assert body == b'{"result": "nack"}'
+
+
+def test_lifespan():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+    calls = []
+
+    @processor.before_processing
+    async def before_processing(proc_ctx):
+        calls.append("startup")
+
+    @processor.after_processing
+    async def after_processing(proc_ctx):
+        calls.append("shutdown")
+
+    app = ASGIAdapter(m.RawMessage, processor)
+    events = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return events.pop(0)
+
+    async def send(event):
+        sent.append(event["type"])
+
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+
+    assert calls == ["startup", "shutdown"]
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
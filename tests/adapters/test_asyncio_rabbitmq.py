@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import random
+import signal
+import string
+from typing import Dict
+
+import kombu
+import pytest
+
+import missive as m
+from missive.aio import AsyncProcessor
+from missive.adapters.asyncio_rabbitmq import AsyncRabbitMQAdapter
+
+from ..matchers import always
+
+RABBITMQ_URL = "amqp:///missive-test"
+
+
+@pytest.fixture(scope="module")
+def connection():
+    with kombu.Connection(RABBITMQ_URL) as connection:
+        yield connection
+
+
+@pytest.fixture(scope="module")
+def channel(connection):
+    with connection.channel() as channel:
+        yield channel
+
+
+@pytest.fixture(scope="function")
+def random_queue(channel):
+    postfix = "".join(random.choice(string.ascii_letters) for _ in range(5))
+    # Durable, as the adapter declares its queues durable
+    queue = kombu.Queue("test-%s" % postfix, channel=channel, durable=True)
+    queue.declare()
+    yield queue
+    queue.delete()
+
+
+@pytest.fixture
+def reset_signals():
+    old_handlers = {
+        sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)
+    }
+    yield
+    for sig, handler in old_handlers.items():
+        signal.signal(sig, handler)
+
+
+def make_adapter(processor, queue):
+    return AsyncRabbitMQAdapter(
+        m.JSONMessage,
+        processor,
+        [queue.name],
+        url=RABBITMQ_URL,
+        disable_shutdown_handler=True,
+        poll_interval=0.05,
+    )
+
+
+def publish(channel, queue, event):
+    kombu.Producer(channel).publish(
+        json.dumps(event).encode("utf-8"), routing_key=queue.name
+    )
+
+
+def run(adapted):
+    asyncio.run(asyncio.wait_for(adapted.run(), timeout=5))
+
+
+def test_message_receipt(channel, random_queue):
+    processor: AsyncProcessor[m.JSONMessage] = AsyncProcessor()
+
+    received = []
+
+    @processor.handle_for(always)
+    async def catch_all(message, ctx):
+        received.append(message.get_json())
+        await ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    adapted = make_adapter(processor, random_queue)
+    publish(channel, random_queue, {"test-event": True})
+    run(adapted)
+
+    assert received == [{"test-event": True}]
+    # Assert nothing left on the queue
+    assert random_queue.get() is None
+
+
+def test_nack(channel, random_queue):
+    processor: AsyncProcessor[m.JSONMessage] = AsyncProcessor()
+
+    @processor.handle_for(always)
+    async def catch_all(message, ctx):
+        await ctx.nack()
+        adapted.shutdown_handler.set_flag()
+
+    adapted = make_adapter(processor, random_queue)
+    publish(channel, random_queue, {"test-event": True})
+    run(adapted)
+
+    # Assert it's left on the queue
+    message = random_queue.get()
+    assert message.delivery_info["redelivered"]
+    message.ack()  # clear it
+
+
+def test_handler_exceptions_go_to_dlq(channel, random_queue):
+    processor: AsyncProcessor[m.JSONMessage] = AsyncProcessor()
+    dlq: Dict = {}
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(always)
+    async def broken(message, ctx):
+        adapted.shutdown_handler.set_flag()
+        raise RuntimeError("bad message")
+
+    adapted = make_adapter(processor, random_queue)
+    publish(channel, random_queue, {"test-event": True})
+    run(adapted)
+
+    ((message, reason),) = dlq.values()
+    assert message.get_json() == {"test-event": True}
+    assert reason == "bad message"
+    # Acked, so not left on the queue
+    assert random_queue.get() is None
+
+
+def test_stops_on_sigterm(channel, random_queue, reset_signals):
+    processor: AsyncProcessor[m.JSONMessage] = AsyncProcessor()
+
+    received = []
+
+    @processor.handle_for(always)
+    async def catch_all(message, ctx):
+        received.append(message.get_json())
+        await ctx.ack()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    adapted = AsyncRabbitMQAdapter(
+        m.JSONMessage, processor, [random_queue.name], url=RABBITMQ_URL
+    )
+    publish(channel, random_queue, {"n": 1})
+    run(adapted)
+
+    assert received == [{"n": 1}]
+    assert adapted.shutdown_handler.should_exit()
+
+    # Nothing more is consumed once shut down
+    publish(channel, random_queue, {"n": 2})
+    assert json.loads(random_queue.get(no_ack=True).body) == {"n": 2}
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import signal
+
+import fakeredis.aioredis
+import pytest
+
+import missive as m
+from missive.aio import AsyncProcessor
+from missive.adapters.asyncio_redis import AsyncRedisPubSubAdapter
+
+
+@pytest.fixture
+def reset_signals():
+    old_handlers = {
+        sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)
+    }
+    yield
+    for sig, handler in old_handlers.items():
+        signal.signal(sig, handler)
+
+
+def test_stops_on_sigterm(reset_signals):
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+    received = []
+
+    @processor.handle_for(lambda m: True)
+    async def handler(message, ctx):
+        received.append(message.raw_data)
+        await ctx.ack()
+
+    adapter = AsyncRedisPubSubAdapter(
+        m.RawMessage, processor, ["test-channel"], poll_interval=0.05
+    )
+    adapter.redis = fakeredis.aioredis.FakeRedis()
+
+    async def main():
+        run = asyncio.ensure_future(adapter.run())
+        while await adapter.redis.publish("test-channel", b"hello") == 0:
+            await asyncio.sleep(0.01)
+        while len(received) == 0:
+            await asyncio.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(run, timeout=5)
+
+    asyncio.run(main())
+    assert received == [b"hello"]
+    assert adapter.shutdown_handler.should_exit()
@@ -2,9 +2,11 @@ import json
 import threading
 import time
 import os
+from io import BytesIO
 
 import missive
 from missive.adapters.stdin import StdinAdapter
+from missive.framing import LengthPrefixedFraming, NulFraming
 
 from ..matchers import always
 
@@ -37,3 +39,61 @@ def test_from_file():
     thread.join(timeout=1)
 
     assert flag == test_event
+
+
+def run_to_end(data, **kwargs):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+    received = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        received.append(message.raw_data)
+        ctx.ack()
+
+    StdinAdapter(missive.RawMessage, processor, BytesIO(data), **kwargs).run()
+    return received
+
+
+def test_lines_across_reads():
+    lines = [b"x" * n for n in range(1, 40)]
+
+    received = run_to_end(b"\n".join(lines) + b"\n", buffer_size=16)
+
+    assert received == lines
+
+
+def test_blank_lines_and_missing_final_newline():
+    assert run_to_end(b"a\r\n\nb\n\nc") == [b"a", b"b", b"c"]
+
+
+def test_nul_framing():
+    received = run_to_end(b"a\nb\0c\0", framing=NulFraming())
+    assert received == [b"a\nb", b"c"]
+
+
+def test_length_prefixed_framing():
+    framing = LengthPrefixedFraming()
+    bodies = [b"\n\0", b"y" * 100]
+
+    received = run_to_end(b"".join(framing.frame(b) for b in bodies), framing=framing)
+
+    assert received == bodies
+
+
+def test_exits_at_end_of_pipe():
+    r_pipe, w_pipe = os.pipe()
+    os.write(w_pipe, b"a\nb\n")
+    os.close(w_pipe)
+
+    with os.fdopen(r_pipe, mode="rb") as r_fl:
+        processor: missive.Processor[missive.RawMessage] = missive.Processor()
+        received = []
+
+        @processor.handle_for(always)
+        def catch_all(message, ctx):
+            received.append(message.raw_data)
+            ctx.ack()
+
+        StdinAdapter(missive.RawMessage, processor, r_fl).run()
+
+    assert received == [b"a", b"b"]
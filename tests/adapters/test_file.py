@@ -0,0 +1,183 @@
+import json
+from typing import List, Optional
+
+import pytest
+
+import missive
+from missive.adapters.file import FileAdapter
+from missive.framing import LengthPrefixedFraming
+
+from ..matchers import always
+
+
+def make_processor(received, stop_after=None):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        assert isinstance(message.raw_data, bytes)
+        received.append(message.get_json()["i"])
+        ctx.ack()
+        if stop_after is not None and len(received) == stop_after:
+            assert adapter is not None
+            adapter.shutdown_handler.set_flag()
+
+    adapter: Optional[FileAdapter[missive.JSONMessage]] = None
+
+    def bind(a):
+        nonlocal adapter
+        adapter = a
+        return a
+
+    return processor, bind
+
+
+def write_archive(path, numbers, framing=None):
+    with open(path, "wb") as f:
+        for i in numbers:
+            body = json.dumps({"i": i}).encode("utf-8")
+            f.write(body + b"\n" if framing is None else framing.frame(body))
+    return str(path)
+
+
+def test_reads_files_in_order(tmpdir):
+    paths = [
+        write_archive(tmpdir.join("a.ndjson"), range(0, 5)),
+        write_archive(tmpdir.join("b.ndjson"), range(5, 10)),
+    ]
+    received: List[int] = []
+    processor, bind = make_processor(received)
+
+    bind(FileAdapter(missive.JSONMessage, processor, paths)).run()
+
+    assert received == list(range(10))
+
+
+def test_length_prefixed(tmpdir):
+    framing = LengthPrefixedFraming()
+    path = write_archive(tmpdir.join("a.bin"), range(5), framing)
+    received: List[int] = []
+    processor, bind = make_processor(received)
+
+    bind(FileAdapter(missive.JSONMessage, processor, [path], framing=framing)).run()
+
+    assert received == list(range(5))
+
+
+def test_resumes_from_checkpoint(tmpdir):
+    path = write_archive(tmpdir.join("a.ndjson"), range(10))
+    checkpoint = str(tmpdir.join("checkpoint.json"))
+
+    received: List[int] = []
+    processor, bind = make_processor(received, stop_after=4)
+    bind(
+        FileAdapter(missive.JSONMessage, processor, [path], checkpoint_path=checkpoint)
+    ).run()
+    assert received == [0, 1, 2, 3]
+
+    received = []
+    processor, bind = make_processor(received)
+    bind(
+        FileAdapter(missive.JSONMessage, processor, [path], checkpoint_path=checkpoint)
+    ).run()
+    assert received == [4, 5, 6, 7, 8, 9]
+
+
+def test_checkpoint_waits_for_unacked_messages(tmpdir):
+    path = write_archive(tmpdir.join("a.ndjson"), range(3))
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+    held = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        held.append(message)
+
+    adapter = FileAdapter(missive.JSONMessage, processor, [path])
+    adapter.run()
+
+    adapter.ack(held[1])
+    assert adapter.offsets == {}
+    adapter.ack(held[0])
+    assert adapter.offsets == {path: len(b'{"i": 0}\n') * 2}
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7])
+def test_shards_cover_every_message_once(tmpdir, count):
+    paths = [
+        write_archive(tmpdir.join("a.ndjson"), range(0, 50)),
+        write_archive(tmpdir.join("b.ndjson"), range(50, 55)),
+    ]
+    received: List[int] = []
+    for index in range(count):
+        processor, bind = make_processor(received)
+        bind(
+            FileAdapter(missive.JSONMessage, processor, paths, shard=(index, count))
+        ).run()
+
+    assert sorted(received) == list(range(55))
+
+
+def test_length_prefixed_shards_by_file(tmpdir):
+    framing = LengthPrefixedFraming()
+    paths = [
+        write_archive(tmpdir.join("a.bin"), range(0, 3), framing),
+        write_archive(tmpdir.join("b.bin"), range(3, 6), framing),
+    ]
+    received: List[int] = []
+    processor, bind = make_processor(received)
+
+    bind(
+        FileAdapter(
+            missive.JSONMessage, processor, paths, framing=framing, shard=(1, 2)
+        )
+    ).run()
+
+    assert received == [3, 4, 5]
+
+
+def test_nack_stops_the_checkpoint(tmpdir):
+    path = write_archive(tmpdir.join("a.ndjson"), range(5))
+    checkpoint = str(tmpdir.join("checkpoint.json"))
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        if message.get_json()["i"] == 2:
+            ctx.nack()
+        else:
+            ctx.ack()
+
+    adapter = FileAdapter(
+        missive.JSONMessage, processor, [path], checkpoint_path=checkpoint
+    )
+    adapter.run()
+
+    # Stays at the start of the nacked message
+    assert adapter.offsets == {path: len(b'{"i": 0}\n') * 2}
+
+    received: List[int] = []
+    processor, bind = make_processor(received)
+    bind(
+        FileAdapter(missive.JSONMessage, processor, [path], checkpoint_path=checkpoint)
+    ).run()
+    assert received == [2, 3, 4]
+
+
+def test_nack_only_stops_its_own_file(tmpdir):
+    paths = [
+        write_archive(tmpdir.join("a.ndjson"), range(0, 2)),
+        write_archive(tmpdir.join("b.ndjson"), range(2, 4)),
+    ]
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        if message.get_json()["i"] == 0:
+            ctx.nack()
+        else:
+            ctx.ack()
+
+    adapter = FileAdapter(missive.JSONMessage, processor, paths)
+    adapter.run()
+
+    assert adapter.offsets == {paths[1]: len(b'{"i": 2}\n') * 2}
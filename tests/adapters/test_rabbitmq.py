@@ -1,15 +1,23 @@
 import threading
+import time
 import random
 import string
 import json
-from unittest.mock import patch, Mock
+from unittest.mock import call, patch, Mock
 
+from amqp.exceptions import MessageNacked
+from freezegun import freeze_time
 import kombu
 import pytest
 
 import missive
 from missive import shutdown_handler
-from missive.adapters.rabbitmq import RabbitMQAdapter
+from missive.adapters.rabbitmq import (
+    RabbitMQAdapter,
+    RabbitMQPublisher,
+    _Confirms,
+    _CumulativeAcks,
+)
 
 from ..matchers import always
 
@@ -195,3 +203,341 @@ def test_receipt_from_multiple_queues(channel):
 
     q1.delete()
     q2.delete()
+
+
+def test_worker_threads(channel, random_queue):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = set()
+    thread_names = set()
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        time.sleep(0.05)
+        thread_names.add(threading.current_thread().name)
+        messages.add(message.get_json()["n"])
+        ctx.ack()
+        if len(messages) >= 10:
+            adapted.shutdown_handler.set_flag()
+
+    adapted = RabbitMQAdapter(
+        missive.JSONMessage,
+        processor,
+        [random_queue.name],
+        url_or_conn=RABBITMQ_URL,
+        disable_shutdown_handler=True,
+        worker_threads=4,
+    )
+    assert adapted.prefetch_count == 4
+
+    producer = kombu.Producer(channel)
+    for n in range(10):
+        producer.publish(
+            json.dumps({"n": n}).encode("utf-8"), routing_key=random_queue.name
+        )
+
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    thread.join(2)
+
+    assert messages == set(range(10))
+    assert len(thread_names) > 1
+
+    # Assert nothing left on the queue
+    assert random_queue.get() is None
+
+
+def test_batched_acks(channel, random_queue):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        messages.append(message.get_json()["n"])
+        ctx.ack()
+        if len(messages) == 25:
+            adapted.shutdown_handler.set_flag()
+
+    adapted = RabbitMQAdapter(
+        missive.JSONMessage,
+        processor,
+        [random_queue.name],
+        url_or_conn=RABBITMQ_URL,
+        disable_shutdown_handler=True,
+        prefetch_count=20,
+        ack_batch_size=10,
+    )
+
+    producer = kombu.Producer(channel)
+    for n in range(25):
+        producer.publish(
+            json.dumps({"n": n}).encode("utf-8"), routing_key=random_queue.name
+        )
+
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    thread.join(2)
+
+    assert messages == list(range(25))
+    # The last partial batch is acked at shutdown
+    assert random_queue.get() is None
+
+
+def test_cumulative_acks_are_contiguous():
+    channel = Mock()
+    acks = _CumulativeAcks(batch_size=3, interval=60)
+    for tag in range(1, 6):
+        acks.delivered(tag)
+
+    acks.settled(2, True)
+    acks.settled(3, True)
+    assert not acks.due()
+
+    # A nack is sent separately and so isn't covered by the cumulative ack
+    acks.settled(1, False)
+    assert not acks.due()
+    acks.settled(5, True)
+    acks.settled(4, False)
+    assert acks.due()
+
+    acks.flush(channel)
+    channel.basic_ack.assert_called_once_with(5, multiple=True)
+    assert acks.time_remaining() is None
+
+
+def test_cumulative_acks_interval():
+    channel = Mock()
+    acks = _CumulativeAcks(batch_size=10, interval=0)
+    acks.delivered(1)
+    acks.delivered(2)
+    acks.settled(1, True)
+    acks.settled(2, False)
+    assert acks.due()
+
+    acks.flush(channel)
+    channel.basic_ack.assert_called_once_with(1, multiple=True)
+
+    channel.reset_mock()
+    acks.flush(channel)
+    channel.basic_ack.assert_not_called()
+
+
+def test_out_of_order_acks_are_not_held_back_for_long():
+    channel = Mock()
+    acks = _CumulativeAcks(batch_size=10, interval=60)
+    for tag in range(1, 6):
+        acks.delivered(tag)
+
+    with freeze_time() as frozen:
+        for tag in range(2, 6):
+            acks.settled(tag, True)
+        assert acks.time_remaining() == 60
+        assert not acks.due()
+
+        frozen.tick(60)
+        assert acks.due()
+        acks.flush(channel)
+        assert channel.basic_ack.call_args_list == [
+            call(tag, multiple=False) for tag in range(2, 6)
+        ]
+        assert acks.time_remaining() is None
+
+        # Once the head is settled only the messages acked since are covered
+        channel.reset_mock()
+        acks.delivered(6)
+        acks.settled(6, True)
+        acks.settled(1, True)
+        acks.flush(channel)
+        channel.basic_ack.assert_called_once_with(6, multiple=True)
+
+
+def test_out_of_order_acks_are_sent_when_idle():
+    channel = Mock()
+    acks = _CumulativeAcks(batch_size=10, interval=60)
+    acks.delivered(1)
+    acks.delivered(2)
+    acks.settled(2, True)
+
+    acks.flush(channel)
+    channel.basic_ack.assert_not_called()
+
+    acks.flush(channel, out_of_order=True)
+    channel.basic_ack.assert_called_once_with(2, multiple=False)
+
+
+def test_held_retries_leave_room_in_the_prefetch():
+    # kombu's in-memory transport enforces the prefetch count too, so this
+    # doesn't need a server
+    memory_connection = kombu.Connection("memory://")
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    handled = []
+
+    @processor.handle_for(always, retry=missive.RetryPolicy(base_delay=60, jitter=0))
+    def flaky(message, ctx):
+        if message.raw_data != b"ok":
+            raise ConnectionError("downstream unavailable")
+        handled.append(message.raw_data)
+        ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    with memory_connection.channel() as memory_channel:
+        queue = make_random_queue(memory_channel)
+        queue.declare()
+        producer = kombu.Producer(memory_channel)
+        # More failures than the prefetch count
+        for _ in range(5):
+            producer.publish(b"fail", routing_key=queue.name)
+        producer.publish(b"ok", routing_key=queue.name)
+
+    adapted = RabbitMQAdapter(
+        missive.RawMessage,
+        processor,
+        [queue.name],
+        url_or_conn=memory_connection,
+        disable_shutdown_handler=True,
+        prefetch_count=3,
+    )
+
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    thread.join(5)
+    if thread.is_alive():
+        adapted.shutdown_handler.set_flag()
+        thread.join()
+
+    assert handled == [b"ok"]
+
+
+def test_retries_run_on_worker_threads():
+    memory_connection = kombu.Connection("memory://")
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    threads = []
+
+    @processor.handle_for(always, retry=missive.RetryPolicy(base_delay=0.01))
+    def flaky(message, ctx):
+        threads.append(threading.current_thread().name)
+        if len(threads) == 1:
+            raise ConnectionError("downstream unavailable")
+        ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    with memory_connection.channel() as memory_channel:
+        queue = make_random_queue(memory_channel)
+        queue.declare()
+        kombu.Producer(memory_channel).publish(b"retried", routing_key=queue.name)
+
+    adapted = RabbitMQAdapter(
+        missive.RawMessage,
+        processor,
+        [queue.name],
+        url_or_conn=memory_connection,
+        disable_shutdown_handler=True,
+        worker_threads=2,
+    )
+
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    thread.join(5)
+    if thread.is_alive():
+        adapted.shutdown_handler.set_flag()
+        thread.join()
+
+    assert len(threads) == 2
+    assert all(name.startswith("missive-worker") for name in threads)
+
+
+def test_adaptive_prefetch():
+    consumer = Mock()
+    adapted = RabbitMQAdapter(
+        missive.JSONMessage,
+        missive.Processor(),
+        ["queue"],
+        prefetch_count=4,
+        max_prefetch_count=10,
+        target_latency=0.1,
+    )
+
+    def record(latency, count):
+        adapted._latency_total += latency * count
+        adapted._latency_count += count
+
+    record(0.01, 3)
+    assert adapted._adapt_prefetch(consumer, 4, 4) == 4
+    record(0.01, 1)
+    assert adapted._adapt_prefetch(consumer, 4, 4) == 8
+    consumer.qos.assert_called_once_with(prefetch_count=8)
+
+    record(0.01, 8)
+    assert adapted._adapt_prefetch(consumer, 8, 4) == 10
+
+    record(0.5, 10)
+    assert adapted._adapt_prefetch(consumer, 10, 4) == 5
+    record(0.5, 5)
+    assert adapted._adapt_prefetch(consumer, 5, 4) == 4
+
+
+def test_max_prefetch_count_too_small():
+    with pytest.raises(ValueError):
+        RabbitMQAdapter(
+            missive.JSONMessage,
+            missive.Processor(),
+            ["queue"],
+            prefetch_count=10,
+            max_prefetch_count=5,
+        )
+
+
+def test_publisher(connection, channel, random_queue):
+    publisher = RabbitMQPublisher(connection)
+
+    publisher.publish(random_queue.name, b"1")
+    publisher.publish(random_queue.name, b"2")
+    assert random_queue.get() is None
+
+    publisher.flush()
+    assert [random_queue.get(no_ack=True).body for _ in range(2)] == [b"1", b"2"]
+
+
+def test_confirms_are_waited_for_together():
+    confirms = _Confirms()
+    channel = Mock()
+    confirms.sent(3)
+
+    # The broker confirms the first message alone and then the rest at once
+    acks = iter([(1, False), (3, True)])
+    channel.wait.side_effect = lambda methods: confirms.acked(*next(acks))
+    confirms.wait(channel)
+    assert channel.wait.call_count == 2
+
+    # Delivery tags carry on from where they were
+    confirms.sent(2)
+    channel.wait.side_effect = lambda methods: confirms.acked(5, True)
+    confirms.wait(channel)
+    assert channel.wait.call_count == 3
+
+
+def test_nacked_confirms_raise():
+    confirms = _Confirms()
+    channel = Mock()
+    confirms.sent(2)
+
+    channel.wait.side_effect = lambda methods: confirms.nacked_by_broker(2, True)
+    with pytest.raises(MessageNacked):
+        confirms.wait(channel)
+
+
+def test_publisher_without_confirms():
+    # The in-memory transport has no publisher confirms
+    memory_connection = kombu.Connection("memory://")
+    publisher = RabbitMQPublisher(memory_connection)
+    with memory_connection.channel() as memory_channel:
+        queue = make_random_queue(memory_channel)
+        queue.declare()
+
+        publisher.publish(queue.name, b"1")
+        publisher.publish(queue.name, b"2")
+        publisher.flush()
+        assert [queue.get(no_ack=True).body for _ in range(2)] == [b"1", b"2"]
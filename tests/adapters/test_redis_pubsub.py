@@ -1,4 +1,3 @@
-import time
 import threading
 import json
 
@@ -6,7 +5,7 @@ import redis
 import pytest
 
 import missive
-from missive.adapters.redis import RedisPubSubAdapter
+from missive.adapters.redis import RedisPubSubAdapter, RedisPublisher
 
 from ..matchers import always
 
@@ -16,6 +15,13 @@ def redis_client():
     yield redis.Redis()
 
 
+def run_until_subscribed(adapted):
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    assert adapted.subscribed.wait(1)
+    return thread
+
+
 def test_message_receipt(redis_client):
     processor: missive.Processor[missive.JSONMessage] = missive.Processor()
 
@@ -28,18 +34,83 @@ def test_message_receipt(redis_client):
         ctx.ack()
         adapted.shutdown_handler.set_flag()
 
-    adapted = RedisPubSubAdapter(missive.JSONMessage, processor, ["test-channel"])
-
-    thread = threading.Thread(target=adapted.run)
-    thread.start()
-
-    while adapted.thread is None:
-        time.sleep(0.01)
+    adapted = RedisPubSubAdapter(
+        missive.JSONMessage, processor, ["test-channel"], disable_shutdown_handler=True,
+    )
+    thread = run_until_subscribed(adapted)
 
     test_event = {"test-event": True}
 
     redis_client.publish("test-channel", json.dumps(test_event))
 
-    adapted.thread.join(1)
+    thread.join(1)
+    assert not thread.is_alive()
 
     assert flag == test_event
+
+
+def test_pattern_subscription(redis_client):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    received = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        received.append(message.raw_data)
+        ctx.ack()
+        if len(received) == 2:
+            adapted.shutdown_handler.set_flag()
+
+    adapted = RedisPubSubAdapter(
+        missive.RawMessage,
+        processor,
+        patterns=["test-pattern.*"],
+        url_or_conn="redis://localhost:6379/0",
+        disable_shutdown_handler=True,
+    )
+    thread = run_until_subscribed(adapted)
+
+    redis_client.publish("test-pattern.a", b"1")
+    redis_client.publish("something-else", b"2")
+    redis_client.publish("test-pattern.b", b"3")
+
+    thread.join(1)
+    assert not thread.is_alive()
+
+    assert received == [b"1", b"3"]
+
+
+def test_prompt_shutdown(redis_client):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+    adapted = RedisPubSubAdapter(
+        missive.RawMessage,
+        processor,
+        ["test-channel"],
+        disable_shutdown_handler=True,
+        poll_interval=0.1,
+    )
+    thread = run_until_subscribed(adapted)
+
+    adapted.shutdown_handler.set_flag()
+    thread.join(0.5)
+    assert not thread.is_alive()
+
+
+def test_requires_channels():
+    with pytest.raises(ValueError):
+        RedisPubSubAdapter(missive.RawMessage, missive.Processor())
+
+
+def test_publisher(redis_client):
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe("test-publisher")
+    publisher = RedisPublisher()
+
+    publisher.publish("test-publisher", b"1")
+    publisher.publish("test-publisher", b"2")
+    assert pubsub.get_message(timeout=0.1) is None
+
+    publisher.flush()
+    received = [pubsub.get_message(timeout=1)["data"] for _ in range(2)]
+    assert received == [b"1", b"2"]
+    publisher.close()
@@ -0,0 +1,191 @@
+import random
+import string
+import threading
+import json
+
+import fakeredis
+import redis
+import pytest
+
+import missive
+from missive.adapters.redis import RedisStreamsAdapter
+
+from ..matchers import always
+
+
+@pytest.fixture
+def redis_client():
+    yield redis.Redis()
+
+
+@pytest.fixture
+def stream(redis_client):
+    postfix = "".join(random.choice(string.ascii_letters) for _ in range(5))
+    name = "test-stream-%s" % postfix
+    yield name
+    redis_client.delete(name)
+
+
+def make_adapter(processor, stream, **kwargs):
+    return RedisStreamsAdapter(
+        missive.JSONMessage,
+        processor,
+        [stream],
+        "test-group",
+        disable_shutdown_handler=True,
+        block_timeout=0.1,
+        **kwargs
+    )
+
+
+def run(adapted):
+    thread = threading.Thread(target=adapted.run)
+    thread.start()
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_message_receipt(redis_client, stream):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        messages.append(message.get_json()["n"])
+        ctx.ack()
+        if len(messages) == 5:
+            adapted.shutdown_handler.set_flag()
+
+    # Published before the group exists
+    for n in range(5):
+        redis_client.xadd(stream, {"data": json.dumps({"n": n})})
+
+    adapted = make_adapter(processor, stream, count=2, ack_batch_size=3)
+    run(adapted)
+
+    assert messages == list(range(5))
+    assert redis_client.xpending(stream, "test-group")["pending"] == 0
+
+
+def test_message_id_is_entry_id(redis_client, stream):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    message_ids = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        message_ids.append(message.message_id)
+        ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    entry_id = redis_client.xadd(stream, {"data": b"{}"})
+
+    adapted = make_adapter(processor, stream)
+    run(adapted)
+
+    assert message_ids == [stream.encode("utf-8") + b":" + entry_id]
+
+
+def test_nack_redelivers(redis_client, stream):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    attempts = 0
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            ctx.nack()
+        else:
+            ctx.ack()
+            adapted.shutdown_handler.set_flag()
+
+    redis_client.xadd(stream, {"data": b"{}"})
+
+    adapted = make_adapter(processor, stream)
+    run(adapted)
+
+    assert attempts == 2
+    assert redis_client.xpending(stream, "test-group")["pending"] == 0
+
+
+def test_takes_over_idle_entries(redis_client, stream):
+    redis_client.xgroup_create(stream, "test-group", id="0", mkstream=True)
+    redis_client.xadd(stream, {"data": json.dumps({"n": 1})})
+    # Another consumer reads the entry and then dies
+    redis_client.xreadgroup("test-group", "dead-consumer", {stream: ">"})
+
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        messages.append(message.get_json())
+        ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    adapted = make_adapter(processor, stream, min_idle_time=0)
+    run(adapted)
+
+    assert messages == [{"n": 1}]
+    assert redis_client.xpending(stream, "test-group")["pending"] == 0
+
+
+def test_resumes_own_pending_entries(redis_client, stream):
+    redis_client.xgroup_create(stream, "test-group", id="0", mkstream=True)
+    redis_client.xadd(stream, {"data": json.dumps({"n": 1})})
+    redis_client.xreadgroup("test-group", "restarted-consumer", {stream: ">"})
+
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        messages.append(message.get_json())
+        ctx.ack()
+        adapted.shutdown_handler.set_flag()
+
+    adapted = make_adapter(processor, stream, consumer="restarted-consumer")
+    run(adapted)
+
+    assert messages == [{"n": 1}]
+
+
+def test_each_pending_entry_is_handled_once():
+    # Doesn't need a server: fakeredis is enough for XREADGROUP
+    fake_redis = fakeredis.FakeRedis()
+    stream = "test-stream"
+    fake_redis.xgroup_create(stream, "test-group", id="0", mkstream=True)
+    for n in range(5):
+        fake_redis.xadd(stream, {"data": json.dumps({"n": n})})
+    fake_redis.xreadgroup("test-group", "restarted-consumer", {stream: ">"})
+
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+
+    messages = []
+
+    @processor.handle_for(always)
+    def catch_all(message, ctx):
+        messages.append(message.get_json()["n"])
+        ctx.ack()
+        if len(messages) == 5:
+            adapted.shutdown_handler.set_flag()
+
+    # The acks are still waiting to be sent while the later entries are read
+    adapted = make_adapter(
+        processor,
+        stream,
+        consumer="restarted-consumer",
+        url_or_conn=fake_redis,
+        count=2,
+        ack_batch_size=100,
+        ack_interval=60,
+    )
+    run(adapted)
+
+    assert messages == list(range(5))
+    assert fake_redis.xpending(stream, "test-group")["pending"] == 0
@@ -1,9 +1,13 @@
-from typing import cast
+from concurrent.futures import ThreadPoolExecutor
+import io
+from typing import List, cast
 
 import missive as m
+from missive.framing import LengthPrefixedFraming
 from missive.adapters.wsgi import WSGIAdapter
 
 from ..matchers import always
+from ..wsgi_client import Client
 
 
 def test_acking():
@@ -19,7 +23,7 @@ def test_acking():
 
     adapted_processor = WSGIAdapter(m.RawMessage, processor)
 
-    with adapted_processor.app.test_client() as test_client:
+    with Client(adapted_processor.app) as test_client:
         response = test_client.post("/", data=b"hello")
 
     assert response.status_code == 200
@@ -40,9 +44,249 @@ def test_nacking():
 
     adapted_processor = WSGIAdapter(m.RawMessage, processor)
 
-    with adapted_processor.app.test_client() as test_client:
+    with Client(adapted_processor.app) as test_client:
         response = test_client.post("/", data=b"hello")
 
     assert response.status_code == 500
     assert response.json == {"result": "nack"}
     assert cast(m.Message, message_received).raw_data == b"hello"
+
+
+def test_processing_context_is_reused():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    started: List[m.ProcessingContext[m.RawMessage]] = []
+    stopped: List[m.ProcessingContext[m.RawMessage]] = []
+    processor.before_processing(started.append)
+    processor.after_processing(stopped.append)
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        ctx.ack()
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor)
+
+    with Client(adapted_processor.app) as test_client:
+        for _ in range(3):
+            assert test_client.post("/", data=b"hello").status_code == 200
+
+    assert len(started) == 1
+    assert len(stopped) == 0
+
+    adapted_processor.close()
+    assert len(stopped) == 1
+    assert adapted_processor._results == {}
+
+
+def test_unsettled_message():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        pass
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor)
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post("/", data=b"hello")
+
+    assert response.status_code == 500
+    assert response.json == {"result": "nack"}
+
+
+def test_concurrent_requests():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        if int(message.raw_data) % 2 == 0:
+            ctx.ack()
+        else:
+            ctx.nack()
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor)
+
+    def post(n):
+        with Client(adapted_processor.app) as test_client:
+            return n, test_client.post("/", data=str(n).encode()).json["result"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = dict(executor.map(post, range(200)))
+
+    assert results == {n: "ack" if n % 2 == 0 else "nack" for n in range(200)}
+    assert adapted_processor._results == {}
+
+
+def test_batch_handlers():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    batches = []
+
+    @processor.handle_batch_for(always, max_size=3, max_wait=0.05)
+    def handler(messages, ctx):
+        batches.append(len(messages))
+        ctx.ack()
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor)
+
+    def post(n):
+        with Client(adapted_processor.app) as test_client:
+            return test_client.post("/", data=b"hello").json["result"]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(post, range(4)))
+
+    assert results == ["ack"] * 4
+    assert sum(batches) == 4
+    assert adapted_processor._waiters == {}
+
+
+def test_results_settled_after_the_timeout_are_dropped():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_batch_for(always, max_size=2, max_wait=60)
+    def handler(messages, ctx):
+        ctx.ack()
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor, settle_timeout=0.05)
+
+    with Client(adapted_processor.app) as test_client:
+        # Gives up waiting for the batch to fill
+        first = test_client.post("/", data=b"first")
+        # Fills the batch, settling the first message too
+        second = test_client.post("/", data=b"second")
+
+    assert first.json == {"result": "nack"}
+    assert second.json == {"result": "ack"}
+    assert adapted_processor._results == {}
+    assert adapted_processor._abandoned == set()
+
+
+def make_batch_processor():
+    processor: m.Processor[m.JSONMessage] = m.Processor()
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        if message.get_json()["ok"]:
+            ctx.ack()
+        else:
+            ctx.nack()
+
+    return processor
+
+
+def test_batch_ndjson():
+    adapted_processor = WSGIAdapter(m.JSONMessage, make_batch_processor())
+    body = b'{"ok": true}\n{"ok": false}\n\n{"ok": true}\n{"ok": false}'
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post(
+            "/batch", data=body, content_type="application/x-ndjson"
+        )
+
+    assert response.status_code == 500
+    # The blank line is skipped but still counted
+    assert response.json == {"acked": 2, "nacked": 2, "failed": [1, 4]}
+
+
+def test_batch_full_results_include_blank_frames():
+    adapted_processor = WSGIAdapter(m.JSONMessage, make_batch_processor())
+    body = b'{"ok": true}\n\n{"ok": false}\n\n'
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post(
+            "/batch?results=full", data=body, content_type="application/x-ndjson"
+        )
+
+    assert response.status_code == 500
+    assert response.json == {"results": ["ack", "skip", "nack", "skip"]}
+
+
+def test_batch_length_prefixed_full_results():
+    adapted_processor = WSGIAdapter(m.JSONMessage, make_batch_processor())
+    framing = LengthPrefixedFraming()
+    body = framing.frame(b'{"ok": true}') + framing.frame(b'{"ok": true}')
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post(
+            "/batch?results=full", data=body, content_type="application/octet-stream",
+        )
+
+    assert response.status_code == 200
+    assert response.json == {"results": ["ack", "ack"]}
+
+
+def test_batch_truncated():
+    adapted_processor = WSGIAdapter(m.JSONMessage, make_batch_processor())
+    framing = LengthPrefixedFraming()
+    body = framing.frame(b'{"ok": true}') + framing.frame(b'{"ok": true}')[:-1]
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post(
+            "/batch", data=body, content_type="application/octet-stream"
+        )
+
+    assert response.status_code == 400
+    assert response.json["acked"] == 1
+    assert "part way through a frame" in response.json["error"]
+    assert adapted_processor._results == {}
+
+
+def test_batch_unsupported_content_type():
+    adapted_processor = WSGIAdapter(m.JSONMessage, make_batch_processor())
+
+    with Client(adapted_processor.app) as test_client:
+        response = test_client.post("/batch", data=b"{}", content_type="text/plain")
+
+    assert response.status_code == 415
+
+
+def test_pre_encoded_responses():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        ctx.ack()
+
+    with Client(WSGIAdapter(m.RawMessage, processor)) as test_client:
+        response = test_client.post("/", data=b"hello")
+
+    assert response.data == b'{"result": "ack"}'
+    assert response.headers == {
+        "Content-Type": "application/json",
+        "Content-Length": "17",
+    }
+
+
+def test_routing():
+    adapted_processor = WSGIAdapter(m.RawMessage, m.Processor())
+
+    with Client(adapted_processor) as test_client:
+        assert test_client.get("/").status_code == 405
+        assert test_client.get("/batch").status_code == 405
+        assert test_client.post("/metrics").status_code == 405
+        assert test_client.post("/elsewhere").status_code == 404
+
+
+def test_chunked_body():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    received = []
+
+    @processor.handle_for(always)
+    def handler(message, ctx):
+        received.append(message.raw_data)
+        ctx.ack()
+
+    adapted_processor = WSGIAdapter(m.RawMessage, processor)
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/",
+        "wsgi.input": io.BytesIO(b"hello"),
+        "wsgi.input_terminated": True,
+    }
+
+    body = b"".join(adapted_processor(environ, lambda status, headers: None))
+
+    assert body == b'{"result": "ack"}'
+    assert received == [b"hello"]
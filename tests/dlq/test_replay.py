@@ -0,0 +1,139 @@
+from datetime import datetime, timezone
+from typing import Dict
+import threading
+
+import pytest
+from freezegun import freeze_time
+
+import missive as m
+from missive.dlq.replay import replay, main
+from missive.dlq.sqlite import SQLiteDLQ
+
+
+def fill(dlq, contents, reason="bug"):
+    messages = [m.RawMessage(raw_data=content) for content in contents]
+    for message in messages:
+        dlq[message.message_id] = (message, reason)
+    return messages
+
+
+def fixed_processor(dlq=None) -> m.Processor[m.RawMessage]:
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    if dlq is not None:
+        processor.set_dlq(dlq)
+
+    @processor.handle_for(lambda message: True)
+    def handler(message, ctx):
+        if message.raw_data == b"still bad":
+            raise RuntimeError("still broken")
+        elif message.raw_data == b"nack":
+            ctx.nack()
+        else:
+            ctx.ack()
+
+    return processor
+
+
+@pytest.mark.parametrize("parallelism", [1, 4])
+def test_replay(parallelism):
+    dlq: m.DLQ = SQLiteDLQ(":memory:") if parallelism == 1 else {}
+    good = fill(dlq, [b"good"] * 5)
+    (still_bad, nacked) = fill(dlq, [b"still bad", b"nack"])
+
+    result = replay(
+        dlq, fixed_processor(dlq), parallelism=parallelism, delete_batch_size=2
+    )
+
+    assert (result.replayed, result.succeeded) == (7, 5)
+    assert (result.dead_lettered, result.nacked) == (1, 1)
+    assert set(dlq) == {still_bad.message_id, nacked.message_id}
+    assert dlq[still_bad.message_id] == (still_bad, "still broken")
+    assert dlq[nacked.message_id] == (nacked, "bug")
+
+
+@pytest.mark.parametrize("parallelism", [1, 4])
+def test_replay_retries(parallelism):
+    dlq: Dict = {}
+    messages = fill(dlq, [b"flaky %d" % n for n in range(6)])
+    attempts: Dict[bytes, int] = {}
+    lock = threading.Lock()
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(
+        lambda message: True, retry=m.RetryPolicy(base_delay=0.01, jitter=0)
+    )
+    def flaky(message, ctx):
+        with lock:
+            attempts[message.raw_data] = attempts.get(message.raw_data, 0) + 1
+            if attempts[message.raw_data] == 1:
+                raise RuntimeError("downstream unavailable")
+        ctx.ack()
+
+    result = replay(dlq, processor, parallelism=parallelism)
+
+    assert (result.replayed, result.succeeded, result.nacked) == (6, 6, 0)
+    assert attempts == {message.raw_data: 2 for message in messages}
+    assert dlq == {}
+
+
+def test_replay_into_a_different_dlq():
+    dlq: Dict = {}
+    new_dlq: Dict = {}
+    (still_bad,) = fill(dlq, [b"still bad"])
+
+    replay(dlq, fixed_processor(new_dlq))
+
+    assert dlq == {}
+    assert new_dlq == {still_bad.message_id: (still_bad, "still broken")}
+
+
+def test_replay_without_a_processor_dlq():
+    dlq: Dict = {}
+    (still_bad,) = fill(dlq, [b"still bad"])
+    processor = fixed_processor()
+
+    result = replay(dlq, processor)
+
+    assert result.dead_lettered == 1
+    assert dlq == {still_bad.message_id: (still_bad, "bug")}
+    assert processor.dlq is None
+
+
+def test_replay_filters():
+    dlq: SQLiteDLQ = SQLiteDLQ(":memory:")
+    with freeze_time(datetime(2018, 1, 1, tzinfo=timezone.utc)):
+        (old,) = fill(dlq, [b"old"])
+    with freeze_time(datetime(2018, 1, 3, tzinfo=timezone.utc)):
+        (new,) = fill(dlq, [b"new"])
+        (other_reason,) = fill(dlq, [b"other reason"], reason="other")
+
+    result = replay(
+        dlq,
+        fixed_processor(dlq),
+        since=datetime(2018, 1, 2, tzinfo=timezone.utc),
+        reason="bug",
+    )
+
+    assert result.succeeded == 1
+    assert set(dlq) == {old.message_id, other_reason.message_id}
+
+
+def test_time_filters_need_timestamps():
+    dlq: Dict = {}
+    fill(dlq, [b"good"])
+    with pytest.raises(ValueError):
+        replay(dlq, fixed_processor(), since=datetime(2018, 1, 1))
+
+
+processor_for_cli = fixed_processor()
+
+
+def test_cli(tmpdir, capsys):
+    path = str(tmpdir.join("dlq.sqlite3"))
+    fill(SQLiteDLQ(path), [b"good", b"good"])
+
+    assert main([path, f"{__name__}:processor_for_cli", "--rate", "1000"]) == 0
+
+    assert len(SQLiteDLQ(path)) == 0
+    assert "succeeded=2" in capsys.readouterr().out
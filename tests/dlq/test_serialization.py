@@ -0,0 +1,93 @@
+import json
+import pickle
+
+import pytest
+
+from missive import JSONMessage, RawMessage
+from missive.messages import DictMessage
+from missive.dlq.serialization import BinarySerializer, PickleSerializer
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_round_trip(compression):
+    serializer = BinarySerializer(compression=compression, min_compress_size=0)
+    message = JSONMessage(json.dumps({"a": "b" * 1000}).encode("utf-8"))
+    message.get_json()
+
+    loaded = serializer.loads(serializer.dumps(message))
+
+    assert type(loaded) is JSONMessage
+    assert loaded == message
+    assert loaded.raw_data == message.raw_data
+    assert loaded.get_json() == {"a": "b" * 1000}
+
+
+def test_compression_makes_rows_smaller():
+    message = RawMessage(b"x" * 10_000)
+
+    uncompressed = BinarySerializer().dumps(message)
+    compressed = BinarySerializer(compression="zlib").dumps(message)
+
+    assert len(compressed) < len(uncompressed) < len(pickle.dumps(message))
+
+
+def test_small_messages_not_compressed():
+    serializer = BinarySerializer(compression="zlib", min_compress_size=100)
+    message = RawMessage(b"small")
+
+    data = serializer.dumps(message)
+
+    assert message.raw_data in data
+    assert BinarySerializer().loads(data) == message
+
+
+def test_decoder_is_stored_by_name():
+    serializer = BinarySerializer()
+    message = DictMessage(b'{"a": 1}', decoder=json.loads)
+
+    loaded = serializer.loads(serializer.dumps(message))
+
+    assert isinstance(loaded, DictMessage)
+    assert loaded.decoder is json.loads
+    assert loaded.contents() == {"a": 1}
+
+
+def test_unnamed_decoder_rejected():
+    message = DictMessage(b"{}", decoder=lambda b: {})
+
+    with pytest.raises(ValueError):
+        BinarySerializer().dumps(message)
+
+
+def test_factory_for_moved_class():
+    message = RawMessage(b"test")
+    data = BinarySerializer().dumps(message)
+
+    serializer = BinarySerializer(
+        factories={"missive.missive:RawMessage": lambda raw, meta: JSONMessage(raw)}
+    )
+    loaded = serializer.loads(data)
+
+    assert type(loaded) is JSONMessage
+    assert loaded.message_id == message.message_id
+
+
+def test_legacy_pickles_load():
+    message = JSONMessage(b'{"a": 1}')
+
+    loaded = BinarySerializer().loads(PickleSerializer().dumps(message))
+
+    assert loaded == message
+
+
+def test_unknown_version():
+    data = bytearray(BinarySerializer().dumps(RawMessage(b"test")))
+    data[3] = 99
+
+    with pytest.raises(ValueError):
+        BinarySerializer().loads(bytes(data))
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        BinarySerializer(compression="lz4")
@@ -1,11 +1,18 @@
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from datetime import datetime, timezone
 
 from freezegun import freeze_time
 
-from missive import RawMessage
+from missive import RawMessage, Processor
+from missive.dlq.serialization import BinarySerializer
 from missive.dlq.sqlite import SQLiteDLQ
 
+from ..matchers import never
+
 
 @pytest.fixture(scope="function")
 def dlq():
@@ -34,3 +41,170 @@ def test_set_and_remove(dlq):
     del dlq[message.message_id]
 
     assert len(dlq) == 0
+
+
+def test_buffered_writes(tmpdir):
+    path = str(tmpdir.join("dlq.sqlite3"))
+    dlq: SQLiteDLQ = SQLiteDLQ(
+        path, batch_size=3, journal_mode="WAL", synchronous="NORMAL"
+    )
+    other_connection: SQLiteDLQ = SQLiteDLQ(path)
+
+    messages = [RawMessage(raw_data=b"test") for _ in range(4)]
+    for message in messages[:2]:
+        dlq[message.message_id] = (message, "no reason")
+    assert len(other_connection) == 0
+
+    dlq[messages[2].message_id] = (messages[2], "no reason")
+    assert len(other_connection) == 3
+
+    dlq[messages[3].message_id] = (messages[3], "no reason")
+    assert len(other_connection) == 3
+    dlq.flush()
+    assert len(other_connection) == 4
+
+
+def test_flush_interval_without_more_messages(tmpdir):
+    path = str(tmpdir.join("dlq.sqlite3"))
+    dlq: SQLiteDLQ = SQLiteDLQ(path, batch_size=100, flush_interval=0.05)
+
+    message = RawMessage(raw_data=b"test")
+    dlq[message.message_id] = (message, "no reason")
+    assert len(SQLiteDLQ(path)) == 0
+
+    # Nothing else is added, but the message is still written
+    give_up = time.monotonic() + 5
+    while len(SQLiteDLQ(path)) == 0 and time.monotonic() < give_up:
+        time.sleep(0.01)
+    assert len(SQLiteDLQ(path)) == 1
+
+
+def test_buffered_writes_flushed_after_processing(tmpdir):
+    path = str(tmpdir.join("dlq.sqlite3"))
+    dlq: SQLiteDLQ = SQLiteDLQ(path, batch_size=100)
+
+    processor: Processor[RawMessage] = Processor()
+    dlq.attach(processor)
+
+    @processor.handle_for(never)
+    def non_matching_handler(message, ctx):
+        assert False
+
+    with processor.test_client() as test_client:
+        test_client.send(RawMessage(b"a"))
+        test_client.send(RawMessage(b"b"))
+        assert len(SQLiteDLQ(path)) == 0
+
+    assert len(SQLiteDLQ(path)) == 2
+
+
+def test_dead_lettering_from_worker_threads(tmpdir):
+    path = str(tmpdir.join("dlq.sqlite3"))
+    dlq: SQLiteDLQ = SQLiteDLQ(path, batch_size=7)
+
+    processor: Processor[RawMessage] = Processor()
+    dlq.attach(processor)
+
+    @processor.handle_for(never)
+    def non_matching_handler(message, ctx):
+        assert False
+
+    # As with RabbitMQAdapter's worker_threads, the DLQ is written to from
+    # threads other than the one that created it
+    with processor.test_client() as test_client:
+        test_client.send(RawMessage(b"first"))
+        ctx = test_client.ctx
+        assert ctx is not None
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda i: ctx.handle(RawMessage(b"%d" % i)), range(100)))
+
+    assert len(SQLiteDLQ(path)) == 101
+
+
+def test_unknown_pragma_values(tmpdir):
+    with pytest.raises(ValueError):
+        SQLiteDLQ(":memory:", journal_mode="wal; DROP TABLE messages")
+
+
+def test_get_contains_and_iter(dlq):
+    dlq.page_size = 2
+    messages = [RawMessage(raw_data=str(n).encode("utf-8")) for n in range(5)]
+    for message in messages:
+        dlq[message.message_id] = (message, "no reason")
+
+    assert dlq[messages[3].message_id] == (messages[3], "no reason")
+    assert messages[3].message_id in dlq
+    assert b"nonexistent" not in dlq
+    with pytest.raises(KeyError):
+        dlq[b"nonexistent"]
+
+    assert list(dlq) == [message.message_id for message in messages]
+
+    # deleting while iterating is fine
+    for message_id in dlq:
+        del dlq[message_id]
+    assert len(dlq) == 0
+
+
+def test_oldest_is_oldest(dlq):
+    first, second = RawMessage(raw_data=b"1"), RawMessage(raw_data=b"2")
+    with freeze_time("2018-01-03"):
+        dlq[first.message_id] = (first, "no reason")
+    with freeze_time("2018-01-04"):
+        dlq[second.message_id] = (second, "no reason")
+
+    assert dlq.oldest()[0] == first
+
+
+def test_entries_by_time_and_reason(dlq):
+    dlq.page_size = 2
+    inserted = {}
+    for day in range(1, 8):
+        message = RawMessage(raw_data=str(day).encode("utf-8"))
+        reason = "even" if day % 2 == 0 else "odd"
+        with freeze_time(datetime(2018, 1, day, tzinfo=timezone.utc)):
+            dlq[message.message_id] = (message, reason)
+        inserted[day] = message
+
+    all_entries = list(dlq.entries())
+    assert [m for m, _, _ in all_entries] == [inserted[d] for d in range(1, 8)]
+    assert all_entries[0][1:] == ("odd", datetime(2018, 1, 1, tzinfo=timezone.utc))
+
+    between = dlq.entries(
+        since=datetime(2018, 1, 2, tzinfo=timezone.utc),
+        until=datetime(2018, 1, 6, tzinfo=timezone.utc),
+    )
+    assert [m for m, _, _ in between] == [inserted[d] for d in [2, 3, 4, 5]]
+
+    evens = dlq.entries(reason="even", since=datetime(2018, 1, 3))
+    assert [m for m, _, _ in evens] == [inserted[d] for d in [4, 6]]
+
+
+def test_indexes_are_used(dlq):
+    plan = dlq.db_handle.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM messages"
+        " WHERE reason = 'x' AND inserted > '2018' ORDER BY inserted"
+    ).fetchall()
+    assert "messages_reason" in str(plan)
+
+
+def test_legacy_pickled_rows(dlq):
+    message = RawMessage(raw_data=b"test")
+    dlq.db_handle.execute(
+        "INSERT INTO messages VALUES (?, ?, ?, ?)",
+        (message.message_id, pickle.dumps(message), "old", "2018-01-03 00:00:00+00:00"),
+    )
+
+    assert dlq[message.message_id] == (message, "old")
+
+
+def test_compressed_serializer():
+    dlq: SQLiteDLQ = SQLiteDLQ(
+        ":memory:", serializer=BinarySerializer(compression="zlib")
+    )
+    message = RawMessage(raw_data=b"test" * 1000)
+
+    dlq[message.message_id] = (message, "no reason")
+
+    loaded, _ = dlq[message.message_id]
+    assert loaded.raw_data == message.raw_data
@@ -0,0 +1,129 @@
+import asyncio
+from typing import Dict
+
+import pytest
+
+import missive as m
+from missive.aio import AsyncProcessor, AsyncTestAdapter
+
+from .matchers import always, never
+
+
+def test_one_matching_handler():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        await asyncio.sleep(0)
+        await ctx.ack()
+
+    async def main():
+        async with processor.test_client() as test_client:
+            message = m.RawMessage(b"")
+            await test_client.send(message)
+        return test_client, message
+
+    test_client, message = asyncio.run(main())
+    assert test_client.acked == [message]
+
+
+def test_dlq():
+    dlq: Dict = {}
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(never)
+    async def non_matching(message, ctx):
+        assert False
+
+    async def main():
+        async with processor.test_client() as test_client:
+            message = m.RawMessage(b"")
+            await test_client.send(message)
+        return test_client, message
+
+    test_client, message = asyncio.run(main())
+    assert dlq == {message.message_id: (message, "no matching handlers")}
+    assert test_client.acked == [message]
+
+
+def test_hooks():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+    calls = []
+
+    @processor.before_processing
+    async def before_processing(proc_ctx):
+        calls.append("before_processing")
+
+    @processor.before_handling
+    async def before_handling(proc_ctx, handling_ctx):
+        calls.append("before_handling")
+
+    @processor.after_handling
+    async def after_handling(proc_ctx, handling_ctx):
+        calls.append("after_handling")
+
+    @processor.after_processing
+    async def after_processing(proc_ctx):
+        calls.append("after_processing")
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        calls.append("handler")
+        await ctx.ack()
+
+    async def main():
+        async with processor.test_client() as test_client:
+            await test_client.send(m.RawMessage(b""))
+
+    asyncio.run(main())
+    assert calls == [
+        "before_processing",
+        "before_handling",
+        "handler",
+        "after_handling",
+        "after_processing",
+    ]
+
+
+def test_submit_limits_messages_in_flight():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor(max_in_flight=2)
+
+    in_flight = 0
+    most_in_flight = 0
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(in_flight, most_in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        await ctx.ack()
+
+    async def main():
+        adapter: AsyncTestAdapter[m.RawMessage] = AsyncTestAdapter(processor)
+        async with processor.context(m.RawMessage, adapter) as ctx:
+            for _ in range(6):
+                await ctx.submit(m.RawMessage(b""))
+        return adapter
+
+    adapter = asyncio.run(main())
+    assert len(adapter.acked) == 6
+    assert most_in_flight == 2
+
+
+def test_submitted_exceptions_crash_without_dlq():
+    processor: AsyncProcessor[m.RawMessage] = AsyncProcessor()
+
+    @processor.handle_for(always)
+    async def handler(message, ctx):
+        raise RuntimeError("bad bytes!")
+
+    async def main():
+        adapter: AsyncTestAdapter[m.RawMessage] = AsyncTestAdapter(processor)
+        async with processor.context(m.RawMessage, adapter) as ctx:
+            await ctx.submit(m.RawMessage(b""))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
@@ -0,0 +1,105 @@
+from typing import Dict
+
+import missive as m
+
+from .matchers import always
+
+
+def test_batch_by_size():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    batches = []
+
+    @processor.handle_batch_for(always, max_size=2, max_wait=60)
+    def handle_pairs(messages, ctx: m.BatchHandlingContext[m.RawMessage]):
+        batches.append([message.raw_data for message in messages])
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        for n in range(5):
+            test_client.send(m.RawMessage(str(n).encode("utf-8")))
+        assert batches == [[b"0", b"1"], [b"2", b"3"]]
+        assert len(test_client.acked) == 4
+
+    # the partial batch is handed over on shutdown
+    assert batches == [[b"0", b"1"], [b"2", b"3"], [b"4"]]
+    assert len(test_client.acked) == 5
+
+
+def test_batch_by_time():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    batches = []
+
+    @processor.handle_batch_for(always, max_size=100, max_wait=0)
+    def handle_batch(messages, ctx):
+        batches.append(len(messages))
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(m.RawMessage(b"a"))
+        test_client.send(m.RawMessage(b"b"))
+
+    assert batches == [1, 1]
+
+
+def test_per_message_acks_and_nacks():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_batch_for(always, max_size=3, max_wait=60)
+    def handle_batch(messages, ctx):
+        for message in messages:
+            if message.raw_data == b"bad":
+                ctx.nack(message)
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        good_1, bad, good_2 = [m.RawMessage(b) for b in [b"good", b"bad", b"good"]]
+        for message in [good_1, bad, good_2]:
+            test_client.send(message)
+
+    assert test_client.acked == [good_1, good_2]
+    assert test_client.nacked == [bad]
+
+
+def test_batch_exception_dlqs_unsettled_messages():
+    dlq: Dict = {}
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_batch_for(always, max_size=2, max_wait=60)
+    def handle_batch(messages, ctx):
+        ctx.ack(messages[0])
+        raise RuntimeError("database down")
+
+    with processor.test_client() as test_client:
+        first, second = m.RawMessage(b"1"), m.RawMessage(b"2")
+        test_client.send(first)
+        test_client.send(second)
+
+    assert dlq == {second.message_id: (second, "database down")}
+    assert test_client.acked == [first, second]
+
+
+def test_batch_hooks():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    calls = []
+
+    @processor.before_batch_handling
+    def before(proc_ctx, batch_ctx):
+        calls.append(("before", len(batch_ctx.messages)))
+
+    @processor.after_batch_handling
+    def after(proc_ctx, batch_ctx):
+        calls.append(("after", len(batch_ctx.messages)))
+
+    @processor.handle_batch_for(always, max_size=2, max_wait=60)
+    def handle_batch(messages, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(m.RawMessage(b"1"))
+        test_client.send(m.RawMessage(b"2"))
+
+    assert calls == [("before", 2), ("after", 2)]
@@ -0,0 +1,69 @@
+import io
+
+import pytest
+
+from missive.framing import (
+    LengthPrefixedFraming,
+    NewlineFraming,
+    NulFraming,
+    read_frames,
+)
+
+
+def frames(framing, data):
+    return [data[s:e] for s, e, _ in framing.scan(data, 0, len(data))]
+
+
+def test_newline():
+    framing = NewlineFraming()
+    data = b"a\nbc\r\n\npartial"
+
+    assert frames(framing, data) == [b"a", b"bc", b""]
+    *_, (_, _, next_start) = framing.scan(data, 0, len(data))
+    assert framing.finish(data, next_start, len(data)) == (
+        next_start,
+        len(data),
+        len(data),
+    )
+
+
+def test_newline_crlf_final_line():
+    framing = NewlineFraming()
+    data = b"a\r\nb\r"
+
+    assert frames(framing, data) == [b"a"]
+    assert framing.finish(data, 3, len(data)) == (3, 4, 5)
+    assert framing.finish(b"\r", 0, 1) == (0, 0, 1)
+
+
+def test_nul():
+    assert frames(NulFraming(), b"a\nb\0c\0") == [b"a\nb", b"c"]
+
+
+def test_length_prefixed():
+    framing = LengthPrefixedFraming(header_size=2)
+    data = framing.frame(b"abc") + framing.frame(b"") + framing.frame(b"de")[:3]
+
+    assert frames(framing, data) == [b"abc", b""]
+    with pytest.raises(ValueError):
+        framing.finish(data, len(data) - 3, len(data))
+
+
+def test_length_prefixed_max_size():
+    framing = LengthPrefixedFraming(max_size=10)
+    with pytest.raises(ValueError):
+        frames(framing, framing.frame(b"x" * 11))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_read_frames(chunk_size):
+    framing = LengthPrefixedFraming()
+    bodies = [b"a", b"", b"x" * 100, b"bc"]
+    stream = io.BytesIO(b"".join(framing.frame(body) for body in bodies))
+
+    assert list(read_frames(stream.read, framing, chunk_size)) == bodies
+
+
+def test_read_frames_final_frame():
+    stream = io.BytesIO(b"a\nbc\r\nd\r")
+    assert list(read_frames(stream.read, NewlineFraming(), 2)) == [b"a", b"bc", b"d"]
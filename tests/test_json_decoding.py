@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from missive import JSONMessage, json_decoding
+
+
+def available_backends():
+    for name in json_decoding.BACKENDS:
+        try:
+            json_decoding._load_backend(name)
+        except ImportError:
+            continue
+        yield name
+
+
+@pytest.fixture
+def restore_backend():
+    original = json_decoding.backend
+    yield
+    json_decoding.use_backend(original)
+
+
+@pytest.mark.parametrize("name", list(available_backends()))
+def test_backends_parse_bytes(name, restore_backend):
+    json_decoding.use_backend(name)
+    body = '{"a": [1, 2.5, null, "é"]}'.encode("utf-8")
+
+    assert json_decoding.loads(body) == {"a": [1, 2.5, None, "é"]}
+    assert json_decoding.loads(memoryview(body)) == {"a": [1, 2.5, None, "é"]}
+    assert JSONMessage(body).get_json() == {"a": [1, 2.5, None, "é"]}
+
+
+def test_null_body_is_parsed_once(restore_backend):
+    calls = []
+
+    def counting_loads(data):
+        calls.append(data)
+        return None
+
+    json_decoding.loads = counting_loads
+    message = JSONMessage(b"null")
+
+    assert message.get_json() is None
+    assert message.get_json() is None
+    assert len(calls) == 1
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        json_decoding.use_backend("simplejson")
+
+
+def backend_in_subprocess(setting):
+    env = dict(os.environ)
+    env.pop("MISSIVE_JSON_BACKEND", None)
+    if setting is not None:
+        env["MISSIVE_JSON_BACKEND"] = setting
+    script = "from missive import json_decoding; print(json_decoding.backend)"
+    output = subprocess.check_output([sys.executable, "-c", script], env=env)
+    return output.strip().decode("ascii")
+
+
+def test_stdlib_by_default():
+    assert backend_in_subprocess(None) == "json"
+
+
+def test_environment_override():
+    assert backend_in_subprocess("json") == "json"
+    assert backend_in_subprocess("auto") == next(available_backends())
+
+
+def test_auto_picks_fastest_installed(restore_backend):
+    json_decoding.use_backend("auto")
+
+    assert json_decoding.backend == next(available_backends())
+
+
+def test_stdlib_accepts_non_finite_and_big_numbers(restore_backend):
+    json_decoding.use_backend("json")
+
+    assert JSONMessage(b"[NaN, 18446744073709551616]").get_json()[1] == 2 ** 64
+
+
+@pytest.mark.parametrize(
+    "name", [name for name in available_backends() if name != "json"]
+)
+def test_fast_backends_reject_non_finite_numbers(name, restore_backend):
+    json_decoding.use_backend(name)
+
+    # msgspec's DecodeError is not a ValueError
+    with pytest.raises(Exception):
+        json_decoding.loads(b"[NaN]")
@@ -0,0 +1,167 @@
+import json
+from typing import Any, Dict
+
+import pytest
+
+from missive import (
+    JSONMessage,
+    json_decoding,
+    json_scanning,
+    json_field_equals,
+    Processor,
+)
+from missive.json_scanning import MISSING, extract
+from missive.missive import _UNSET
+
+DOCUMENT = {
+    "event_type": "order_placed",
+    "nested": {"a": [1, {"b": "c"}], "d": None},
+    "tricky strings": ['"quoted" ] } [ {', "\\", "é"],
+    "escaped\nkey": True,
+    "number": -1.5e3,
+    "empty": {},
+}
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+@pytest.mark.parametrize(
+    "path",
+    [
+        ("event_type",),
+        ("nested",),
+        ("nested", "a", 1, "b"),
+        ("nested", "d"),
+        ("tricky strings", 0),
+        ("tricky strings", 2),
+        ("escaped\nkey",),
+        ("number",),
+        ("empty",),
+    ],
+)
+def test_matches_full_parse(path, indent):
+    data = json.dumps(DOCUMENT, indent=indent).encode("utf-8")
+
+    expected: Any = DOCUMENT
+    for element in path:
+        expected = expected[element]
+
+    assert extract(data, path) == expected
+    assert extract(memoryview(data), path) == expected
+
+
+@pytest.mark.parametrize(
+    "path",
+    [("missing",), ("nested", "a", 2), ("nested", "a", "b"), ("event_type", "x")],
+)
+def test_missing(path):
+    data = json.dumps(DOCUMENT).encode("utf-8")
+    assert extract(data, path) is MISSING
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b'{"event_type": "a", "nested": {"x": 1, "x": 2}, "event_type": "b"}',
+        b'{"event_type": "a", "nested": {"x": 1, "x": 2}, "event\\u005Ftype": "b"}',
+        b'{"event_type": "a", "nested": {"x": 1, "x": 2}, "\\u0065vent_type": "b"}',
+    ],
+)
+def test_duplicate_keys_take_the_last_value(data):
+    assert extract(data, ["event_type"]) == json.loads(data)["event_type"] == "b"
+    assert extract(data, ["nested", "x"]) == 2
+
+
+def test_key_elsewhere_is_not_a_duplicate():
+    data = b'{"event_type": "a", "nested": {"event_type": "b"}, "s": "event_type"}'
+    assert extract(data, ["event_type"]) == "a"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b'{"event_type": "a", "rest": {"broken": ',
+        b'{"event_type": "a", "rest": [1, 2]',
+        b'{"rest": [1, 2}], "event_type": "a"}',
+        b'{"rest": tru, "event_type": "a"}',
+        b'{"rest": "\\x", "event_type": "a"}',
+        b'{"rest": 1 "event_type": "a"}',
+        b'{"event_type": "a", "rest": 1, "event_type": b}',
+        b'{"event_type": "a"} {"event_type": "b"}',
+    ],
+)
+def test_malformed(data):
+    with pytest.raises(ValueError):
+        extract(data, ["event_type"])
+
+
+@pytest.mark.parametrize("padding", [0, json_scanning.SCAN_THRESHOLD])
+def test_scanned_and_parsed_messages_agree(padding):
+    data = b'{"event_type": "a", "padding": "%s", "event_type": "b"}' % (b"x" * padding)
+    assert JSONMessage(data).get_field("event_type") == "b"
+
+    truncated = data[:-1]
+    with pytest.raises(ValueError) as scanned:
+        JSONMessage(truncated).get_field("event_type")
+    with pytest.raises(ValueError) as parsed:
+        json_decoding.loads(truncated)
+    assert type(scanned.value) is type(parsed.value)
+
+
+def test_gives_up_when_too_expensive(always_scan):
+    data = json.dumps(
+        {"items": [[i] for i in range(json_scanning.SCAN_BUDGET)], "last": 1}
+    ).encode("utf-8")
+
+    with pytest.raises(json_scanning.TooExpensive):
+        extract(data, ["last"])
+
+    # The message API falls back to a full parse
+    message = JSONMessage(data)
+    assert message.get_field("last") == 1
+    assert message._json is not _UNSET
+
+
+@pytest.fixture
+def always_scan(monkeypatch):
+    monkeypatch.setattr(json_scanning, "SCAN_THRESHOLD", 0)
+
+
+def test_small_messages_are_parsed():
+    message = JSONMessage(b'{"event_type": "a"}')
+
+    assert message.get_field("event_type") == "a"
+    assert message._json == {"event_type": "a"}
+
+
+def test_get_field_does_not_parse(always_scan):
+    message = JSONMessage(b'{"event_type": "a", "b": [1, 2]}')
+
+    assert message.get_field("event_type") == "a"
+    assert message.get_field("missing", default=0) == 0
+    assert message.get_path("b", 1) == 2
+    assert message._json is _UNSET
+    assert message.get_json() == {"event_type": "a", "b": [1, 2]}
+
+
+def test_get_field_of_non_object():
+    assert JSONMessage(b"[1, 2]").get_field("a") is None
+    assert JSONMessage(b"[1, 2]").get_path(1) == 2
+
+
+def test_json_field_matcher_only_scans(always_scan):
+    processor: Processor[JSONMessage] = Processor()
+    dlq: Dict = {}
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(json_field_equals("event_type", "a"))
+    def handler(message, ctx):
+        ctx.ack()
+
+    message = JSONMessage(b'{"event_type": "b", "payload": "..."}')
+    with processor.test_client() as test_client:
+        test_client.send(message)
+
+    assert message in test_client.acked
+    assert dlq[message.message_id][1] == "no matching handlers"
+    assert message.get_field("event_type") == "b"
+    assert message._json is _UNSET
@@ -1,3 +1,6 @@
+import json
+from typing import Dict
+
 import pytest
 
 import missive as m
@@ -83,3 +86,88 @@ def test_one_matching_handler_among_multiple():
 
     assert flag
     assert blank_message in test_client.acked
+
+
+def json_message(o) -> m.JSONMessage:
+    return m.JSONMessage(json.dumps(o).encode("utf-8"))
+
+
+def test_indexed_matchers():
+    processor: m.Processor[m.JSONMessage] = m.Processor()
+
+    handled = []
+
+    @processor.handle_for(m.json_field_equals("event_type", "sign-in"))
+    def sign_ins(message, ctx):
+        handled.append("sign-in")
+        ctx.ack()
+
+    @processor.handle_for(m.json_field_equals("event_type", "sign-out"))
+    def sign_outs(message, ctx):
+        handled.append("sign-out")
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(json_message({"event_type": "sign-out"}))
+        test_client.send(json_message({"event_type": "sign-in"}))
+
+    assert handled == ["sign-out", "sign-in"]
+    assert list(processor.index.indexes) == [m.JSONField("event_type")]
+    assert processor.index.opaque == []
+
+
+def test_indexed_matchers_mixed_with_opaque():
+    dlq: Dict = {}
+    processor: m.Processor[m.JSONMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(m.json_field_equals("event_type", "sign-in"))
+    def sign_ins(message, ctx):
+        ctx.ack()
+
+    @processor.handle_for(lambda msg: msg.get_json().get("user") == "cal")
+    def cals_events(message, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        both = json_message({"event_type": "sign-in", "user": "cal"})
+        neither = json_message({"event_type": "sign-out", "user": "bob"})
+        unhashable = json_message({"event_type": ["sign-in"]})
+        for message in [both, neither, unhashable]:
+            test_client.send(message)
+
+    assert dlq == {
+        both.message_id: (both, "multiple matching handlers"),
+        neither.message_id: (neither, "no matching handlers"),
+        unhashable.message_id: (unhashable, "no matching handlers"),
+    }
+
+
+def test_extractor_errors_are_not_swallowed():
+    processor: m.Processor[m.JSONMessage] = m.Processor()
+
+    def first_tag(message):
+        # A bug: the body is a list, not an object
+        return message.get_json()["tags"][0]
+
+    @processor.handle_for(m.IndexedMatcher(first_tag, "a"))
+    def handler(message, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        with pytest.raises(TypeError):
+            test_client.send(m.JSONMessage(b'["a"]'))
+
+
+def test_duplicate_indexed_matchers():
+    processor: m.Processor[m.JSONMessage] = m.Processor()
+
+    @processor.handle_for(m.json_field_equals("event_type", "sign-in"))
+    def handler_1(message, ctx):
+        ctx.ack()
+
+    with pytest.raises(RuntimeError):
+
+        @processor.handle_for(m.json_field_equals("event_type", "sign-in"))
+        def handler_2(message, ctx):
+            ctx.ack()
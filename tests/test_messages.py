@@ -0,0 +1,80 @@
+import json
+import os
+import pickle
+
+from missive import JSONMessage, RawMessage, Processor, HandlingContext, TestAdapter
+from missive.messages import DictMessage
+
+
+def test_messages_have_no_dict():
+    for message in [
+        RawMessage(b"a"),
+        JSONMessage(b"{}"),
+        DictMessage(b"{}", decoder=json.loads),
+    ]:
+        assert not hasattr(message, "__dict__")
+
+
+def test_message_ids_are_unique():
+    ids = {RawMessage(b"a").message_id for _ in range(1000)}
+    assert len(ids) == 1000
+    assert all(len(message_id) == 16 for message_id in ids)
+
+
+def test_message_ids_are_stable():
+    message = RawMessage(b"a")
+    assert message.message_id == message.message_id
+
+
+def test_supplied_message_id():
+    message = JSONMessage(b"{}", message_id=b"delivery-1")
+    assert message.message_id == b"delivery-1"
+
+
+def test_pickling_keeps_message_id():
+    message = JSONMessage(b'{"a": 1}')
+    message.get_json()
+
+    loaded = pickle.loads(pickle.dumps(message))
+
+    assert loaded.message_id == message.message_id
+    assert loaded.get_json() == {"a": 1}
+
+
+def test_pickling_unparsed_json():
+    loaded = pickle.loads(pickle.dumps(JSONMessage(b'{"a": 1}')))
+    assert loaded.get_json() == {"a": 1}
+
+
+def test_unpickling_dict_state():
+    # Messages pickled before they had __slots__ have their attributes as a
+    # dict, with the message id in "message_id"
+    message = JSONMessage.__new__(JSONMessage)
+    message.__setstate__({"raw_data": b"{}", "message_id": b"old", "_json": None})
+
+    assert message.message_id == b"old"
+    assert message.get_json() == {}
+
+
+def test_forked_children_get_new_ids():
+    parent_id = RawMessage(b"a").message_id
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, RawMessage(b"a").message_id)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    child_id = os.read(read_fd, 16)
+    os.close(read_fd)
+    os.close(write_fd)
+
+    assert child_id[:8] != parent_id[:8]
+
+
+def test_handling_context_state_is_lazy():
+    processor: Processor[RawMessage] = Processor()
+    with processor.context(RawMessage, TestAdapter(processor)) as ctx:
+        handling_ctx = HandlingContext(RawMessage(b"a"), ctx)
+        assert handling_ctx._state is None
+        handling_ctx.state.foo = 1
+        assert handling_ctx.state.foo == 1
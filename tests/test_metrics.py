@@ -0,0 +1,157 @@
+import urllib.request
+
+import pytest
+
+import missive
+from missive import json_field_equals
+from missive.adapters.wsgi import WSGIAdapter
+from missive.metrics import PrometheusSink, start_http_server
+
+from .wsgi_client import Client
+
+
+@pytest.fixture
+def sink():
+    return PrometheusSink()
+
+
+def sample(sink, line_prefix):
+    (line,) = [
+        line for line in sink.render().splitlines() if line.startswith(line_prefix)
+    ]
+    return float(line.rsplit(" ", 1)[1])
+
+
+def test_counters_and_histograms(sink):
+    processor: missive.Processor[missive.JSONMessage] = missive.Processor()
+    processor.set_dlq({})
+    processor.set_metrics(sink)
+
+    @processor.handle_for(json_field_equals("type", "a"))
+    def handle_a(message, ctx):
+        if message.get_json()["ok"]:
+            ctx.ack()
+        else:
+            ctx.nack()
+
+    @processor.handle_for(json_field_equals("type", "b"))
+    def handle_b(message, ctx):
+        raise RuntimeError("boom")
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.JSONMessage(b'{"type": "a", "ok": true}'))
+        test_client.send(missive.JSONMessage(b'{"type": "a", "ok": false}'))
+        test_client.send(missive.JSONMessage(b'{"type": "b"}'))
+        test_client.send(missive.JSONMessage(b'{"type": "c"}'))
+
+    handler_a = (
+        'handler="tests.test_metrics.test_counters_and_histograms.<locals>.handle_a"'
+    )
+    assert sample(sink, "missive_messages_matched_total{%s}" % handler_a) == 2
+    assert sample(sink, "missive_messages_unmatched_total") == 1
+    assert sample(sink, "missive_messages_multiple_matches_total") == 0
+    assert sample(sink, "missive_messages_dead_lettered_total") == 2
+    assert sample(sink, "missive_messages_acked_total") == 3
+    assert sample(sink, "missive_messages_nacked_total") == 1
+    assert sample(sink, "missive_matcher_seconds_count") == 4
+    assert sample(sink, "missive_handler_seconds_count{%s}" % handler_a) == 2
+    assert sample(sink, "missive_latency_seconds_count{%s}" % handler_a) == 2
+    assert sample(sink, 'missive_handler_seconds_bucket{%s,le="+Inf"}' % handler_a) == 2
+
+
+def test_batch_handlers(sink):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+    processor.set_metrics(sink)
+
+    @processor.handle_batch_for(lambda m: True, max_size=2, max_wait=60)
+    def handle_batch(messages, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        for _ in range(3):
+            test_client.send(missive.RawMessage(b"x"))
+
+    assert sample(sink, "missive_messages_matched_total") == 3
+    # One per batch
+    assert sample(sink, "missive_handler_seconds_count") == 2
+    # One per message
+    assert sample(sink, "missive_latency_seconds_count") == 3
+    assert sample(sink, "missive_messages_acked_total") == 3
+
+
+def test_handlers_are_bound_in_advance(sink):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    @processor.handle_for(lambda m: True)
+    def registered_before(message, ctx):
+        ctx.ack()
+
+    processor.set_metrics(sink)
+
+    @processor.handle_for(lambda m: False)
+    def registered_after(message, ctx):
+        ctx.ack()
+
+    rendered = sink.render()
+    assert "registered_before" in rendered
+    assert "registered_after" in rendered
+
+
+def test_histogram_buckets(sink):
+    histogram = sink.histogram("test_seconds", "A test", {}, buckets=[0.1, 1])
+    for value in [0.05, 0.1, 0.5, 5]:
+        histogram.observe(value)
+
+    assert sink.render().splitlines() == [
+        "# HELP test_seconds A test",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_count 4",
+        "test_seconds_sum 5.65",
+    ]
+
+
+def test_label_escaping(sink):
+    sink.counter("test_total", "A test", {"name": 'a "b"\n'}).inc(2)
+    assert 'test_total{name="a \\"b\\"\\n"} 2' in sink.render()
+
+
+def test_kind_mismatch(sink):
+    sink.counter("test", "A test", {})
+    with pytest.raises(ValueError):
+        sink.histogram("test", "A test", {})
+
+
+def test_http_server(sink):
+    sink.counter("test_total", "A test", {}).inc()
+    server = start_http_server(sink, 0, addr="127.0.0.1")
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_port
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode("utf-8")
+        assert response.headers["Content-Type"].startswith("text/plain")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert "test_total 1" in body
+
+
+def test_wsgi_endpoint(sink):
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    @processor.handle_for(lambda m: True)
+    def handler(message, ctx):
+        ctx.ack()
+
+    adapter = WSGIAdapter(missive.RawMessage, processor)
+    with Client(adapter.app) as test_client:
+        assert test_client.get("/metrics").status_code == 404
+
+        processor.set_metrics(sink)
+        test_client.post("/", data=b"hello")
+        response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert b"missive_messages_acked_total 1" in response.data
@@ -0,0 +1,132 @@
+import pytest
+
+import missive
+
+from .matchers import always
+
+
+@pytest.fixture
+def processor():
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+    processor.set_publisher(missive.TestPublisher())
+    return processor
+
+
+def test_published_before_ack(processor):
+    seen_at_ack = []
+
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("a", b"1")
+        ctx.publish("b", b"2")
+        assert processor.publisher.published == []
+        ctx.ack()
+        seen_at_ack.extend(processor.publisher.published)
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"in"))
+
+    assert seen_at_ack == [("a", b"1"), ("b", b"2")]
+
+
+def test_published_after_ack(processor):
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("a", b"1", after_ack=True)
+        assert processor.publisher.pending == []
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"in"))
+
+    assert processor.publisher.published == [("a", b"1")]
+
+
+def test_not_published_after_nack(processor):
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("a", b"1", after_ack=True)
+        ctx.nack()
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"in"))
+
+    assert processor.publisher.published == []
+
+
+def test_not_published_when_dead_lettered(processor):
+    processor.set_dlq({})
+
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("a", b"1", after_ack=True)
+        raise RuntimeError("oh no")
+
+    with processor.test_client() as test_client:
+        message = missive.RawMessage(b"in")
+        test_client.send(message)
+
+    assert test_client.acked == [message]
+    assert processor.publisher.published == []
+
+
+def test_failed_handlers_publish_nothing(processor):
+    processor.set_dlq({})
+
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("out", message.raw_data)
+        if message.raw_data == b"bad":
+            raise RuntimeError("oh no")
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"bad"))
+        test_client.send(missive.RawMessage(b"good"))
+
+    assert processor.publisher.published == [("out", b"good")]
+
+
+def test_failed_attempts_publish_nothing(processor):
+    attempts = 0
+
+    @processor.handle_for(always, retry=missive.RetryPolicy(base_delay=0, jitter=0))
+    def flaky(message, ctx):
+        nonlocal attempts
+        ctx.publish("out", message.raw_data)
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError("downstream unavailable")
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"1"))
+
+    assert attempts == 2
+    assert processor.publisher.published == [("out", b"1")]
+
+
+def test_batch_publish(processor):
+    @processor.handle_batch_for(always, max_size=2, max_wait=60)
+    def fan_out(messages, ctx):
+        for message in messages:
+            ctx.publish("out", message.raw_data)
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(missive.RawMessage(b"1"))
+        test_client.send(missive.RawMessage(b"2"))
+
+    assert processor.publisher.published == [("out", b"1"), ("out", b"2")]
+
+
+def test_no_publisher():
+    processor: missive.Processor[missive.RawMessage] = missive.Processor()
+
+    @processor.handle_for(always)
+    def fan_out(message, ctx):
+        ctx.publish("a", b"1", after_ack=True)
+
+    with processor.test_client() as test_client:
+        with pytest.raises(RuntimeError):
+            test_client.send(missive.RawMessage(b"in"))
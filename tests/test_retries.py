@@ -0,0 +1,157 @@
+from typing import Dict
+import time
+
+import missive as m
+from missive.adapters.wsgi import WSGIAdapter
+
+from .matchers import always
+from .wsgi_client import Client
+
+
+def no_jitter(**kwargs):
+    return m.RetryPolicy(jitter=0, **kwargs)
+
+
+def run_retries(test_client):
+    while True:
+        deadline = test_client.ctx.next_deadline()
+        if deadline is None:
+            return
+        time.sleep(deadline)
+        test_client.ctx.tick()
+
+
+def test_retried_until_success():
+    attempts = 0
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, retry=no_jitter(base_delay=0.01))
+    def flaky(message, ctx):
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise RuntimeError("downstream unavailable")
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        message = m.RawMessage(b"")
+        test_client.send(message)
+        assert test_client.acked == []
+        run_retries(test_client)
+
+    assert attempts == 3
+    assert test_client.acked == [message]
+    assert test_client.nacked == []
+
+
+def test_exhausted_retries_go_to_dlq():
+    dlq: Dict = {}
+    attempts = 0
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(always, retry=no_jitter(max_attempts=3, base_delay=0.01))
+    def broken(message, ctx):
+        nonlocal attempts
+        attempts += 1
+        raise RuntimeError("still broken")
+
+    with processor.test_client() as test_client:
+        message = m.RawMessage(b"")
+        test_client.send(message)
+        run_retries(test_client)
+
+    assert attempts == 3
+    assert test_client.acked == [message]
+    assert list(dlq.values()) == [(message, "still broken")]
+
+
+def test_other_exceptions_are_not_retried():
+    dlq: Dict = {}
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(always, retry=no_jitter(exceptions=(ConnectionError,)))
+    def broken(message, ctx):
+        raise ValueError("bad message")
+
+    with processor.test_client() as test_client:
+        test_client.send(m.RawMessage(b""))
+        assert test_client.ctx is not None
+        assert test_client.ctx.next_deadline() is None
+
+    assert len(dlq) == 1
+
+
+def test_other_messages_are_processed_while_waiting():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, retry=no_jitter(base_delay=60))
+    def handler(message, ctx):
+        if message.raw_data == b"fail":
+            raise RuntimeError("fail")
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        failing = m.RawMessage(b"fail")
+        test_client.send(failing)
+        test_client.send(m.RawMessage(b"ok"))
+        assert [msg.raw_data for msg in test_client.acked] == [b"ok"]
+        assert test_client.ctx is not None
+        deadline = test_client.ctx.next_deadline()
+        assert deadline is not None and 59 < deadline <= 60
+
+    # Still waiting when processing stopped
+    assert test_client.nacked == [failing]
+
+
+def test_backoff():
+    policy = m.RetryPolicy(base_delay=1, max_delay=5, multiplier=2, jitter=0)
+    assert [policy.delay(retry) for retry in range(1, 6)] == [1, 2, 4, 5, 5]
+
+    jittered = m.RetryPolicy(base_delay=1, jitter=0.5)
+    for _ in range(100):
+        assert 0.5 <= jittered.delay(1) <= 1
+
+
+def test_wsgi_waits_for_retries():
+    attempts = 0
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, retry=no_jitter(base_delay=0.01))
+    def flaky(message, ctx):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise RuntimeError("downstream unavailable")
+        ctx.ack()
+
+    adapter = WSGIAdapter(m.RawMessage, processor)
+    try:
+        response = Client(adapter.app).post("/", data=b"hello")
+    finally:
+        adapter.close()
+
+    assert response.json == {"result": "ack"}
+    assert attempts == 2
+
+
+def test_held_retries_are_limited():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, retry=no_jitter(base_delay=60))
+    def broken(message, ctx):
+        raise ConnectionError("downstream unavailable")
+
+    adapter = m.TestAdapter(processor)
+    messages = [m.RawMessage(b"%d" % n) for n in range(5)]
+    with processor.context(m.RawMessage, adapter) as ctx:
+        # eg: RabbitMQ with a prefetch count of 3
+        ctx.max_held_retries = 2
+        for message in messages:
+            ctx.handle(message)
+        assert adapter.nacked == messages[2:]
+        assert ctx._attempts.keys() == {message.message_id for message in messages[:2]}
+
+    # The held messages are nacked when processing stops
+    assert adapter.nacked == messages[2:] + messages[:2]
@@ -22,3 +22,7 @@ def test_deleting():
 
     with pytest.raises(AttributeError):
         state.foo + 1
+
+
+def test_no_dict():
+    assert not hasattr(State(), "__dict__")
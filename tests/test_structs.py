@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import json
+
+import pytest
+
+from missive import InvalidMessage, Processor
+from missive.messages import StructMessage, struct_field_equals
+from missive import structs
+
+
+@dataclass
+class Item:
+    sku: str
+    quantity: int
+
+
+@dataclass
+class Order:
+    event_type: str
+    order_id: int
+    items: List[Item]
+    note: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+
+
+class OrderMessage(StructMessage[Order]):
+    schema = Order
+
+
+def order_message(**overrides):
+    body = {
+        "event_type": "order_placed",
+        "order_id": 1,
+        "items": [{"sku": "a", "quantity": 2}],
+    }
+    body.update(overrides)
+    return OrderMessage(json.dumps(body).encode("utf-8"))
+
+
+def test_typed_access():
+    order = order_message().get_struct()
+
+    assert order == Order("order_placed", 1, [Item("a", 2)])
+    assert order.items[0].quantity == 2
+
+
+@pytest.mark.parametrize(
+    "overrides, reason",
+    [
+        ({"order_id": "1"}, "Expected `int`, got `str` - at `$.order_id`"),
+        (
+            {"items": [{"sku": "a", "quantity": 1.5}]},
+            "Expected `int`, got `float` - at `$.items[0].quantity`",
+        ),
+        ({"items": [{"sku": "a"}]}, "Object missing required field `quantity`"),
+        ({"note": 1}, "Expected `str | null`, got `int` - at `$.note`"),
+    ],
+)
+def test_invalid(overrides, reason):
+    if structs.msgspec is not None:
+        pytest.skip("reasons are worded by msgspec")
+    with pytest.raises(InvalidMessage) as e:
+        order_message(**overrides).get_struct()
+
+    assert reason in str(e.value)
+
+
+def test_invalid_json():
+    with pytest.raises(InvalidMessage):
+        OrderMessage(b"{").get_struct()
+
+
+def test_matching_on_fields():
+    processor: Processor[OrderMessage] = Processor()
+    handled = []
+
+    @processor.handle_for(struct_field_equals("event_type", "order_placed"))
+    def placed(message, ctx):
+        handled.append(message.get_struct().order_id)
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(order_message(order_id=7))
+
+    assert handled == [7]
+
+
+def test_invalid_messages_go_to_dlq():
+    processor: Processor[OrderMessage] = Processor()
+    dlq: Dict = {}
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(struct_field_equals("event_type", "order_placed"))
+    def placed(message, ctx):
+        ctx.ack()
+
+    message = order_message(order_id="seven")
+    with processor.test_client() as test_client:
+        test_client.send(message)
+
+    (reason,) = [reason for _, reason in dlq.values()]
+    assert reason.startswith("invalid message: ")
+    assert "$.order_id" in reason
+    assert test_client.acked == [message]
+
+
+def test_invalid_messages_without_dlq():
+    processor: Processor[OrderMessage] = Processor()
+
+    @processor.handle_for(struct_field_equals("event_type", "order_placed"))
+    def placed(message, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        with pytest.raises(InvalidMessage):
+            test_client.send(order_message(order_id="seven"))
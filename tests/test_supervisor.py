@@ -0,0 +1,109 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from missive.shutdown_handler import ShutdownHandler
+from missive.supervisor import Supervisor
+
+
+@pytest.fixture(scope="function")
+def reset_signals():
+    relevant_signals = {signal.SIGTERM, signal.SIGINT}
+    old_handlers = {
+        relevant_signal: signal.getsignal(relevant_signal)
+        for relevant_signal in relevant_signals
+    }
+    yield
+    for relevant_signal in relevant_signals:
+        signal.signal(relevant_signal, old_handlers[relevant_signal])
+
+
+class FileWritingAdapter:
+    """Stands in for a real adapter: records which worker ran it."""
+
+    def __init__(self, directory, index, fail_first_time=False):
+        self.path = os.path.join(directory, str(index))
+        self.fail_first_time = fail_first_time
+
+    def run(self):
+        if self.fail_first_time and not os.path.exists(self.path):
+            open(self.path, "w").close()
+            raise RuntimeError("crashing on first run")
+        with open(self.path, "a") as f:
+            f.write("ran\n")
+
+
+class DrainingAdapter:
+    def __init__(self, directory, index):
+        self.path = os.path.join(directory, str(index))
+        self.shutdown_handler = ShutdownHandler()
+
+    def run(self):
+        open(self.path + ".started", "w").close()
+        self.shutdown_handler.wait_for_flag()
+        open(self.path + ".drained", "w").close()
+
+
+def test_workers_run(tmpdir, reset_signals):
+    supervisor = Supervisor(lambda n: FileWritingAdapter(str(tmpdir), n), workers=3)
+    supervisor.run()
+
+    assert sorted(os.listdir(str(tmpdir))) == ["0", "1", "2"]
+
+
+def test_failed_workers_restarted(tmpdir, reset_signals):
+    supervisor = Supervisor(
+        lambda n: FileWritingAdapter(str(tmpdir), n, fail_first_time=True),
+        workers=2,
+        restart_delay=0,
+    )
+    supervisor.run()
+
+    for index in ["0", "1"]:
+        with open(str(tmpdir.join(index))) as f:
+            assert f.read() == "ran\n"
+
+
+def test_signals_fan_out(tmpdir, reset_signals):
+    supervisor = Supervisor(lambda n: DrainingAdapter(str(tmpdir), n), workers=2)
+
+    def send_sigterm_once_started():
+        while len(os.listdir(str(tmpdir))) < 2:
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=send_sigterm_once_started).start()
+    supervisor.run()
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "0.drained",
+        "0.started",
+        "1.drained",
+        "1.started",
+    ]
+
+
+class SlowAdapter:
+    def __init__(self, directory, index):
+        self.path = os.path.join(directory, str(index))
+
+    def run(self):
+        time.sleep(0.2)
+        open(self.path, "w").close()
+
+
+def test_other_children_are_ignored(tmpdir, reset_signals):
+    other_pid = os.fork()
+    if other_pid == 0:
+        os._exit(0)
+
+    supervisor = Supervisor(lambda n: SlowAdapter(str(tmpdir), n), workers=2)
+    supervisor.run()
+
+    assert sorted(os.listdir(str(tmpdir))) == ["0", "1"]
+    # Reaped by the supervisor
+    with pytest.raises(ChildProcessError):
+        os.waitpid(other_pid, os.WNOHANG)
@@ -0,0 +1,164 @@
+from typing import Dict
+import logging
+import subprocess
+import sys
+import time
+
+import pytest
+
+import missive as m
+from missive.watchdog import HandlerTimeout, Watchdog
+
+from .matchers import always
+
+
+def spin(seconds):
+    # A busy loop, as the exception can't interrupt a sleep
+    give_up = time.monotonic() + seconds
+    while time.monotonic() < give_up:
+        pass
+
+
+def test_timeout_to_dlq(caplog):
+    dlq: Dict = {}
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(always, timeout=0.05)
+    def wedged(message, ctx):
+        spin(5)
+        ctx.ack()
+
+    started = time.monotonic()
+    with caplog.at_level(logging.ERROR, logger="missive.watchdog"):
+        with processor.test_client() as test_client:
+            message = m.RawMessage(b"")
+            test_client.send(message)
+    assert time.monotonic() - started < 5
+
+    assert test_client.acked == [message]
+    assert list(dlq.values()) == [(message, "timeout")]
+    (record,) = caplog.records
+    assert message.message_id.hex() in record.getMessage()
+    assert "in spin" in record.getMessage()
+
+
+def test_timeout_without_dlq_nacks():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, timeout=0.05)
+    def wedged(message, ctx):
+        spin(5)
+
+    with processor.test_client() as test_client:
+        message = m.RawMessage(b"")
+        test_client.send(message)
+
+    assert test_client.nacked == [message]
+
+
+def test_not_swallowed_by_handlers():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, timeout=0.05)
+    def wedged(message, ctx):
+        try:
+            spin(5)
+        except Exception:
+            ctx.ack()
+
+    with processor.test_client() as test_client:
+        test_client.send(m.RawMessage(b""))
+
+    assert len(test_client.acked) == 0
+    assert len(test_client.nacked) == 1
+
+
+def test_timeout_after_settling():
+    dlq: Dict = {}
+    processor: m.Processor[m.RawMessage] = m.Processor()
+    processor.set_dlq(dlq)
+
+    @processor.handle_for(always, timeout=0.05)
+    def slow_after_ack(message, ctx):
+        ctx.ack()
+        spin(5)
+
+    with processor.test_client() as test_client:
+        message = m.RawMessage(b"")
+        test_client.send(message)
+
+    assert test_client.acked == [message]
+    assert dlq == {}
+
+
+def test_fast_handlers_are_unaffected():
+    processor: m.Processor[m.RawMessage] = m.Processor()
+
+    @processor.handle_for(always, timeout=0.05)
+    def fast(message, ctx):
+        ctx.ack()
+
+    with processor.test_client() as test_client:
+        for _ in range(100):
+            test_client.send(m.RawMessage(b""))
+        # Would have fired by now if any had been left behind
+        time.sleep(0.1)
+        test_client.send(m.RawMessage(b""))
+
+    assert len(test_client.acked) == 101
+
+
+def test_watchdog_cancel_clears_pending_exception():
+    watchdog = Watchdog()
+    try:
+        watch = watchdog.watch(0, "test")
+        with pytest.raises(HandlerTimeout):
+            spin(5)
+        watch.cancel()
+
+        watch = watchdog.watch(0, "test")
+        # Cancelled before the exception could be raised, or raised here
+        try:
+            while not watch.fired:
+                time.sleep(0.001)
+            watch.cancel()
+        except HandlerTimeout:
+            pass
+        spin(0.05)
+    finally:
+        watchdog.stop()
+
+
+# Monkey-patching can't be undone, so this runs in its own process
+GEVENT_SCRIPT = """
+from gevent import monkey
+
+monkey.patch_all()
+
+import time
+
+import missive as m
+
+processor = m.Processor()
+dlq = {}
+processor.set_dlq(dlq)
+
+
+@processor.handle_for(lambda message: True, timeout=0.05)
+def waiting(message, ctx):
+    time.sleep(5)
+    ctx.ack()
+
+
+started = time.monotonic()
+with processor.test_client() as test_client:
+    test_client.send(m.RawMessage(b""))
+assert time.monotonic() - started < 5
+assert [reason for _, reason in dlq.values()] == ["timeout"]
+"""
+
+
+def test_timeout_under_gevent():
+    pytest.importorskip("gevent")
+    subprocess.run([sys.executable, "-c", GEVENT_SCRIPT], check=True, timeout=30)
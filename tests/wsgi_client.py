@@ -0,0 +1,55 @@
+"""A minimal client for calling WSGI applications in tests, without a web
+framework."""
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+import json
+
+
+class Response:
+    def __init__(self, status, headers, data):
+        self.status_code = int(status.split(" ", 1)[0])
+        self.headers = dict(headers)
+        self.data = data
+
+    @property
+    def json(self):
+        return json.loads(self.data)
+
+
+class Client:
+    def __init__(self, app):
+        self.app = app
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def request(self, method, url, data=b"", content_type=None):
+        path, _, query = url.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "CONTENT_LENGTH": str(len(data)),
+            "wsgi.input": BytesIO(data),
+        }
+        if content_type is not None:
+            environ["CONTENT_TYPE"] = content_type
+        setup_testing_defaults(environ)
+
+        started = []
+
+        def start_response(status, headers):
+            started.append((status, headers))
+
+        body = b"".join(self.app(environ, start_response))
+        ((status, headers),) = started
+        return Response(status, headers, body)
+
+    def get(self, url):
+        return self.request("GET", url)
+
+    def post(self, url, data=b"", content_type=None):
+        return self.request("POST", url, data, content_type)